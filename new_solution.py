@@ -1,5 +1,30 @@
 import re
+import os
+import sys
+import csv
+import http
+import json
+import mmap
+import math
+import time
+import shlex
+import heapq
+import bisect
+import pickle
+import string
+import asyncio
+import sqlite3
+import threading
+import argparse
 import datetime
+import tempfile
+import itertools
+import contextlib
+import tracemalloc
+import urllib.parse
+import concurrent.futures
+from array import array
+from enum import Enum
 
 class Menu:
     def __init__(self, title, options= []):
@@ -68,35 +93,377 @@ class Table:
                     column_widths[i] = element_length
                 i += 1
 
-        # build the header row
-        header_row = "|"
+        self._print_header(column_widths)
+
+        # print the rows
+        lines = []
+        for item in self.items:
+            lines.append(self._format_row(item, column_widths))
+        print('\n'.join(lines))
+
+        self._print_line(column_widths) # table bottom line
+
+    # protected methods
+
+    # builds a row such as "| V001 | Car  | 10 |" with a single join
+    def _format_row(self, item, column_widths):
+        cells = []
         i = 0
-        while i < len(self.headers):
-            header_row += " " + self.headers[i].ljust(column_widths[i]) + " |"
+        while i < len(item):
+            cells.append(str(item[i]).ljust(column_widths[i]))
             i += 1
 
-        print("-" * (sum(column_widths) + len(self.headers) * 3 + 1)) # header top line
-        print(header_row)
-        print("-" * (sum(column_widths) + len(self.headers) * 3 + 1)) # header bottom line
+        return '| ' + ' | '.join(cells) + ' |'
 
-        # print the rows
-        for item in self.items:
-            row = "|"
+    def _print_header(self, column_widths):
+        self._print_line(column_widths) # header top line
+        print(self._format_row(self.headers, column_widths))
+        self._print_line(column_widths) # header bottom line
+
+    def _print_line(self, column_widths):
+        print("-" * (sum(column_widths) + len(column_widths) * 3 + 1))
+
+# A table that shows one page of rows at a time.
+# items can be any iterable (e.g. a generator), rows are only read when their page is shown.
+# Column widths come from column_widths if given, otherwise from the headers and the first page,
+# longer values on later pages are shortened to fit.
+class PagedTable(Table):
+    def __init__(self, headers, items, page_size=20, column_widths=None, empty_message='No records to display.'):
+        super().__init__(headers, items)
+        self.page_size = page_size
+        self.column_widths = column_widths
+        self.empty_message = empty_message
+
+        self._rows = iter(items)
+        self._pages = [] # pages read so far, so going back doesn't need the rows again
+        self._is_exhausted = False
+
+    # displays the requested page (starting at 0), returns False if there is no such page
+    def display_page(self, page_number):
+        page = self.__get_page(page_number)
+
+        if page is None:
+            return False
+
+        if self.column_widths is None:
+            self.column_widths = self.__measure(page)
+
+        self._print_header(self.column_widths)
+
+        lines = []
+        for item in page:
+            lines.append(self._format_row(self.__fit(item), self.column_widths))
+        print('\n'.join(lines))
+
+        self._print_line(self.column_widths)
+        return True
+
+    # shows the pages and lets the user move between them until they enter 'exit'
+    def browse(self):
+        page_number = 0
+
+        if not self.display_page(page_number):
+            print(self.empty_message)
+        else:
+            print('Page', page_number + 1)
+
+        print()
+        while True:
+            prompt = input("Enter 'n' for next page, 'p' for previous page or 'exit' to go back: ")
+
+            if prompt == 'exit':
+                break
+            elif prompt == 'n':
+                if self.display_page(page_number + 1):
+                    page_number += 1
+                    print('Page', page_number + 1)
+                else:
+                    print('This is the last page.')
+            elif prompt == 'p':
+                if page_number > 0:
+                    page_number -= 1
+                    self.display_page(page_number)
+                    print('Page', page_number + 1)
+                else:
+                    print('This is the first page.')
+
+            print()
+
+    # private methods
+
+    # reads pages from the items until the requested one is available
+    def __get_page(self, page_number):
+        while len(self._pages) <= page_number and not self._is_exhausted:
+            # https://docs.python.org/3/library/itertools.html#itertools.islice
+            page = list(itertools.islice(self._rows, self.page_size))
+
+            if page:
+                self._pages.append(page)
+
+            if len(page) < self.page_size:
+                self._is_exhausted = True
+
+        if page_number < len(self._pages):
+            return self._pages[page_number]
+        else:
+            return None
+
+    def __measure(self, page):
+        column_widths = []
+        for header in self.headers:
+            column_widths.append(len(header))
+
+        for item in page:
             i = 0
             while i < len(item):
-                row += " " + str(item[i]).ljust(column_widths[i]) + " |"
+                column_widths[i] = max(column_widths[i], len(str(item[i])))
                 i += 1
-            print(row)
 
-        print("-" * (sum(column_widths) + len(self.headers) * 3 + 1)) # table bottom line
+        return column_widths
+
+    # shortens values wider than their column
+    def __fit(self, item):
+        cells = []
+        i = 0
+        while i < len(item):
+            cell = str(item[i])
+            if len(cell) > self.column_widths[i]:
+                cell = cell[:max(self.column_widths[i] - 3, 0)] + '...'
+            cells.append(cell)
+            i += 1
+
+        return cells
+
+# a secondary index mapping a key (e.g. a customer id) to the saved instances having that key
+# each bucket is a dict used as an ordered set, so add/remove are O(1)
+# and get() returns instances in the order they were indexed
+class Index:
+    def __init__(self):
+        self._buckets = {}
+
+    def add(self, key, instance):
+        bucket = self._buckets.get(key)
+
+        if bucket is None:
+            bucket = {}
+            self._buckets[key] = bucket
+
+        bucket[instance] = None
+
+    def remove(self, key, instance):
+        bucket = self._buckets.get(key)
+
+        if bucket is not None:
+            bucket.pop(instance, None)
+
+            # drop empty buckets so keys() only returns keys in use
+            if not bucket:
+                del self._buckets[key]
+
+    def move(self, old_key, new_key, instance):
+        self.remove(old_key, instance)
+        self.add(new_key, instance)
+
+    def get(self, key):
+        return list(self._buckets.get(key, ()))
+
+    def count(self, key):
+        return len(self._buckets.get(key, ()))
+
+    def keys(self):
+        return list(self._buckets)
+
+# Hands out increasing ids (V001, V002, ...) for one model.
+# The highest number handed out is kept in the storage backend, so an id is
+# never handed out twice, even after the newest instance has been removed.
+# Numbers that are reserved but never saved just leave gaps.
+# reserve() hands out a whole block of numbers with a single storage write,
+# e.g. for bulk imports.
+class IdSequence:
+    def __init__(self, prefix, width=3):
+        self.prefix = prefix
+        self.width = width # ids are zero padded to at least this many digits
+
+        self._last = 0 # highest number handed out or used by a saved id
+        self._storage = None # storage backend _last was loaded from
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    # returns the next unused id, e.g. 'V004'
+    def next_id(self, model):
+        return self.format(self.reserve(model, 1)[0])
+
+    # reserves count numbers and returns them as a range, format() turns them into ids
+    def reserve(self, model, count):
+        with self._lock:
+            self.__load(model)
+
+            start = self._last + 1
+            self._last += count
+            self.__persist(model)
+
+            return range(start, self._last + 1)
+
+    def format(self, number):
+        return self.prefix + str(number).zfill(self.width)
+
+    # called when an instance is saved, so ids entered by hand are never handed out again
+    def observe(self, object_id):
+        number = self.__number(object_id)
+
+        with self._lock:
+            if number > self._last:
+                self._last = number
+
+    # called when an instance is removed or renamed, before its row is: the id
+    # may only be known from that row (see SQLiteStorage.get_id_sequence()),
+    # so the highest number is always written to the storage backend
+    def retire(self, model, object_id):
+        self.observe(object_id)
+
+        with self._lock:
+            self.__load(model)
+            self.__persist(model)
+
+    # private methods
+
+    # reads the highest number from the storage backend and the ids in memory
+    # the first time the sequence is used (and again if the backend changes)
+    def __load(self, model):
+        if self._loaded and self._storage is Model._storage:
+            return
+
+        last = 0
+        if Model._storage is not None:
+            last = Model._storage.get_id_sequence(model)
+
+        for object_id in list(model._index):
+            last = max(last, self.__number(object_id))
+
+        self._last = max(self._last, last)
+        self._storage = Model._storage
+        self._loaded = True
+
+    def __persist(self, model):
+        if Model._storage is not None:
+            Model._storage.set_id_sequence(model, self._last)
+
+    def __number(self, object_id):
+        return int(object_id[len(self.prefix):])
+
+# A readers-writer lock: any number of threads can read at the same time,
+# but a writer has the lock to itself. Waiting writers go first, so a steady
+# stream of readers can't starve them.
+# Both sides are re-entrant, and the writing thread may also read, so locked
+# methods can call each other (e.g. save() -> validate() -> find_by_id()).
+# Taking the write lock while only holding the read lock raises RuntimeError
+# instead of deadlocking.
+# Use as: with lock.reading: ... / with lock.writing: ...
+# https://docs.python.org/3/library/threading.html#condition-objects
+class ReadWriteLock:
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = {} # thread id -> number of nested reads
+        self._writer = None # thread id of the writer
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self.reading = LockGuard(self.acquire_read, self.release_read)
+        self.writing = LockGuard(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        me = threading.get_ident()
+
+        with self._condition:
+            if self._writer != me and me not in self._readers:
+                while self._writer is not None or self._writers_waiting:
+                    self._condition.wait()
+
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+
+        with self._condition:
+            self._readers[me] -= 1
+
+            if self._readers[me] == 0:
+                del self._readers[me]
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+
+        with self._condition:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+
+            if me in self._readers:
+                raise RuntimeError('Cannot take the write lock while holding the read lock.')
+
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._write_depth -= 1
+
+            if self._write_depth == 0:
+                self._writer = None
+                self._condition.notify_all()
+
+# context manager used for ReadWriteLock.reading and ReadWriteLock.writing
+class LockGuard:
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *exception):
+        self._release()
+
+# raised by Model.save_many() when one or more instances in a batch are invalid
+# errors is a list of [row number, id, message], one entry per rejected row
+class BulkSaveError(ValueError):
+    def __init__(self, errors):
+        super().__init__(str(len(errors)) + ' row(s) failed validation, nothing was saved.')
+        self.errors = errors
 
 class Model:
     # https://pynative.com/python-class-variables/
     # subclasses should override the following class variables
     # to maintain their own state
-    _instances = [] # protected list to store all instances (vehicles, customers, shipments, etc)
-    _id_regex = '' # regex for id validation
+    # protected dict used as an ordered set of all saved instances (vehicles, customers, shipments, etc)
+    # https://docs.python.org/3/library/stdtypes.html#dict - dicts preserve insertion order
+    _instances = {}
+    _index = {} # protected dict mapping each saved id to its instance (identity map)
+    _id_regex = re.compile('') # compiled regex for id validation
     _id_pattern = '' # the pattern of a valid id
+    _table = '' # name of the storage table
+    _columns = [] # attributes (without the leading underscore) stored after the id
+    _indexed_columns = [] # column groups (or SQL expressions) the storage backend should index
+    _sql_functions = [] # names of static methods the storage backend can call in SQL, e.g. in indexes
+    _numeric_columns = [] # columns compared and sorted as numbers, e.g. '10' and 10.0 are equal
+    _independent_columns = [] # columns whose setters only check the value itself, see Importer workers
+    _id_sequence = IdSequence('') # hands out new ids, see next_id()
+
+    # per-model lock, save/remove/set_id and index updates hold the write lock
+    _lock = ReadWriteLock()
+
+    # shared by all models, set with Model.use_storage()
+    _storage = None
+
+    # https://docs.python.org/3/reference/datamodel.html#slots
+    # instances only store the declared attributes (no per-instance __dict__),
+    # subclasses add their own attributes to __slots__
+    __slots__ = ('_object_id',)
 
     def __init__(self, object_id=None):
         self._object_id = object_id
@@ -105,26 +472,88 @@ class Model:
         return self._object_id
 
     def set_id(self, value):
-        if not self.__is_unique_id(value):
-            raise ValueError("\nDuplicate ID. Please enter a unique ID.")
+        with self._lock.writing:
+            if not self.__is_unique_id(value):
+                raise ValueError("\nDuplicate ID. Please enter a unique ID.")
 
-        if not self.__is_valid_id(value):
-            raise ValueError("\nInvalid ID. Please follow the pattern: " + self._id_pattern)
+            if not self.__is_valid_id(value):
+                raise ValueError("\nInvalid ID. Please follow the pattern: " + self._id_pattern)
 
-        self._object_id = value
-        self.last_id = self._object_id
+            if self.is_saved():
+                # re-key the saved instance so find_by_id() keeps working with the new id
+                del self._index[self._object_id]
+                self._index[value] = self
+                self._id_sequence.observe(value)
+                self._id_sequence.retire(type(self), self._object_id)
+
+                if Model._storage is not None:
+                    Model._storage.rename(self, value)
+
+            self._object_id = value
 
     # other public methods
 
+    # attaches a storage backend (e.g. SQLiteStorage or JournalStorage) to all models
+    @staticmethod
+    def use_storage(storage):
+        Model._storage = storage
+
     # https://realpython.com/instance-class-and-static-methods-demystified/
     # https://www.geeksforgeeks.org/decorators-in-python/
     @classmethod
     def get_all(cls):
-        return cls._instances
+        if cls._is_lazy():
+            return cls._load_all(Model._storage.get_all(cls))
+
+        # returns a copy in insertion order so callers can remove while iterating
+        with cls._lock.reading:
+            return list(cls._instances)
+
+    # streams the saved instances one at a time instead of building a list
+    # records from a lazy storage backend are not kept in memory, so treat them as read-only
+    @classmethod
+    def iter_all(cls):
+        if cls._is_lazy():
+            for record in Model._storage.get_all(cls):
+                instance = cls._index.get(record[0])
+
+                if instance is None:
+                    instance = cls.from_record(record)
+
+                yield instance
+        else:
+            # iterates over a copy, so other threads can keep saving and removing
+            for instance in cls.get_all():
+                yield instance
+
+    # returns a new id that has never been used, e.g. 'V004'
+    # safe to call from several threads, each call gets a different id
+    @classmethod
+    def next_id(cls):
+        return cls._id_sequence.next_id(cls)
+
+    # reserves count new ids at once and returns them as a list,
+    # costing a single storage write however many are reserved
+    @classmethod
+    def reserve_ids(cls, count):
+        sequence = cls._id_sequence
+        return [sequence.format(number) for number in sequence.reserve(cls, count)]
+
+    # e.g. Shipment.query().where(status=ShipmentStatus.IN_TRANSIT).order_by('-weight').limit(50), see Query
+    @classmethod
+    def query(cls):
+        return Query(cls)
 
     @classmethod
     def count(cls):
-        return len(cls._instances)
+        if cls._is_lazy():
+            return Model._storage.count(cls)
+
+        return len(cls._index)
+
+    # returns True if this exact instance has been saved
+    def is_saved(self):
+        return self._index.get(self._object_id) is self
 
     # A single method running all validations.
     # This is to prevent saving invalid instances
@@ -136,46 +565,1144 @@ class Model:
         if not self.__is_valid_id(self._object_id):
             raise ValueError("Invalid ID. Please follow the pattern: Vxxx.")
 
-    # the only method to save an instance to the _instances list
+    # Only the checks that depend on the other saved instances: a unique id,
+    # and in subclasses that referenced instances exist.
+    # Used instead of validate() when the setters have already checked every field.
+    def validate_references(self):
+        Model.validate(self)
+
+    # the only method to save an instance to the _instances dict
     def save(self):
-        self.validate() # run all validation before saving
-        self._instances.append(self)
+        with self._lock.writing:
+            self.validate() # run all validation before saving
+            self._register()
 
-        return True
+            if Model._storage is not None:
+                Model._storage.insert([self])
+
+            return True
+
+    # saves a batch of instances all-or-nothing:
+    # every instance is validated first (including duplicate ids within the batch),
+    # and nothing is saved unless all of them are valid
+    # fields_checked=True only runs validate_references(), for instances built with the setters
+    @classmethod
+    def save_many(cls, instances, fields_checked=False):
+        with cls._lock.writing:
+            instances = list(instances)
+
+            errors = cls._validate_batch(instances, fields_checked)
+            if errors:
+                raise BulkSaveError(errors)
 
-    # the only method to remove an instance from the _instance list
+            for instance in instances:
+                instance._register()
+
+            # written to the storage backend in a single transaction
+            if Model._storage is not None:
+                Model._storage.insert(instances)
+
+            return instances
+
+    # builds instances from a list of keyword dicts and saves them with save_many()
+    # e.g. Shipment.bulk_create([{'shipment_id': 'S001', 'origin': 'Sydney', ...}])
+    @classmethod
+    def bulk_create(cls, rows):
+        instances = []
+        for row in rows:
+            instances.append(cls(**row))
+
+        return cls.save_many(instances)
+
+    # the only method to remove an instance from the _instances dict
     def remove(self):
-        self._instances.remove(self)
+        with self._lock.writing:
+            del self._instances[self]
+            del self._index[self._object_id]
+            self._remove_from_indexes()
+            self._id_sequence.retire(type(self), self._object_id)
 
+            if Model._storage is not None:
+                Model._storage.delete(self)
+
+    # O(1) lookup through the id index instead of scanning all instances
+    # a single dict lookup is atomic, so no lock is needed
     @classmethod
     def find_by_id(cls, object_id):
-        for instance in cls._instances:
-            if instance.get_id() == object_id:
-                return instance
+        instance = cls._index.get(object_id)
 
-        return None
+        # not loaded yet, so look it up in the storage backend
+        if instance is None and cls._is_lazy():
+            record = Model._storage.get(cls, object_id)
+
+            if record is not None:
+                instance = cls._load(record)
+
+        return instance
+
+    # converts the instance to a list of column values, starting with the id
+    def to_record(self):
+        record = [self._object_id]
+        for column in self._columns:
+            record.append(getattr(self, '_' + column))
+
+        return record
+
+    # creates an instance from a record returned by to_record()
+    # the constructors take the columns in the same order
+    @classmethod
+    def from_record(cls, record):
+        return cls(*record)
+
+    # the record as a dict, e.g. {'id': 'V001', 'vehicle_type': 'Car', 'capacity': '10'}
+    def to_dict(self):
+        return dict(zip(['id'] + self._columns, self.to_record()))
+
+    # returns [column, setter name] for every column that can be set,
+    # in the order the setters should be called (e.g. weight before vehicle_id)
+    @classmethod
+    def get_setters(cls):
+        setters = [['id', 'set_id']]
+        for column in cls._columns:
+            if hasattr(cls, 'set_' + column):
+                setters.append([column, 'set_' + column])
+
+        return setters
+
+    # protected methods
+
+    # True if instances are loaded from the storage backend on demand
+    # instead of all being kept in memory
+    @classmethod
+    def _is_lazy(cls):
+        return Model._storage is not None and Model._storage.is_lazy
+
+    # returns the loaded instance for a record, loading it if needed,
+    # so there is never more than one instance with the same id
+    @classmethod
+    def _load(cls, record):
+        with cls._lock.writing:
+            instance = cls._index.get(record[0])
+
+            if instance is None:
+                instance = cls.from_record(record)
+                instance._register()
+
+            return instance
+
+    @classmethod
+    def _load_all(cls, records):
+        instances = []
+        for record in records:
+            instances.append(cls._load(record))
+
+        return instances
+
+    # writes the changes of a saved instance through to the storage backend
+    # setters call this after updating an attribute
+    def _persist(self):
+        if Model._storage is not None and self.is_saved():
+            Model._storage.update(self)
+
+    # adds an already validated instance to the _instances dict and all indexes
+    def _register(self):
+        self._instances[self] = None
+        self._index[self._object_id] = self
+        self._add_to_indexes()
+        self._id_sequence.observe(self._object_id)
+
+    # validates a batch in a single pass and returns the per-row errors
+    @classmethod
+    def _validate_batch(cls, instances, fields_checked=False):
+        errors = []
+        batch_ids = set()
+        batch = {} # shared state for _validate_in_batch(), e.g. running totals
+
+        row = 1
+        for instance in instances:
+            try:
+                if instance.get_id() in batch_ids:
+                    raise ValueError('Duplicate ID within the batch.')
+
+                if fields_checked:
+                    instance.validate_references()
+                else:
+                    instance.validate()
+
+                instance._validate_in_batch(batch)
+                batch_ids.add(instance.get_id())
+            except ValueError as e:
+                errors.append([row, instance.get_id(), str(e).strip()])
+
+            row += 1
+
+        return errors
+
+    # subclasses override this for checks that depend on the rest of the batch
+    def _validate_in_batch(self, batch):
+        pass
+
+    # subclasses can cache lookups while a batch of instances is checked and saved inside the
+    # with block, see Shipment._cache_batch_lookups() (Importer runs each chunk inside one)
+    @classmethod
+    @contextlib.contextmanager
+    def _cache_batch_lookups(cls, instances=()):
+        yield
+
+    # returns [column, number of candidates, function returning the candidates] for each
+    # in-memory index that can answer one of the conditions of a query, Query uses the smallest
+    # subclasses add their secondary indexes, the candidates may still contain non-matches
+    @classmethod
+    def _get_query_indexes(cls, where):
+        indexes = []
+        if 'id' in where:
+            instance = cls._index.get(where['id'])
+            candidates = [instance] if instance is not None else []
+            indexes.append(['id', len(candidates), lambda: candidates])
+
+        return indexes
+
+    # subclasses override these to keep their secondary indexes in sync
+    def _add_to_indexes(self):
+        pass
+
+    def _remove_from_indexes(self):
+        pass
 
     # private methods
 
     def __is_unique_id(self, object_id):
-        for instance in self._instances:
-            if instance.get_id() == object_id:
-               return False
-        return True
+        return self.find_by_id(object_id) is None
 
     def __is_valid_id(self, object_id):
-        match = re.search(self._id_regex, object_id)
+        match = self._id_regex.search(object_id)
 
         if match:
             return True
         else:
             return False
 
+# Filters, sorts and pages the saved instances of a model, e.g.
+#   Shipment.query().where(status=ShipmentStatus.IN_TRANSIT, vehicle_id='V001').order_by('-weight').limit(50)
+# where() takes column = value conditions, filter() any other test on the instance.
+# The smallest matching in-memory index is scanned instead of all instances
+# (a lazy storage backend gets the conditions as a query instead), and without order_by()
+# the rows are streamed, so limit() stops the scan early.
+# With order_by() and limit() only the top offset + limit rows are kept, using a heap.
+# explain() describes how the query will run.
+class Query:
+    def __init__(self, model):
+        self.model = model
+        self._where = {}
+        self._predicates = []
+        self._order = None
+        self._is_descending = False
+        self._offset = 0
+        self._limit = None
+
+    # all conditions must match, values are compared like the stored values
+    # (enum members equal their value, numeric columns are compared as numbers)
+    def where(self, **conditions):
+        for column in conditions:
+            if column != 'id' and column not in self.model._columns:
+                raise ValueError('Unknown column: ' + column)
+
+        self._where.update(conditions)
+        return self
+
+    def filter(self, predicate):
+        self._predicates.append(predicate)
+        return self
+
+    # a leading '-' sorts in descending order, e.g. order_by('-weight')
+    # rows without a value come last either way, equal values keep their insertion order
+    def order_by(self, column):
+        self._is_descending = column.startswith('-')
+        column = column.lstrip('-')
+
+        if column != 'id' and column not in self.model._columns:
+            raise ValueError('Unknown column: ' + column)
+
+        self._order = column
+        return self
+
+    def offset(self, count):
+        self._offset = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        rows = self.__filter(self.__scan()[1])
+
+        if self._order is None:
+            stop = None if self._limit is None else self._offset + self._limit
+            rows = itertools.islice(rows, self._offset, stop)
+        elif self._limit is not None:
+            # heapq.nsmallest(n, ...) is the same as sorted(...)[:n] without sorting everything
+            # https://docs.python.org/3/library/heapq.html#heapq.nsmallest
+            if self._is_descending:
+                rows = heapq.nlargest(self._offset + self._limit, rows, key=self.__sort_key)
+            else:
+                rows = heapq.nsmallest(self._offset + self._limit, rows, key=self.__sort_key)
+            rows = rows[self._offset:]
+        else:
+            rows = sorted(rows, key=self.__sort_key, reverse=self._is_descending)[self._offset:]
+
+        for instance in rows:
+            yield self.__resolve(instance)
+
+    def all(self):
+        return list(self)
+
+    def first(self):
+        query = self.__copy()
+        query._limit = 1
+
+        for instance in query:
+            return instance
+
+        return None
+
+    # the number of matching instances, ignoring offset() and limit()
+    def count(self):
+        if not self._where and not self._predicates:
+            return self.model.count()
+
+        if self.model._is_lazy() and not self._predicates and len(self.__get_storage_where()) == len(self._where):
+            return Model._storage.count_by(self.model, self.__get_storage_where())
+
+        count = 0
+        for instance in self.__filter(self.__scan()[1]):
+            count += 1
+
+        return count
+
+    # e.g. "index on status (120 of 5000 rows) -> filter status, vehicle_id -> top 50 by weight (heap)"
+    def explain(self):
+        steps = [self.__scan()[0]]
+
+        conditions = sorted(self._where)
+        if self._predicates:
+            conditions.append(str(len(self._predicates)) + ' custom filter(s)')
+        if conditions:
+            steps.append('filter ' + ', '.join(conditions))
+
+        order = ('-' if self._is_descending else '') + str(self._order)
+        if self._order is None:
+            if self._offset or self._limit is not None:
+                steps.append('stream rows ' + str(self._offset) + ' to '
+                             + ('end' if self._limit is None else str(self._offset + self._limit)) + ', then stop')
+        elif self._limit is not None:
+            steps.append('top ' + str(self._offset + self._limit) + ' by ' + order + ' (heap)')
+            if self._offset:
+                steps.append('skip ' + str(self._offset))
+        else:
+            steps.append('sort all by ' + order)
+            if self._offset:
+                steps.append('skip ' + str(self._offset))
+
+        return ' -> '.join(steps)
+
+    # private methods
+
+    def __copy(self):
+        query = Query(self.model)
+        query._where = dict(self._where)
+        query._predicates = list(self._predicates)
+        query._order = self._order
+        query._is_descending = self._is_descending
+        query._offset = self._offset
+        query._limit = self._limit
+        return query
+
+    # returns [description, candidate instances] for the cheapest way to find the matches
+    def __scan(self):
+        model = self.model
+
+        if model._is_lazy():
+            where = self.__get_storage_where()
+            if not where:
+                return ['storage scan of all ' + model._table, self.__load(Model._storage.get_all(model))]
+
+            columns = sorted(where)
+            is_indexed = any(group[0] in where for group in model._indexed_columns) or 'id' in where
+            description = 'storage query on ' + ', '.join(columns) + (' (indexed)' if is_indexed else '')
+            return [description, self.__load(Model._storage.find_by(model, where))]
+
+        best = None
+        for index in model._get_query_indexes(self._where):
+            if best is None or index[1] < best[1]:
+                best = index
+
+        if best is None:
+            return ['full scan of ' + str(model.count()) + ' ' + model._table, model.iter_all()]
+
+        column, count, get_candidates = best
+        return ['index on ' + column + ' (' + str(count) + ' of ' + str(model.count()) + ' ' + model._table + ')', get_candidates()]
+
+    # conditions the storage backend can compare as stored, the rest are only checked in Python
+    def __get_storage_where(self):
+        where = {}
+        for column in self._where:
+            value = self.__normalise(column, self._where[column])
+            if isinstance(value, str) and column not in self.model._numeric_columns:
+                where[column] = value
+
+        return where
+
+    # like iter_all(), records that are not loaded yet are not kept in memory,
+    # only the rows the query returns are loaded, see __resolve()
+    def __load(self, records):
+        for record in records:
+            instance = self.model._index.get(record[0])
+
+            if instance is None:
+                instance = self.model.from_record(record)
+
+            yield instance
+
+    def __resolve(self, instance):
+        if self.model._is_lazy() and not instance.is_saved():
+            return self.model._load(instance.to_record())
+
+        return instance
+
+    def __filter(self, instances):
+        conditions = []
+        for column in self._where:
+            conditions.append([column, self.__normalise(column, self._where[column])])
+
+        for instance in instances:
+            is_match = True
+            for column, value in conditions:
+                if self.__get_value(instance, column) != value:
+                    is_match = False
+                    break
+
+            if is_match:
+                for predicate in self._predicates:
+                    if not predicate(instance):
+                        is_match = False
+                        break
+
+            if is_match:
+                yield instance
+
+    def __get_value(self, instance, column):
+        if column == 'id':
+            return instance.get_id()
+
+        return self.__normalise(column, getattr(instance, '_' + column))
+
+    def __normalise(self, column, value):
+        if value is None:
+            return None
+
+        if column in self.model._numeric_columns:
+            return float(value)
+
+        if isinstance(value, Enum):
+            return value.value
+
+        return value
+
+    # None sorts after every value, in both directions
+    def __sort_key(self, instance):
+        value = self.__get_value(instance, self._order)
+
+        if value is None:
+            return [not self._is_descending, 0]
+
+        return [self._is_descending, value]
+
+# Storage backends keep a copy of the saved instances outside of memory.
+# Model calls insert/update/delete/rename after every change.
+# This base class stores nothing, subclasses override the methods they need.
+class Storage:
+    # lazy backends can also look up instances on demand (get, get_all, count, find_by, ...)
+    # so not everything has to be loaded into memory at startup
+    is_lazy = False
+
+    def insert(self, instances):
+        pass
+
+    def update(self, instance):
+        pass
+
+    # writes several changed instances of the same model at once
+    def update_many(self, instances):
+        for instance in instances:
+            self.update(instance)
+
+    def delete(self, instance):
+        pass
+
+    def rename(self, instance, new_id):
+        pass
+
+    # the highest id number handed out by the model's IdSequence
+    def get_id_sequence(self, model):
+        return 0
+
+    def set_id_sequence(self, model, value):
+        pass
+
+    # shipment events as [timestamp, shipment id, event, detail] records, see EventLog
+    def add_events(self, records):
+        pass
+
+    # returns the events in the order they were added
+    def get_events(self):
+        return []
+
+    # groups the writes made inside a with block, see SQLiteStorage.transaction()
+    @contextlib.contextmanager
+    def transaction(self):
+        yield
+
+    def close(self):
+        pass
+
+# Stores the models in a local SQLite database file.
+# https://docs.python.org/3/library/sqlite3.html
+# Each model gets a table named after Model._table with an "id" primary key
+# followed by Model._columns, plus an index for each of Model._indexed_columns.
+class SQLiteStorage(Storage):
+    is_lazy = True
+
+    def __init__(self, path):
+        # sqlite3 keeps up to cached_statements compiled (prepared) statements,
+        # so the same SQL string is only parsed once
+        # the connection is shared by all threads, every use of it holds self._lock
+        self._connection = sqlite3.connect(path, cached_statements=256, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._lock = threading.RLock()
+        self._tables = set() # tables already created
+        self._totals = set() # tables of running totals already kept up to date, see get_totals()
+        self._depth = 0 # number of open transaction() blocks
+
+        # the highest number handed out by each model's IdSequence
+        self._connection.execute('CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, value INTEGER)')
+        # the EventLog, rows are only ever added
+        # indexed for time windows (of all events or of one type) and for a shipment's history
+        self._connection.execute('CREATE TABLE IF NOT EXISTS events (time REAL, shipment_id TEXT, event TEXT, detail TEXT)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS events_time ON events (time)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS events_event_time ON events (event, time)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS events_shipment_id ON events (shipment_id)')
+        self._connection.commit()
+
+    # groups writes into one transaction, committed when the outermost block ends
+    # e.g. with storage.transaction(): ...
+    # https://docs.python.org/3/library/contextlib.html#contextlib.contextmanager
+    # the lock is not held for the whole block, so model locks taken inside it
+    # can't deadlock with other threads writing to the storage
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            self._depth += 1
+
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._connection.rollback()
+            raise
+
+        with self._lock:
+            self._depth -= 1
+            if self._depth == 0:
+                self._connection.commit()
+
+    def insert(self, instances):
+        if not instances:
+            return
+
+        model = type(instances[0])
+        table = self.__table(model)
+        placeholders = ', '.join(['?'] * (len(model._columns) + 1))
+
+        records = []
+        for instance in instances:
+            records.append(instance.to_record())
+
+        with self.transaction():
+            with self._lock:
+                self._connection.executemany('INSERT INTO ' + table + ' VALUES (' + placeholders + ')', records)
+
+    def update(self, instance):
+        model = type(instance)
+        table = self.__table(model)
+        assignments = ', '.join([column + ' = ?' for column in model._columns])
+
+        record = instance.to_record()
+        with self.transaction():
+            with self._lock:
+                self._connection.execute('UPDATE ' + table + ' SET ' + assignments + ' WHERE id = ?', record[1:] + [record[0]])
+
+    def update_many(self, instances):
+        if not instances:
+            return
+
+        model = type(instances[0])
+        table = self.__table(model)
+        assignments = ', '.join([column + ' = ?' for column in model._columns])
+
+        values = []
+        for instance in instances:
+            record = instance.to_record()
+            values.append(record[1:] + [record[0]])
+
+        with self.transaction():
+            with self._lock:
+                self._connection.executemany('UPDATE ' + table + ' SET ' + assignments + ' WHERE id = ?', values)
+
+    def delete(self, instance):
+        table = self.__table(type(instance))
+
+        with self.transaction():
+            with self._lock:
+                self._connection.execute('DELETE FROM ' + table + ' WHERE id = ?', [instance.get_id()])
+
+    def rename(self, instance, new_id):
+        table = self.__table(type(instance))
+
+        with self.transaction():
+            with self._lock:
+                self._connection.execute('UPDATE ' + table + ' SET id = ? WHERE id = ?', [new_id, instance.get_id()])
+
+    # the stored number, or the highest id number in the table if that is higher
+    # (e.g. for a database created before id sequences were stored)
+    def get_id_sequence(self, model):
+        table = self.__table(model)
+        start = len(model._id_sequence.prefix) + 1
+
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM id_sequences WHERE name = ?', [table]).fetchone()
+            highest = self._connection.execute('SELECT MAX(CAST(SUBSTR(id, ?) AS INTEGER)) FROM ' + table, [start]).fetchone()[0]
+
+        value = 0
+        if row is not None:
+            value = row[0]
+
+        return max(value, highest or 0)
+
+    def set_id_sequence(self, model, value):
+        table = self.__table(model)
+
+        with self.transaction():
+            with self._lock:
+                self._connection.execute('INSERT OR REPLACE INTO id_sequences VALUES (?, ?)', [table, value])
+
+    def add_events(self, records):
+        with self.transaction():
+            with self._lock:
+                self._connection.executemany('INSERT INTO events VALUES (?, ?, ?, ?)', records)
+
+    def get_events(self):
+        return self.__select('SELECT * FROM events ORDER BY rowid', [])
+
+    # the following methods answer the EventLog's queries without reading the whole log,
+    # times are POSIX timestamps and every condition is optional (None)
+
+    # yields the matching events from start up to and including end, in time order
+    # (then in the order they were added)
+    def find_events(self, shipment_id=None, event=None, start=None, end=None):
+        condition, values = self.__event_where(shipment_id, event, start, end)
+        return self.__select('SELECT * FROM events' + condition + ' ORDER BY time, rowid', values)
+
+    def count_events(self, event=None, start=None, end=None):
+        condition, values = self.__event_where(None, event, start, end)
+
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM events' + condition, values).fetchone()[0]
+
+    # returns {shipment id: time of its earliest event of the given type}
+    def get_first_event_times(self, event):
+        with self._lock:
+            rows = self._connection.execute('SELECT shipment_id, MIN(time) FROM events WHERE event = ? GROUP BY shipment_id', [event]).fetchall()
+
+        return dict(rows)
+
+    # returns [number of deliveries, total seconds from Created to Delivered], counting each
+    # Delivered event that has a Created event added before it (as EventLog does in memory)
+    # kept as running totals, so only the shipment's own events are read when one is delivered
+    def get_transit_totals(self, created, delivered):
+        name = self.__get_name('transit_totals_' + created + '_' + delivered)
+        first_created = ('(SELECT {} FROM events AS created WHERE created.shipment_id = events.shipment_id'
+                         ' AND created.event = ' + self.__quote(created) + ' ORDER BY created.rowid LIMIT 1)')
+        condition = 'events.event = ' + self.__quote(delivered) + ' AND ' + first_created.format('created.rowid') + ' < events.rowid'
+        seconds = 'MAX(events.time - ' + first_created.format('created.time') + ', 0)'
+
+        with self._lock:
+            if name not in self._totals:
+                self.__keep_totals(name, [['events', ['event'], ['1', seconds], condition]])
+
+            row = self._connection.execute('SELECT total_0, total_1 FROM ' + name).fetchone()
+
+        if row is None:
+            return [0, 0]
+
+        return list(row)
+
+    # returns the record with the given id, or None
+    def get(self, model, object_id):
+        table = self.__table(model)
+
+        with self._lock:
+            return self._connection.execute('SELECT * FROM ' + table + ' WHERE id = ?', [object_id]).fetchone()
+
+    # yields all records in insertion order (rows are fetched as they are read)
+    def get_all(self, model):
+        table = self.__table(model)
+        return self.__select('SELECT * FROM ' + table + ' ORDER BY rowid', [])
+
+    def count(self, model):
+        return self.count_by(model, {})
+
+    # the following methods take the conditions as a dict of column -> value (or list of values)
+    # e.g. storage.find_by(Shipment, {'customer_id': 'C001'})
+
+    def find_by(self, model, where):
+        table = self.__table(model)
+        condition, values = self.__where(where)
+        return self.__select('SELECT * FROM ' + table + condition + ' ORDER BY rowid', values)
+
+    def count_by(self, model, where):
+        table = self.__table(model)
+        condition, values = self.__where(where)
+
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM ' + table + condition, values).fetchone()[0]
+
+    def sum_by(self, model, column, where):
+        table = self.__table(model)
+        condition, values = self.__where(where)
+
+        with self._lock:
+            return self._connection.execute('SELECT COALESCE(SUM(' + column + '), 0) FROM ' + table + condition, values).fetchone()[0]
+
+    # returns [group values..., count, sum of column] for each distinct combination of group_columns
+    # e.g. storage.aggregate_by(Shipment, ['origin', 'destination'], 'weight', {'status': 'In Transit'})
+    def aggregate_by(self, model, group_columns, column, where):
+        table = self.__table(model)
+        condition, values = self.__where(where)
+        groups = ', '.join(group_columns)
+
+        with self._lock:
+            return self._connection.execute('SELECT ' + groups + ', COUNT(*), COALESCE(SUM(' + column + '), 0) FROM ' + table
+                                            + condition + ' GROUP BY ' + groups, values).fetchall()
+
+    # Returns [group values..., totals...] for each group of a table of running totals, which
+    # triggers update as the rows of the sources are written, so nothing is grouped when asked.
+    # sources are [model, group expressions, summed expressions, condition or None], several can add
+    # to the same groups (see __keep_totals()); the first summed expression counts rows and a group
+    # is dropped when it gets to 0
+    # e.g. storage.get_totals('lane_totals', [[Shipment, ['origin', 'destination'], ['1', 'weight'], "status = 'In Transit'"]])
+    def get_totals(self, name, sources):
+        with self._lock:
+            if name not in self._totals:
+                tables = []
+                for model, groups, totals, condition in sources:
+                    tables.append([self.__table(model), groups, totals, condition])
+
+                self.__keep_totals(name, tables)
+
+            return self._connection.execute('SELECT * FROM ' + name).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    # private methods
+
+    # runs a query and yields its rows, fetched in chunks so the lock is only held briefly
+    def __select(self, sql, values):
+        with self._lock:
+            cursor = self._connection.execute(sql, values)
+
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield row
+
+    # Creates the table of running totals and the triggers of each source table the first time,
+    # then adds the rows of the first source written so far (its totals must already include what
+    # the other sources add, e.g. a vehicle's load). The triggers are stored in the database, so
+    # they also run for other connections (which must have registered any _sql_functions used,
+    # as for the indexes).
+    # https://www.sqlite.org/lang_createtrigger.html
+    # https://www.sqlite.org/lang_upsert.html
+    def __keep_totals(self, name, sources):
+        groups = ['group_' + str(i) for i in range(len(sources[0][1]))]
+        totals = ['total_' + str(i) for i in range(len(sources[0][2]))]
+        upsert = (' ON CONFLICT (' + ', '.join(groups) + ') DO UPDATE SET '
+                  + ', '.join([total + ' = ' + total + ' + excluded.' + total for total in totals]))
+
+        exists = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+        if self._connection.execute(exists, [name]).fetchone():
+            self._totals.add(name)
+            return
+
+        # taking the write lock before looking again, so two connections don't both create the table
+        is_new_transaction = not self._connection.in_transaction
+        if is_new_transaction:
+            self._connection.execute('BEGIN IMMEDIATE')
+
+        try:
+            if not self._connection.execute(exists, [name]).fetchone():
+                self._connection.execute('CREATE TABLE ' + name + ' (' + ', '.join(groups + totals)
+                                         + ', PRIMARY KEY (' + ', '.join(groups) + '))')
+
+                for table, group_expressions, total_expressions, condition in sources:
+                    self.__add_totals_triggers(name, upsert, table, group_expressions, total_expressions, condition)
+
+                table, group_expressions, total_expressions, condition = sources[0]
+                sums = ['SUM(' + expression + ')' for expression in total_expressions]
+                self._connection.execute('INSERT INTO ' + name + ' SELECT ' + ', '.join(group_expressions + sums) + ' FROM ' + table
+                                         + self.__get_totals_where(group_expressions, condition)
+                                         + ' GROUP BY ' + ', '.join(group_expressions) + upsert)
+        except BaseException:
+            if is_new_transaction:
+                self._connection.rollback()
+            raise
+
+        if is_new_transaction:
+            self._connection.commit()
+
+        self._totals.add(name)
+
+    # a row's totals are read from the table itself, after it is written or before it is changed
+    def __add_totals_triggers(self, name, upsert, table, group_expressions, total_expressions, condition):
+        where = self.__get_totals_where(group_expressions, condition)
+
+        def add(row, sign):
+            values = group_expressions + [sign + '(' + expression + ')' for expression in total_expressions]
+            sql = ('INSERT INTO ' + name + ' SELECT ' + ', '.join(values) + ' FROM ' + table + where
+                   + ' AND ' + table + '.rowid = ' + row + '.rowid' + upsert + ';')
+            if sign == '-':
+                sql += ' DELETE FROM ' + name + ' WHERE total_0 = 0;'
+
+            return sql
+
+        trigger = name + '_' + table
+        self._connection.execute('CREATE TRIGGER ' + trigger + '_insert AFTER INSERT ON ' + table + ' BEGIN ' + add('NEW', '') + ' END')
+        self._connection.execute('CREATE TRIGGER ' + trigger + '_delete BEFORE DELETE ON ' + table + ' BEGIN ' + add('OLD', '-') + ' END')
+        self._connection.execute('CREATE TRIGGER ' + trigger + '_update_old BEFORE UPDATE ON ' + table + ' BEGIN ' + add('OLD', '-') + ' END')
+        self._connection.execute('CREATE TRIGGER ' + trigger + '_update_new AFTER UPDATE ON ' + table + ' BEGIN ' + add('NEW', '') + ' END')
+
+    # rows without a group (e.g. a shipment whose vehicle was removed) add to no totals
+    def __get_totals_where(self, group_expressions, condition):
+        conditions = [expression + ' IS NOT NULL' for expression in group_expressions]
+        if condition:
+            conditions.insert(0, '(' + condition + ')')
+
+        return ' WHERE ' + ' AND '.join(conditions)
+
+    # a string as an SQL literal, for the SQL of triggers (which can't have parameters)
+    def __quote(self, value):
+        return "'" + value.replace("'", "''") + "'"
+
+    # a valid SQL name made of the words of text, e.g. 'transit_totals_Created_Delivered'
+    def __get_name(self, text):
+        return re.sub(r'[\W_]+', '_', text).strip('_')
+
+    # creates the table and its indexes the first time a model is used
+    def __table(self, model):
+        table = model._table
+
+        if table not in self._tables:
+            with self._lock:
+                columns = ', '.join(['id TEXT PRIMARY KEY'] + model._columns)
+                self._connection.execute('CREATE TABLE IF NOT EXISTS ' + table + ' (' + columns + ')')
+
+                # columns added to the model after the table was created go at the end,
+                # so the records keep the order of model._columns
+                existing = [row[1] for row in self._connection.execute('PRAGMA table_info(' + table + ')')]
+                for column in model._columns:
+                    if column not in existing:
+                        self._connection.execute('ALTER TABLE ' + table + ' ADD COLUMN ' + column)
+
+                # deterministic, so SQLite can use them in indexes
+                # https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.create_function
+                for name in model._sql_functions:
+                    self._connection.create_function(name, 1, getattr(model, name), deterministic=True)
+
+                for indexed_columns in model._indexed_columns:
+                    # e.g. shipments_normalise_location_origin_normalise_location_destination_status
+                    index_name = re.sub(r'[\W_]+', '_', table + '_' + '_'.join(indexed_columns)).strip('_')
+                    self._connection.execute('CREATE INDEX IF NOT EXISTS ' + index_name + ' ON ' + table + ' (' + ', '.join(indexed_columns) + ')')
+
+                self._connection.commit()
+                self._tables.add(table)
+
+        return table
+
+    def __event_where(self, shipment_id, event, start, end):
+        conditions = []
+        values = []
+        for condition, value in [['shipment_id = ?', shipment_id], ['event = ?', event], ['time >= ?', start], ['time <= ?', end]]:
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+
+        if not conditions:
+            return '', []
+
+        return ' WHERE ' + ' AND '.join(conditions), values
+
+    def __where(self, where):
+        if not where:
+            return '', []
+
+        conditions = []
+        values = []
+        for column in where:
+            # a list matches any of its values, e.g. {'vehicle_id': ['V001', 'V002']}
+            if isinstance(where[column], list):
+                conditions.append(column + ' IN (' + ', '.join(['?'] * len(where[column])) + ')')
+                values.extend(where[column])
+            else:
+                conditions.append(column + ' = ?')
+                values.append(where[column])
+
+        return ' WHERE ' + ' AND '.join(conditions), values
+
+# A lightweight durability mode that keeps all instances in memory.
+# Every change is appended to a journal file, and snapshot() writes the whole
+# state to a binary snapshot file so the journal can start again from empty.
+# On startup the latest snapshot is loaded (memory-mapped) and only the
+# journal records written after it are replayed.
+# https://docs.python.org/3/library/pickle.html
+# https://docs.python.org/3/library/mmap.html
+class JournalStorage(Storage):
+    def __init__(self, directory, models, snapshot_every=100000, sync=False):
+        self._models = models
+        self._snapshot_path = os.path.join(directory, 'snapshot.bin')
+        self._journal_path = os.path.join(directory, 'journal.bin')
+        # events are only ever added, so they go in their own file that snapshots leave alone
+        self._events_path = os.path.join(directory, 'events.bin')
+        self._snapshot_every = snapshot_every # take a snapshot after this many journal records
+        self._sync = sync # fsync after every record (slower, survives power loss)
+        self._sequence = 0 # number of the last journal record
+        self._journal_records = 0 # records written since the last snapshot
+        self._id_sequences = {} # table -> highest number handed out by the model's IdSequence
+        self._lock = threading.RLock() # serialises writes from different threads
+
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+        self._journal = open(self._journal_path, 'ab')
+        self._events = open(self._events_path, 'ab')
+
+    def insert(self, instances):
+        if instances:
+            self.__append_many('insert', instances[0]._table, [instance.to_record() for instance in instances])
+
+    def update(self, instance):
+        self.__append('update', instance._table, instance.to_record())
+
+    def update_many(self, instances):
+        if instances:
+            self.__append_many('update', instances[0]._table, [instance.to_record() for instance in instances])
+
+    def delete(self, instance):
+        self.__append('delete', instance._table, instance.get_id())
+
+    def rename(self, instance, new_id):
+        self.__append('rename', instance._table, [instance.get_id(), new_id])
+
+    def get_id_sequence(self, model):
+        return self._id_sequences.get(model._table, 0)
+
+    def set_id_sequence(self, model, value):
+        with self._lock:
+            self._id_sequences[model._table] = value
+            self.__append('id_sequence', model._table, value)
+
+    def add_events(self, records):
+        with self._lock:
+            for record in records:
+                self._events.write(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+            self._events.flush()
+
+            if self._sync:
+                os.fsync(self._events.fileno())
+
+    # the EventLog reads the events before adding any, so a record cut short
+    # by a crash is dropped here before new ones are appended after it
+    def get_events(self):
+        with self._lock:
+            self._events.flush()
+
+        with open(self._events_path, 'rb') as file:
+            valid_length = 0
+
+            while True:
+                try:
+                    record = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+
+                valid_length = file.tell()
+                yield record
+
+        with self._lock:
+            self.__truncate(self._events_path, valid_length)
+
+    # writes the current state to a new snapshot and empties the journal
+    def snapshot(self):
+        with self._lock:
+            self.__write_snapshot()
+
+    def close(self):
+        with self._lock:
+            self._journal.close()
+            self._events.close()
+
+    # private methods
+
+    def __write_snapshot(self):
+        state = {'sequence': self._sequence, 'tables': {}, 'id_sequences': dict(self._id_sequences)}
+        for model in self._models:
+            records = []
+            # copies the instances without taking the model's lock, since this can run while
+            # another model's write lock is held. A change racing with the copy is also in the
+            # journal after this sequence number, and replaying it again is harmless.
+            for instance in list(model._instances):
+                records.append(instance.to_record())
+            state['tables'][model._table] = records
+
+        # write to a temporary file first so a crash never leaves a half-written snapshot
+        temporary_path = self._snapshot_path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self._snapshot_path)
+
+        # records up to state['sequence'] are in the snapshot,
+        # so replay would skip them even if truncating fails
+        self._journal.truncate(0)
+        self._journal_records = 0
+
+    def __append(self, operation, table, data):
+        self.__append_many(operation, table, [data])
+
+    # writes one journal record per item, flushed (and synced) once at the end
+    def __append_many(self, operation, table, items):
+        with self._lock:
+            for data in items:
+                self._sequence += 1
+                self._journal.write(pickle.dumps((self._sequence, operation, table, data), pickle.HIGHEST_PROTOCOL))
+            self._journal.flush()
+
+            if self._sync:
+                os.fsync(self._journal.fileno())
+
+            self._journal_records += len(items)
+            if self._journal_records >= self._snapshot_every:
+                self.__write_snapshot()
+
+    # loads the snapshot, replays the journal tail and registers the instances
+    def __load(self):
+        tables = {} # table -> {id: record}, dicts keep insertion order
+        for model in self._models:
+            tables[model._table] = {}
+
+        if os.path.exists(self._snapshot_path) and os.path.getsize(self._snapshot_path) > 0:
+            with open(self._snapshot_path, 'rb') as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as snapshot:
+                    state = pickle.loads(snapshot)
+
+            self._sequence = state['sequence']
+            self._id_sequences = state.get('id_sequences', {}) # older snapshots don't have it
+            for table in state['tables']:
+                for record in state['tables'][table]:
+                    tables[table][record[0]] = record
+
+        if os.path.exists(self._journal_path):
+            self.__replay(tables)
+
+        for model in self._models:
+            for record in tables[model._table].values():
+                model.from_record(record)._register()
+
+    def __replay(self, tables):
+        with open(self._journal_path, 'rb') as file:
+            valid_length = 0
+
+            while True:
+                try:
+                    sequence, operation, table, data = pickle.load(file)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    # end of the journal, or a record cut short by a crash
+                    break
+
+                valid_length = file.tell()
+
+                # already part of the snapshot
+                if sequence <= self._sequence:
+                    continue
+
+                self._sequence = sequence
+                self._journal_records += 1
+                records = tables[table]
+
+                if operation == 'insert' or operation == 'update':
+                    records[data[0]] = data
+                elif operation == 'delete':
+                    records.pop(data, None)
+                elif operation == 'id_sequence':
+                    self._id_sequences[table] = data
+                elif operation == 'rename':
+                    old_id, new_id = data
+                    # rebuild the dict so the renamed record keeps its position
+                    renamed = {}
+                    for object_id in records:
+                        record = records[object_id]
+                        if object_id == old_id:
+                            record = [new_id] + list(record[1:])
+                            object_id = new_id
+                        renamed[object_id] = record
+                    tables[table] = renamed
+
+        self.__truncate(self._journal_path, valid_length)
+
+    # drops a partially written last record so new records append cleanly
+    def __truncate(self, path, valid_length):
+        if valid_length < os.path.getsize(path):
+            with open(path, 'r+b') as file:
+                file.truncate(valid_length)
+
 class Vehicle(Model):
     # overriding the class variables in the super class
-    _instances = []
-    _id_regex = '^V[0-9]{3,}$'
+    _instances = {}
+    _index = {}
+    _lock = ReadWriteLock()
+    _id_regex = re.compile('^V[0-9]{3,}$')
+    _vehicle_type_regex = re.compile('^(Car|Van|Truck)$')
     _id_pattern = 'Vxxx'
+    _id_sequence = IdSequence('V')
+    _table = 'vehicles'
+    _columns = ['vehicle_type', 'capacity']
+    _numeric_columns = ['capacity']
+    _independent_columns = ['vehicle_type', 'capacity']
+    _type_totals = {} # vehicle type -> [number of vehicles, total capacity, in-transit weight]
+    _type_totals_lock = threading.Lock() # shipments add to the weights while holding their own lock
+    # Lock order: Shipment._lock, then Vehicle._lock. Shipments look up their vehicle while holding
+    # their own lock, so the methods reading the shipments' loads take Shipment._lock first as well.
+    __slots__ = ('_vehicle_type', '_capacity')
 
     def __init__(self, vehicle_id=None, vehicle_type=None, capacity=None):
         # call super class constructor
@@ -195,7 +1722,19 @@ class Vehicle(Model):
         if not self.__is_valid_vehicle_type(value):
             raise ValueError("\nInvalid vehicle type. It can be only Truck, Van or Car.")
 
-        self._vehicle_type = value
+        # the load is read from the shipments, see the lock order above
+        with Shipment._lock.reading, self._lock.writing:
+            # move the vehicle's capacity and load to the totals of its new type
+            is_saved = self.is_saved()
+            if is_saved:
+                self._remove_from_indexes()
+
+            self._vehicle_type = value
+
+            if is_saved:
+                self._add_to_indexes()
+
+            self._persist()
 
     def get_capacity(self):
         return self._capacity
@@ -204,10 +1743,75 @@ class Vehicle(Model):
         if not self.__is_valid_capacity(value):
             raise ValueError("\nInvalid capacity. Please enter a positive integer.")
 
-        self._capacity = value
+        # no shipment is added to the vehicle between the check and the change, see the lock order above
+        with Shipment._lock.reading, self._lock.writing:
+            if self.is_saved():
+                load = self.get_load()
+                if int(value) < load:
+                    raise ValueError("Vehicle " + self._object_id + " is carrying " + str(load) +
+                                     ", the capacity cannot be lower than that.")
+
+                self._add_to_type_totals(self._vehicle_type, 0, int(value) - int(self._capacity), 0)
+
+            self._capacity = value
+            self._persist()
 
     # other public methods
 
+    # returns the in-transit shipments currently assigned to the vehicle
+    def get_shipments(self):
+        return Shipment.find_by_vehicle_id(self.get_id())
+
+    # returns the total weight of the in-transit shipments assigned to the vehicle
+    def get_load(self):
+        return Shipment.get_vehicle_load(self.get_id())
+
+    def get_remaining_capacity(self):
+        return int(self._capacity) - self.get_load()
+
+    # returns {vehicle type: [number of vehicles, total capacity, in-transit weight]}
+    # the totals are kept up to date as vehicles and shipments change, so nothing is scanned
+    # (by a lazy storage backend as well, see SQLiteStorage.get_totals())
+    @classmethod
+    def get_type_totals(cls):
+        if cls._is_lazy():
+            in_transit = "status = '" + ShipmentStatus.IN_TRANSIT.value + "'"
+            # a vehicle adds its load, and a shipment its weight to the type of its vehicle (if it exists)
+            load = '(SELECT COALESCE(SUM(weight), 0) FROM ' + Shipment._table + ' WHERE vehicle_id = ' + cls._table + '.id AND ' + in_transit + ')'
+            vehicle_type = '(SELECT vehicle_type FROM ' + cls._table + ' WHERE id = ' + Shipment._table + '.vehicle_id)'
+            sources = [[cls, ['vehicle_type'], ['1', 'CAST(capacity AS INTEGER)', load], None],
+                       [Shipment, [vehicle_type], ['0', '0', 'weight'], in_transit]]
+
+            totals = {}
+            for vehicle_type, count, capacity, weight in Model._storage.get_totals('vehicle_type_totals', sources):
+                totals[vehicle_type] = [count, capacity, weight]
+
+            return totals
+
+        with cls._type_totals_lock:
+            return {vehicle_type: list(totals) for vehicle_type, totals in cls._type_totals.items()}
+
+    # the load taken off the type's totals is read from the shipments, see the lock order above
+    def remove(self):
+        with Shipment._lock.reading:
+            super().remove()
+
+    # protected methods
+
+    @classmethod
+    def _add_to_type_totals(cls, vehicle_type, vehicles, capacity, weight):
+        with cls._type_totals_lock:
+            totals = cls._type_totals.setdefault(vehicle_type, [0, 0, 0])
+            totals[0] += vehicles
+            totals[1] += capacity
+            totals[2] += weight
+
+    def _add_to_indexes(self):
+        self._add_to_type_totals(self._vehicle_type, 1, int(self._capacity), Shipment._vehicle_loads.get(self._object_id, 0))
+
+    def _remove_from_indexes(self):
+        self._add_to_type_totals(self._vehicle_type, -1, -int(self._capacity), -Shipment._vehicle_loads.get(self._object_id, 0))
+
     # overriding validate method from the super class
     def validate(self):
         super().validate()
@@ -221,7 +1825,7 @@ class Vehicle(Model):
     # private methods
 
     def __is_valid_vehicle_type(self, vehicle_type):
-        match = re.search('^(Car|Van|Truck)$', vehicle_type)
+        match = self._vehicle_type_regex.search(vehicle_type)
 
         if match:
             return True
@@ -284,7 +1888,7 @@ class VehiclesController(Controller):
 
         vehicle = Vehicle()
 
-        next_id = 'V00' + str(Vehicle.count() + 1)
+        next_id = Vehicle.next_id()
         print('Suggested vehicle ID:', next_id)
         self._get_valid_input('Enter vehicle ID: ', vehicle.set_id)
         self._get_valid_input('Enter vehicle type: ', vehicle.set_vehicle_type)
@@ -338,28 +1942,34 @@ class VehiclesController(Controller):
         print('--| View all Vehicles |--')
         print()
 
-        vehicles = Vehicle.get_all()
-
-        vehicle_data = []
-        for vehicle in vehicles:
-            vehicle_data.append([vehicle.get_id(), vehicle.get_vehicle_type(), vehicle.get_capacity()])
-
-        if len(vehicle_data) > 0:
-            table = Table(['Vehicle ID', 'Type', 'Capacity'], vehicle_data)
-            table.display()
-        else:
-            print('No vehicles to display.')
+        # rows are generated as the pages are displayed
+        vehicle_data = ([vehicle.get_id(), vehicle.get_vehicle_type(), vehicle.get_capacity()]
+                        for vehicle in Vehicle.iter_all())
 
-        print()
-        prompt = ''
-        while not prompt == 'exit':
-            prompt = input("Enter 'exit' to go back: ")
+        table = PagedTable(['Vehicle ID', 'Type', 'Capacity'], vehicle_data, empty_message='No vehicles to display.')
+        table.browse()
 
 class Customer(Model):
     # overriding the class variables in the super class
-    _instances = []
-    _id_regex = '^C[0-9]{3,}$'
+    _instances = {}
+    _index = {}
+    _lock = ReadWriteLock()
+    _id_regex = re.compile('^C[0-9]{3,}$')
+    # https://docs.python.org/3/library/re.html#re.compile
+    # the patterns are compiled once, see the private methods below for examples
+    _dob_regex = re.compile('^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/(19|20)[0-9]{2}$')
+    _phone_regex = re.compile(r'^(04\d{2})\s?\d{3}\s?\d{3}$')
+    _email_regex = re.compile(r'^([\w\-_.]*[^.])(@\w+)(\.\w+(\.\w+)?)$')
+    # used by the address parser, each one runs in linear time
+    _address_tail_regex = re.compile(r',?\s(ACT|NSW|VIC|SA|WA|NT|TAS)\s([0-9]{4}), Australia$')
+    _street_regex = re.compile(r'[\d/\w\s]+')
+    _suburb_regex = re.compile(r'[a-zA-Z\s]+')
     _id_pattern = 'Cxxx'
+    _id_sequence = IdSequence('C')
+    _table = 'customers'
+    _columns = ['name', 'dob', 'address', 'phone', 'email']
+    _independent_columns = ['name', 'dob', 'address', 'phone', 'email']
+    __slots__ = ('_name', '_dob', '_address', '_phone', '_email')
 
     def __init__(self, customer_id=None, name=None, dob=None, address=None, phone=None, email=None):
         # call super class constructor
@@ -381,6 +1991,7 @@ class Customer(Model):
             raise ValueError("Customer name cannot be empty.")
 
         self._name = value
+        self._persist()
 
     def get_dob(self):
         return self._dob
@@ -393,6 +2004,7 @@ class Customer(Model):
             raise ValueError('\nAge must be 18 or above.')
 
         self._dob = value
+        self._persist()
 
     def get_address(self):
         return self._address
@@ -402,6 +2014,7 @@ class Customer(Model):
             raise ValueError('\nInvalid address. Please enter a valid Australian address.')
 
         self._address = value
+        self._persist()
 
     def get_phone(self):
         return self._phone
@@ -411,6 +2024,7 @@ class Customer(Model):
             raise ValueError('\nInvalid phone number. Please enter a valid Australian phone number.')
 
         self._phone = value
+        self._persist()
 
     def get_email(self):
         return self._email
@@ -420,6 +2034,7 @@ class Customer(Model):
             raise ValueError('\nInvalid email address. Please enter a valid email.')
 
         self._email = value
+        self._persist()
 
     # other public methods
 
@@ -446,12 +2061,7 @@ class Customer(Model):
 
     # returns a list of shipments belong to the customer
     def get_shipments(self):
-        shipments = []
-        for shipment in Shipment.get_all():
-            if shipment.get_customer_id() == self.get_id():
-                shipments.append(shipment)
-
-        return shipments
+        return Shipment.find_by_customer_id(self.get_id())
 
     # private methods
 
@@ -465,7 +2075,7 @@ class Customer(Model):
     # 10/10/1800 - not matching year
     # =============================================================================
     def __is_valid_dob(self, dob):
-        match = re.search('^(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/(19|20)[0-9]{2}$', dob)
+        match = self._dob_regex.search(dob)
 
         if match:
             return True
@@ -489,19 +2099,54 @@ class Customer(Model):
     # 4 Anfield Cres, Mulgrave VIC 3170, Australia
     # 4 Anfield Cres, Mulgrave, VIC 3170, Australia
     # =============================================================================
+    # Accepts the same addresses as the regex
+    # ^([\d\/\w\s]+)\s([a-zA-Z\s]+)\,\s([a-zA-Z\s]+)\,?\s(ACT|NSW|VIC|SA|WA|NT|TAS)\s([0-9]{4})\,\s(Australia)$
+    # but checks the parts one by one, since the nested quantifiers in that regex
+    # backtrack for a very long time on long invalid input.
+    # "<street>, <suburb>[,] <state> <postcode>, Australia"
     def __is_valid_address(self, address):
-        match = re.search('^([\d\/\w\s]+)\s([a-zA-Z\s]+)\,\s([a-zA-Z\s]+)\,?\s(ACT|NSW|VIC|SA|WA|NT|TAS)\s([0-9]{4})\,\s(Australia)$', address)
+        tail = self._address_tail_regex.search(address)
+        if not tail:
+            return False
 
-        if match:
-            return True
-        else:
+        # street and suburb cannot contain commas, so there must be exactly one
+        parts = address[:tail.start()].split(',')
+        if len(parts) != 2:
+            return False
+
+        street = parts[0]
+        suburb = parts[1]
+
+        # the suburb follows ", "
+        if not suburb[:1].isspace() or not self._suburb_regex.fullmatch(suburb[1:]):
+            return False
+
+        return self.__is_valid_street(street)
+
+    # the street is "<number> <name>": any of [\d/\w\s], then a whitespace,
+    # then a name made of letters and spaces
+    def __is_valid_street(self, street):
+        if not self._street_regex.fullmatch(street):
+            return False
+
+        # walk back over the name until we find the whitespace before it
+        i = len(street) - 1
+        if street[i] not in string.ascii_letters and not street[i].isspace():
             return False
 
+        i -= 1
+        while i >= 1 and (street[i] in string.ascii_letters or street[i].isspace()):
+            if street[i].isspace():
+                return True
+            i -= 1
+
+        return False
+
     # =============================================================================
     # 04xxxxxxxx or 04xx xxx xxx
     # =============================================================================
     def __is_valid_phone(self, phone):
-        match = re.search('^(04\d{2})\s?\d{3}\s?\d{3}$', phone)
+        match = self._phone_regex.search(phone)
 
         if match:
             return True
@@ -519,7 +2164,7 @@ class Customer(Model):
     # john@example_com - invalid
     # =============================================================================
     def __is_valid_email(self, email):
-        match = re.search('^([\w\-_.]*[^.])(@\w+)(\.\w+(\.\w+)?)$', email)
+        match = self._email_regex.search(email)
 
         if match:
             return True
@@ -559,7 +2204,7 @@ class CustomersController(Controller):
 
         customer = Customer()
 
-        next_id = 'C00' + str(Customer.count() + 1)
+        next_id = Customer.next_id()
         print('Suggested customer ID:', next_id)
         self._get_valid_input('Enter customer ID: ', customer.set_id)
 
@@ -623,22 +2268,12 @@ class CustomersController(Controller):
         print('--| View all Customers |--')
         print()
 
-        customers = Customer.get_all()
-
-        customer_data = []
-        for customer in customers:
-            customer_data.append([customer.get_id(), customer.get_name(), customer.get_dob(), customer.get_address(), customer.get_phone(), customer.get_email()])
-
-        if len(customer_data) > 0:
-            table = Table(['Customer ID', 'Name', 'DOB', 'Address', 'Phone', 'Email'], customer_data)
-            table.display()
-        else:
-            print('No customers to display.')
+        # rows are generated as the pages are displayed
+        customer_data = ([customer.get_id(), customer.get_name(), customer.get_dob(), customer.get_address(), customer.get_phone(), customer.get_email()]
+                         for customer in Customer.iter_all())
 
-        print()
-        prompt = ''
-        while not prompt == 'exit':
-            prompt = input("Enter 'exit' to go back: ")
+        table = PagedTable(['Customer ID', 'Name', 'DOB', 'Address', 'Phone', 'Email'], customer_data, empty_message='No customers to display.')
+        table.browse()
 
     def view_shipments(self):
         print('--| View Shipments |--')
@@ -652,31 +2287,376 @@ class CustomersController(Controller):
             # customer exists
             shipments = customer.get_shipments()
 
-            shipment_data = []
-            for shipment in shipments:
-                shipment_data.append([shipment.get_id(),
-                                        shipment.get_origin(),
-                                        shipment.get_destination(),
-                                        shipment.get_weight(),
-                                        shipment.get_vehicle_id(),
-                                        shipment.get_status(),
-                                        shipment.get_delivery_date()])
-
-            table = Table(['Shipment ID', 'Origin', 'Destination', 'Weight', 'Vehicle ID', 'Status', 'Delivery Date'], shipment_data)
-            table.display()
-
-            print()
-            prompt = ''
-            while not prompt == 'exit':
-                prompt = input("Enter 'exit' to go back: ")
+            shipment_data = ([shipment.get_id(),
+                              shipment.get_origin(),
+                              shipment.get_destination(),
+                              shipment.get_weight(),
+                              shipment.get_vehicle_id(),
+                              shipment.get_status(),
+                              shipment.get_delivery_date()] for shipment in shipments)
+
+            table = PagedTable(['Shipment ID', 'Origin', 'Destination', 'Weight', 'Vehicle ID', 'Status', 'Delivery Date'], shipment_data,
+                               empty_message='No shipments to display.')
+            table.browse()
         else:
             print('Sorry, cannot find a customer with ID:', customer_id)
 
+# https://docs.python.org/3/library/enum.html
+class ShipmentStatus(Enum):
+    IN_TRANSIT = 'In Transit'
+    DELIVERED = 'Delivered'
+
+# the outcome of each confirmation passed to Shipment.mark_delivered_many()
+class DeliveryResult(Enum):
+    DELIVERED = 'Delivered'
+    ALREADY_DELIVERED = 'Already delivered'
+    UNKNOWN = 'Unknown shipment'
+    INVALID_TIME = 'Invalid time'
+
+class ShipmentEvent(Enum):
+    CREATED = 'Created'
+    ASSIGNED = 'Assigned'
+    CHECKPOINT = 'Checkpoint'
+    DELIVERED = 'Delivered'
+
+# Append-only log of what happened to each shipment.
+# Events are kept in columns (like ShipmentColumns): times as C doubles and
+# shipment ids, event types and details as small integer codes, so millions of
+# events stay compact. Each shipment keeps the positions of its events, and the
+# whole log and each event type have a time index (times and positions sorted by
+# time), so a time window is found with two binary searches.
+# Events nearly always arrive in time order and are appended to the indexes;
+# late ones (e.g. delivery scans uploaded afterwards) are kept aside and merged
+# into the indexes together the next time a time window is looked up, so a batch
+# of them costs one pass over the index instead of one insert each.
+# The average time from Created to Delivered is kept as a running total.
+# Events are also written to the storage backend, and read back from it the first
+# time the log is used. A lazy backend (SQLiteStorage) is never read in full:
+# events are only written to it and every query is answered by it instead.
+# https://docs.python.org/3/library/bisect.html
+class EventLog:
+    _events_by_code = list(ShipmentEvent)
+
+    def __init__(self):
+        self._storage = None # storage backend the events were loaded from
+        self._loaded = False
+        self._lock = threading.RLock()
+        self.__clear()
+
+    def __len__(self):
+        if Model._is_lazy():
+            return Model._storage.count_events()
+
+        return len(self._times)
+
+    # time defaults to now, details are e.g. the vehicle id or the checkpoint location
+    def append(self, shipment_id, event, detail=None, time=None):
+        self.append_many([[shipment_id, event, detail, time]])
+
+    # appends [shipment id, event, detail, time] lists, written to the storage backend together
+    def append_many(self, events):
+        is_lazy = Model._is_lazy()
+
+        with self._lock:
+            if not is_lazy:
+                self.__load()
+
+            records = []
+            for shipment_id, event, detail, time in events:
+                if time is None:
+                    time = datetime.datetime.now()
+
+                if not is_lazy:
+                    self.__add(time.timestamp(), shipment_id, event, detail)
+                records.append([time.timestamp(), shipment_id, event.value, detail])
+
+            if Model._storage is not None:
+                Model._storage.add_events(records)
+
+    # returns the shipment's events as [datetime, ShipmentEvent, detail], oldest first,
+    # optionally only those from start up to and including end
+    def get_history(self, shipment_id, start=None, end=None):
+        if Model._is_lazy():
+            history = []
+            for time, event_shipment_id, event, detail in self.__find_stored(shipment_id, None, start, end):
+                history.append([time, event, detail])
+
+            return history
+
+        with self._lock:
+            self.__load()
+
+            positions = self._by_shipment.get(self._codes.get(shipment_id), ())
+            history = []
+            for position in positions:
+                time = self._times[position]
+
+                if (start is None or time >= start.timestamp()) and (end is None or time <= end.timestamp()):
+                    history.append([datetime.datetime.fromtimestamp(time),
+                                    self._events_by_code[self._types[position]],
+                                    self._strings[self._details[position]]])
+
+            # a shipment has few events, so late ones are simply sorted into place here
+            history.sort(key=lambda item: item[0])
+            return history
+
+    # returns [datetime, shipment id, ShipmentEvent, detail] for every event from start
+    # up to and including end, oldest first, optionally only events of one type
+    def find(self, event=None, start=None, end=None):
+        if Model._is_lazy():
+            return self.__find_stored(None, event, start, end)
+
+        with self._lock:
+            self.__load()
+
+            times, positions = self.__get_index(event)
+            first, last = self.__get_range(times, start, end)
+
+            events = []
+            for position in positions[first:last]:
+                events.append([datetime.datetime.fromtimestamp(self._times[position]),
+                               self._strings[self._shipment_ids[position]],
+                               self._events_by_code[self._types[position]],
+                               self._strings[self._details[position]]])
+
+            return events
+
+    # the number of events from start up to and including end, optionally only of one type,
+    # found with two binary searches whatever the size of the log
+    def count(self, event=None, start=None, end=None):
+        if Model._is_lazy():
+            return Model._storage.count_events(*self.__to_stored(event, start, end))
+
+        with self._lock:
+            self.__load()
+
+            first, last = self.__get_range(self.__get_index(event)[0], start, end)
+            return last - first
+
+    # returns {shipment id: POSIX time of its earliest event of the given type}
+    def get_first_times(self, event):
+        if Model._is_lazy():
+            return Model._storage.get_first_event_times(event.value)
+
+        with self._lock:
+            self.__load()
+
+            times, positions = self.__get_index(event)
+            first_times = {}
+            for time, position in zip(times, positions):
+                shipment_id = self._strings[self._shipment_ids[position]]
+
+                # sorted by time, so the first one seen is the earliest
+                if shipment_id not in first_times:
+                    first_times[shipment_id] = time
+
+            return first_times
+
+    # the average time from a shipment's Created event to its Delivered event as a timedelta,
+    # or None before the first delivery
+    def get_average_transit_time(self):
+        if Model._is_lazy():
+            count, seconds = Model._storage.get_transit_totals(ShipmentEvent.CREATED.value, ShipmentEvent.DELIVERED.value)
+        else:
+            with self._lock:
+                self.__load()
+                count, seconds = [self._transit_count, self._transit_seconds]
+
+        if count == 0:
+            return None
+
+        return datetime.timedelta(seconds=seconds / count)
+
+    # private methods
+
+    # the event, start and end as the lazy storage backend stores them
+    def __to_stored(self, event, start, end):
+        if event is not None:
+            event = event.value
+        if start is not None:
+            start = start.timestamp()
+        if end is not None:
+            end = end.timestamp()
+
+        return [event, start, end]
+
+    # returns [datetime, shipment id, ShipmentEvent, detail] for the events found by the lazy storage backend
+    def __find_stored(self, shipment_id, event, start, end):
+        events = []
+        for time, event_shipment_id, stored_event, detail in Model._storage.find_events(shipment_id, *self.__to_stored(event, start, end)):
+            events.append([datetime.datetime.fromtimestamp(time), event_shipment_id, ShipmentEvent(stored_event), detail])
+
+        return events
+
+    def __clear(self):
+        self._times = array('d') # POSIX timestamps, in the order the events were added
+        self._shipment_ids = array('I') # codes into _strings
+        self._types = array('B') # position in the ShipmentEvent enum
+        self._details = array('I') # codes into _strings
+
+        self._strings = [None] # code -> string, code 0 is None
+        self._codes = {None: 0} # string -> code
+
+        self._by_shipment = {} # shipment id code -> array of event positions
+        # [sorted times, event positions, late [time, position] pairs not merged yet]
+        self._time_index = [array('d'), array('I'), []]
+        self._by_type = [] # event type code -> [sorted times, event positions, late events]
+        for event in self._events_by_code:
+            self._by_type.append([array('d'), array('I'), []])
+
+        self._transit_seconds = 0.0 # total time from Created to Delivered over the delivered shipments
+        self._transit_count = 0
+
+    # reads the events from the storage backend the first time the log is used
+    # (and again if the backend changes)
+    def __load(self):
+        if self._loaded and self._storage is Model._storage:
+            return
+
+        if self._storage is not Model._storage:
+            self.__clear()
+
+        if Model._storage is not None:
+            for time, shipment_id, event, detail in Model._storage.get_events():
+                self.__add(time, shipment_id, ShipmentEvent(event), detail)
+
+        self._storage = Model._storage
+        self._loaded = True
+
+    def __add(self, time, shipment_id, event, detail):
+        position = len(self._times)
+        shipment_code = self.__encode(shipment_id)
+        type_code = self._events_by_code.index(event)
+
+        self._times.append(time)
+        self._shipment_ids.append(shipment_code)
+        self._types.append(type_code)
+        self._details.append(self.__encode(detail))
+
+        shipment_positions = self._by_shipment.get(shipment_code)
+        if shipment_positions is None:
+            shipment_positions = array('I')
+            self._by_shipment[shipment_code] = shipment_positions
+
+        if event is ShipmentEvent.DELIVERED:
+            self.__add_transit_time(shipment_positions, time)
+
+        shipment_positions.append(position)
+
+        self.__index(self._time_index, time, position)
+        self.__index(self._by_type[type_code], time, position)
+
+    # shipments created before the event log existed have no Created event and are left out
+    def __add_transit_time(self, shipment_positions, delivered):
+        created_code = self._events_by_code.index(ShipmentEvent.CREATED)
+
+        for position in shipment_positions:
+            if self._types[position] == created_code:
+                # a backdated delivery scan can be earlier than the creation
+                self._transit_seconds += max(delivered - self._times[position], 0)
+                self._transit_count += 1
+                break
+
+    # returns [sorted times, event positions], with the late events merged in
+    def __get_index(self, event):
+        if event is None:
+            index = self._time_index
+        else:
+            index = self._by_type[self._events_by_code.index(event)]
+
+        if index[2]:
+            self.__merge(index)
+
+        return index[:2]
+
+    # returns the [first, last) positions in sorted times from start up to and including end
+    def __get_range(self, times, start, end):
+        first = 0
+        if start is not None:
+            first = bisect.bisect_left(times, start.timestamp())
+
+        last = len(times)
+        if end is not None:
+            last = bisect.bisect_right(times, end.timestamp())
+
+        return [first, last]
+
+    # keeps the index sorted by time, after events with the same time;
+    # a late event waits in the index's list of late events, see __merge()
+    def __index(self, index, time, position):
+        times, positions, late = index
+
+        if not times or time >= times[-1]:
+            times.append(time)
+            positions.append(position)
+        else:
+            late.append([time, position])
+
+    # merges the late events into the index in one pass: each one's place is found
+    # with binary searches, then the arrays are rebuilt from slices of the old ones.
+    # Events with the same time stay in the order they were added (by position).
+    def __merge(self, index):
+        times, positions, late = index
+        late.sort()
+
+        merged_times = array('d')
+        merged_positions = array('I')
+        previous = 0
+        for time, position in late:
+            i = bisect.bisect_left(times, time, previous)
+            j = bisect.bisect_right(times, time, i)
+            i = bisect.bisect_left(positions, position, i, j) if i < j else i
+
+            merged_times.extend(times[previous:i])
+            merged_positions.extend(positions[previous:i])
+            merged_times.append(time)
+            merged_positions.append(position)
+            previous = i
+
+        merged_times.extend(times[previous:])
+        merged_positions.extend(positions[previous:])
+
+        index[0] = merged_times
+        index[1] = merged_positions
+        index[2] = []
+
+    def __encode(self, value):
+        code = self._codes.get(value)
+
+        if code is None:
+            code = len(self._strings)
+            self._strings.append(value)
+            self._codes[value] = code
+
+        return code
+
 class Shipment(Model):
     # overriding the class variables in the super class
-    _instances = []
-    _id_regex = '^S[0-9]{3,}$'
+    _instances = {}
+    _index = {}
+    _lock = ReadWriteLock()
+    _id_regex = re.compile('^S[0-9]{3,}$')
     _id_pattern = 'Sxxx'
+    _id_sequence = IdSequence('S')
+    _table = 'shipments'
+    _columns = ['origin', 'destination', 'weight', 'vehicle_id', 'customer_id', 'status', 'delivery_date', 'distance', 'eta']
+    # lanes are looked up by the normalised locations, see get_lane()
+    _lane_columns = ['normalise_location(origin)', 'normalise_location(destination)']
+    _indexed_columns = [['customer_id'], ['vehicle_id', 'status', 'weight'], ['status'], _lane_columns + ['status']]
+    _sql_functions = ['normalise_location']
+    _numeric_columns = ['weight', 'distance']
+    _independent_columns = ['origin', 'destination', 'weight'] # the vehicle and customer must exist
+    _customer_index = Index() # customer id -> shipments of that customer
+    _vehicle_index = Index() # vehicle id -> in-transit shipments assigned to that vehicle
+    _vehicle_loads = {} # vehicle id -> running total weight of its in-transit shipments
+    _cached_loads = threading.local() # loads read from a lazy storage backend during a batch, see _cache_batch_lookups()
+    _status_index = Index() # ShipmentStatus -> shipments with that status
+    _lane_index = Index() # lane -> in-transit shipments on that lane, see get_lane()
+    _lane_totals = {} # lane -> [number of in-transit shipments, their total weight]
+    _router = None # RouteGraph that fills in the distance and ETA, see use_router()
+    _events = EventLog() # what happened to each shipment and when, see get_history()
+    __slots__ = ('_origin', '_destination', '_weight', '_vehicle_id', '_customer_id', '_status', '_delivery_date',
+                 '_distance', '_eta')
 
     def __init__(self, shipment_id=None, origin=None, destination=None, weight=None, vehicle_id=None, customer_id=None):
         # call super class constructor
@@ -687,8 +2667,10 @@ class Shipment(Model):
         self._weight = weight
         self._vehicle_id = vehicle_id
         self._customer_id = customer_id
-        self._status = 'In Transit'
+        self._status = ShipmentStatus.IN_TRANSIT
         self._delivery_date = None
+        self._distance = None # km along the shortest route, if the route is known
+        self._eta = None
 
     # getters and setters
 
@@ -699,7 +2681,20 @@ class Shipment(Model):
         if not value:
             raise ValueError("Origin cannot be empty.")
 
-        self._origin = value
+        with self._lock.writing:
+            is_active = self.__is_active()
+            if is_active:
+                self.__remove_from_lane()
+
+            # https://docs.python.org/3/library/sys.html#sys.intern
+            # locations repeat a lot, so all shipments share one copy of each name
+            self._origin = sys.intern(value)
+
+            if is_active:
+                self.__add_to_lane()
+            if self.is_saved():
+                self.__route()
+            self._persist()
 
     def get_destination(self):
         return self._destination
@@ -708,37 +2703,81 @@ class Shipment(Model):
         if not value:
             raise ValueError("Destination cannot be empty.")
 
-        self._destination = value
+        with self._lock.writing:
+            is_active = self.__is_active()
+            if is_active:
+                self.__remove_from_lane()
+
+            self._destination = sys.intern(value)
+
+            if is_active:
+                self.__add_to_lane()
+            if self.is_saved():
+                self.__route()
+            self._persist()
 
     def get_weight(self):
         return self._weight
 
     def set_weight(self, value):
-        if not self.__is_valid_weight(value):
-            raise ValueError("Weight must be a positive number.")
+        with self._lock.writing:
+            if not self.__is_valid_weight(value):
+                raise ValueError("Weight must be a positive number.")
 
-        self._weight = value
+            if self._vehicle_id and not self.__has_capacity(self._vehicle_id, value):
+                raise ValueError("Vehicle " + self._vehicle_id + " does not have enough capacity for this weight.")
+
+            # keep the assigned vehicle's running load and the lane's total weight in sync
+            if self.__is_active():
+                self.__add_load(self._vehicle_id, float(value) - float(self._weight))
+                self._lane_totals[self.get_lane()][1] += float(value) - float(self._weight)
+
+            self._weight = float(value)
+            self._persist()
 
     def get_vehicle_id(self):
         return self._vehicle_id
 
     def set_vehicle_id(self, value):
-        if not self.__is_valid_vehicle_id(value):
-            raise ValueError("Invalid vehicle ID. Please select one from the vehicles list.")
+        with self._lock.writing:
+            if not self.__is_valid_vehicle_id(value):
+                raise ValueError("Invalid vehicle ID. Please select one from the vehicles list.")
+
+            if self._weight is not None and not self.__has_capacity(value, self._weight):
+                raise ValueError("Vehicle " + value + " does not have enough capacity for this shipment.")
+
+            is_reassigned = self.is_saved() and value != self._vehicle_id
+
+            if self.__is_active():
+                # move the shipment and its weight over to the new vehicle
+                self.__remove_from_vehicle()
+                self._vehicle_id = value
+                self.__add_to_vehicle()
+            else:
+                self._vehicle_id = value
+
+            self._persist()
 
-        self._vehicle_id = value
+            if is_reassigned:
+                self._events.append(self._object_id, ShipmentEvent.ASSIGNED, value)
 
     def get_customer_id(self):
         return self._customer_id
 
     def set_customer_id(self, value):
-        if not self.__is_valid_customer_id(value):
-            raise ValueError("Invalid customer ID. Please select one from the customers list.")
+        with self._lock.writing:
+            if not self.__is_valid_customer_id(value):
+                raise ValueError("Invalid customer ID. Please select one from the customers list.")
+
+            if self.is_saved():
+                self._customer_index.move(self._customer_id, value, self)
 
-        self._customer_id = value
+            self._customer_id = value
+            self._persist()
 
+    # returns the status label (e.g. 'In Transit') to keep the views unchanged
     def get_status(self):
-        return self._status
+        return self._status.value
 
     def get_delivery_date(self):
         if self._delivery_date:
@@ -746,15 +2785,302 @@ class Shipment(Model):
         else:
             return 'N/A'
 
+    # None if the route is unknown
+    def get_distance(self):
+        return self._distance
+
+    def get_eta(self):
+        if self._eta:
+            return self._eta.strftime('%c')
+        else:
+            return 'N/A'
+
+    # the normalised (origin, destination) pair, so ' sydney' and 'Sydney' are the same lane
+    def get_lane(self):
+        return (Shipment.normalise_location(self._origin), Shipment.normalise_location(self._destination))
+
+    # e.g. '  new   york ' -> 'New York'
+    @staticmethod
+    def normalise_location(value):
+        return ' '.join(value.split()).title()
+
     # other public methods
 
-    def mark_delivered(self):
-        if self._status == 'Delivered':
-            return False
+    # sets the RouteGraph used to work out the distance and ETA of shipments as they are saved
+    @staticmethod
+    def use_router(router):
+        Shipment._router = router
+
+    # the route is looked up before taking the lock, so slow searches don't block other threads
+    def save(self):
+        self.__route()
+        super().save()
+        self._events.append_many(self.__get_creation_events())
+        return True
+
+    @classmethod
+    def save_many(cls, instances, fields_checked=False):
+        instances = list(instances)
+        for instance in instances:
+            instance.__route()
+
+        super().save_many(instances, fields_checked)
+
+        events = []
+        for instance in instances:
+            events.extend(instance.__get_creation_events())
+        cls._events.append_many(events)
+
+        return instances
+
+    # records that the shipment has passed a location on its way
+    def add_checkpoint(self, location):
+        if not location:
+            raise ValueError("Location cannot be empty.")
+
+        if not self.is_saved():
+            raise ValueError("Shipment " + str(self._object_id) + " has not been saved.")
+
+        if self._status is ShipmentStatus.DELIVERED:
+            raise ValueError("Shipment " + self._object_id + " is already delivered.")
+
+        self._events.append(self._object_id, ShipmentEvent.CHECKPOINT, Shipment.normalise_location(location))
+
+    # returns [datetime, ShipmentEvent, detail] for each event, oldest first,
+    # optionally only from start up to and including end
+    def get_history(self, start=None, end=None):
+        return self._events.get_history(self._object_id, start, end)
+
+    # the shipments delivered from start up to and including end, in delivery order
+    @classmethod
+    def find_delivered_between(cls, start, end):
+        shipments = {}
+        for time, shipment_id, event, detail in cls._events.find(ShipmentEvent.DELIVERED, start, end):
+            shipment = cls.find_by_id(shipment_id)
+
+            # removed shipments keep their events
+            if shipment is not None:
+                shipments[shipment] = None
+
+        return list(shipments)
+
+    # the number of delivery scans from start up to and including end,
+    # unlike find_delivered_between() this includes shipments removed since
+    @classmethod
+    def count_delivered_between(cls, start, end):
+        return cls._events.count(ShipmentEvent.DELIVERED, start, end)
+
+    # the average time from creation to delivery as a timedelta, or None before the first delivery
+    @classmethod
+    def get_average_transit_time(cls):
+        return cls._events.get_average_transit_time()
+
+    # returns {shipment id: POSIX time it was created}, for shipments with a Created event
+    @classmethod
+    def get_creation_times(cls):
+        return cls._events.get_first_times(ShipmentEvent.CREATED)
+
+    # with a lazy storage backend the in-memory indexes only cover the loaded shipments,
+    # so the following lookups use the backend's indexed queries instead
+    # reading an in-memory index is a single atomic dict operation, so no lock is needed
+
+    @classmethod
+    def find_by_customer_id(cls, customer_id):
+        if cls._is_lazy():
+            return cls._load_all(Model._storage.find_by(cls, {'customer_id': customer_id}))
+
+        return cls._customer_index.get(customer_id)
+
+    @classmethod
+    def find_by_vehicle_id(cls, vehicle_id):
+        if cls._is_lazy():
+            where = {'vehicle_id': vehicle_id, 'status': ShipmentStatus.IN_TRANSIT.value}
+            return cls._load_all(Model._storage.find_by(cls, where))
+
+        return cls._vehicle_index.get(vehicle_id)
+
+    @classmethod
+    def get_vehicle_load(cls, vehicle_id):
+        if cls._is_lazy():
+            loads = getattr(cls._cached_loads, 'loads', None)
+
+            if loads is None:
+                return cls.__get_stored_loads([vehicle_id])[vehicle_id]
+
+            if vehicle_id not in loads:
+                loads.update(cls.__get_stored_loads([vehicle_id]))
+
+            return loads[vehicle_id]
+
+        return cls._vehicle_loads.get(vehicle_id, 0)
+
+    @classmethod
+    def find_by_status(cls, status):
+        if cls._is_lazy():
+            return cls._load_all(Model._storage.find_by(cls, {'status': status.value}))
+
+        return cls._status_index.get(status)
+
+    # O(1) since each status bucket keeps its own size
+    @classmethod
+    def count_by_status(cls, status):
+        if cls._is_lazy():
+            return Model._storage.count_by(cls, {'status': status.value})
+
+        return cls._status_index.count(status)
+
+    # the in-transit shipments on a lane, see get_lane()
+    @classmethod
+    def find_by_lane(cls, lane):
+        if cls._is_lazy():
+            return cls._load_all(Model._storage.find_by(cls, cls.__get_lane_where(lane)))
+
+        return cls._lane_index.get(lane)
+
+    # returns {vehicle id: [number of in-transit shipments on the lane, their total weight]}
+    # without loading the shipments (a lazy storage backend groups them with one indexed query)
+    @classmethod
+    def get_lane_vehicle_loads(cls, lane):
+        loads = {}
+
+        if cls._is_lazy():
+            for vehicle_id, count, weight in Model._storage.aggregate_by(cls, ['vehicle_id'], 'weight', cls.__get_lane_where(lane)):
+                loads[vehicle_id] = [count, weight]
+
+            return loads
+
+        with cls._lock.reading:
+            for shipment in cls._lane_index.get(lane):
+                load = loads.setdefault(shipment._vehicle_id, [0, 0])
+                load[0] += 1
+                load[1] += float(shipment._weight)
+
+        return loads
+
+    # returns {lane: [number of in-transit shipments, their total weight]}
+    # the totals are kept up to date as shipments are saved, changed and delivered,
+    # so nothing is scanned (by a lazy storage backend as well, see SQLiteStorage.get_totals())
+    @classmethod
+    def get_lane_totals(cls):
+        if cls._is_lazy():
+            in_transit = "status = '" + ShipmentStatus.IN_TRANSIT.value + "'"
+            sources = [[cls, cls._lane_columns, ['1', 'weight'], in_transit]]
+
+            totals = {}
+            for origin, destination, count, weight in Model._storage.get_totals('lane_totals', sources):
+                totals[(origin, destination)] = [count, weight]
+
+            return totals
+
+        with cls._lock.reading:
+            return {lane: list(total) for lane, total in cls._lane_totals.items()}
+
+    # the limit busiest lanes by in-transit weight, as [origin, destination, shipments, weight]
+    # https://docs.python.org/3/library/heapq.html#heapq.nlargest
+    @classmethod
+    def get_top_lanes(cls, limit=10):
+        totals = cls.get_lane_totals()
+
+        lanes = []
+        for lane in heapq.nlargest(limit, totals, key=lambda lane: totals[lane][1]):
+            lanes.append([lane[0], lane[1], totals[lane][0], totals[lane][1]])
+
+        return lanes
+
+    def to_record(self):
+        if self._delivery_date:
+            delivery_date = self._delivery_date.isoformat()
         else:
-            self._status = 'Delivered'
-            self._delivery_date = datetime.datetime.now()
-            return True
+            delivery_date = None
+
+        if self._eta:
+            eta = self._eta.isoformat()
+        else:
+            eta = None
+
+        return [self._object_id, self._origin, self._destination, float(self._weight),
+                self._vehicle_id, self._customer_id, self._status.value, delivery_date, self._distance, eta]
+
+    @classmethod
+    def from_record(cls, record):
+        shipment = cls(*record[:6])
+        shipment._status = ShipmentStatus(record[6])
+
+        if record[7]:
+            shipment._delivery_date = datetime.datetime.fromisoformat(record[7])
+
+        # records saved before routing was added end at the delivery date
+        if len(record) > 8:
+            shipment._distance = record[8]
+
+            if record[9]:
+                shipment._eta = datetime.datetime.fromisoformat(record[9])
+
+        return shipment
+
+    def mark_delivered(self):
+        with self._lock.writing:
+            if self._status is ShipmentStatus.DELIVERED:
+                return False
+            else:
+                self.__deliver(datetime.datetime.now())
+                self._persist()
+
+                if self.is_saved():
+                    self._events.append(self._object_id, ShipmentEvent.DELIVERED, None, self._delivery_date)
+                return True
+
+    # confirms many deliveries in one pass, e.g. a burst of proof-of-delivery scans.
+    # confirmations is an iterable of [shipment id, delivery time], where the time is a
+    # datetime, an ISO 8601 string or None for now. They are applied chunk_size at a time:
+    # each chunk takes the lock once and is written to the storage backend together.
+    # Returns [shipment id, DeliveryResult] for each confirmation, in the same order.
+    @classmethod
+    def mark_delivered_many(cls, confirmations, chunk_size=1000):
+        now = datetime.datetime.now()
+        confirmations = iter(confirmations)
+        results = []
+
+        while True:
+            chunk = list(itertools.islice(confirmations, chunk_size))
+            if not chunk:
+                break
+
+            delivered = []
+            events = []
+            with cls._lock.writing:
+                for shipment_id, time in chunk:
+                    shipment = cls.find_by_id(shipment_id)
+
+                    if shipment is None:
+                        results.append([shipment_id, DeliveryResult.UNKNOWN])
+                        continue
+
+                    # also catches the same id scanned twice in one batch
+                    if shipment._status is ShipmentStatus.DELIVERED:
+                        results.append([shipment_id, DeliveryResult.ALREADY_DELIVERED])
+                        continue
+
+                    if time is None or time == '':
+                        time = now
+                    elif isinstance(time, str):
+                        try:
+                            time = datetime.datetime.fromisoformat(time)
+                        except ValueError:
+                            results.append([shipment_id, DeliveryResult.INVALID_TIME])
+                            continue
+
+                    shipment.__deliver(time)
+                    delivered.append(shipment)
+                    events.append([shipment_id, ShipmentEvent.DELIVERED, None, time])
+                    results.append([shipment_id, DeliveryResult.DELIVERED])
+
+                if Model._storage is not None:
+                    Model._storage.update_many(delivered)
+
+            cls._events.append_many(events)
+
+        return results
 
     def validate(self):
         super().validate()
@@ -768,16 +3094,250 @@ class Shipment(Model):
         if not self.__is_valid_weight(self._weight):
             raise ValueError("Weight must be a positive number.")
 
+        self.__validate_assignment()
+
+    def validate_references(self):
+        super().validate_references()
+        self.__validate_assignment()
+
+    # protected methods
+
+    # the batch's vehicle loads are read from a lazy storage backend once instead of for every row,
+    # they can't change while save_many() holds the write lock
+    @classmethod
+    def _validate_batch(cls, instances, fields_checked=False):
+        with cls._cache_batch_lookups(instances):
+            return super()._validate_batch(instances, fields_checked)
+
+    # With a lazy storage backend, get_vehicle_load() answers from loads read once while the
+    # with block runs: the loads of the instances' vehicles with one grouped query, any other
+    # vehicle's the first time it is asked for. Outside save_many() another thread can change
+    # a load meanwhile, so __has_capacity() reads a cached load again (once per vehicle,
+    # tracked in checked) before rejecting a weight.
+    @classmethod
+    @contextlib.contextmanager
+    def _cache_batch_lookups(cls, instances=()):
+        if not cls._is_lazy():
+            yield
+            return
+
+        cache = cls._cached_loads
+        vehicle_ids = {instance._vehicle_id for instance in instances if instance._vehicle_id}
+        outer = getattr(cache, 'loads', None) is not None
+        if not outer:
+            cache.loads = {}
+            cache.checked = set()
+
+        cache.loads.update(cls.__get_stored_loads(vehicle_ids))
+        cache.checked.update(vehicle_ids)
+
+        try:
+            yield
+        finally:
+            if not outer:
+                cache.loads = None
+            else:
+                # saving the batch changes these loads, so the outer block reads them again
+                for vehicle_id in vehicle_ids:
+                    cache.loads.pop(vehicle_id, None)
+                    cache.checked.discard(vehicle_id)
+
+    # the capacity check in validate() only sees saved shipments,
+    # so the weight of earlier rows in the same batch is added here
+    def _validate_in_batch(self, batch):
+        pending_loads = batch.setdefault('pending_loads', {})
+        pending = pending_loads.get(self._vehicle_id, 0)
+        vehicle = Vehicle.find_by_id(self._vehicle_id)
+
+        if Shipment.get_vehicle_load(self._vehicle_id) + pending + float(self._weight) > int(vehicle.get_capacity()):
+            raise ValueError("Vehicle " + self._vehicle_id + " does not have enough capacity for this shipment.")
+
+        pending_loads[self._vehicle_id] = pending + float(self._weight)
+
+    @classmethod
+    def _get_query_indexes(cls, where):
+        indexes = super()._get_query_indexes(where)
+
+        if 'customer_id' in where:
+            customer_id = where['customer_id']
+            indexes.append(['customer_id', cls._customer_index.count(customer_id), lambda: cls._customer_index.get(customer_id)])
+
+        if 'status' in where:
+            status = ShipmentStatus(where['status'])
+            indexes.append(['status', cls._status_index.count(status), lambda: cls._status_index.get(status)])
+
+            # the vehicle index only holds in-transit shipments
+            if 'vehicle_id' in where and status is ShipmentStatus.IN_TRANSIT:
+                vehicle_id = where['vehicle_id']
+                indexes.append(['vehicle_id', cls._vehicle_index.count(vehicle_id), lambda: cls._vehicle_index.get(vehicle_id)])
+
+        return indexes
+
+    def _add_to_indexes(self):
+        self._customer_index.add(self._customer_id, self)
+        self._status_index.add(self._status, self)
+
+        if self._status is not ShipmentStatus.DELIVERED:
+            self.__add_to_vehicle()
+            self.__add_to_lane()
+
+    def _remove_from_indexes(self):
+        self._customer_index.remove(self._customer_id, self)
+        self._status_index.remove(self._status, self)
+
+        if self._status is not ShipmentStatus.DELIVERED:
+            self.__remove_from_vehicle()
+            self.__remove_from_lane()
+
+    # private methods
+
+    # returns {vehicle id: in-transit load} from a lazy storage backend, with one grouped
+    # query for every 500 vehicles (SQLite limits the number of values in a query)
+    @classmethod
+    def __get_stored_loads(cls, vehicle_ids):
+        vehicle_ids = list(vehicle_ids)
+        loads = dict.fromkeys(vehicle_ids, 0)
+
+        i = 0
+        while i < len(vehicle_ids):
+            where = {'vehicle_id': vehicle_ids[i:i + 500], 'status': ShipmentStatus.IN_TRANSIT.value}
+            for vehicle_id, count, weight in Model._storage.aggregate_by(cls, ['vehicle_id'], 'weight', where):
+                loads[vehicle_id] = weight
+            i += 500
+
+        return loads
+
+    # conditions for a lazy storage backend matching the in-transit shipments on the lane
+    @classmethod
+    def __get_lane_where(cls, lane):
+        return {cls._lane_columns[0]: lane[0], cls._lane_columns[1]: lane[1], 'status': ShipmentStatus.IN_TRANSIT.value}
+
+    # the vehicle and customer exist and the vehicle has room
+    def __validate_assignment(self):
         if not self.__is_valid_vehicle_id(self._vehicle_id):
             raise ValueError("Invalid vehicle ID. Please select one from the vehicles list.")
 
         if not self.__is_valid_customer_id(self._customer_id):
             raise ValueError("Invalid customer ID. Please select one from the customers list.")
 
-    # private methods
+        if not self.__has_capacity(self._vehicle_id, self._weight):
+            raise ValueError("Vehicle " + self._vehicle_id + " does not have enough capacity for this shipment.")
+
+    def __deliver(self, time):
+        if self.is_saved():
+            # a delivered shipment no longer takes up space on its vehicle or counts towards its lane
+            self.__remove_from_vehicle()
+            self.__remove_from_lane()
+            self._status_index.move(self._status, ShipmentStatus.DELIVERED, self)
+
+        self._status = ShipmentStatus.DELIVERED
+        self._delivery_date = time
+
+    # a new shipment is created and assigned to its vehicle at the same time
+    def __get_creation_events(self):
+        time = datetime.datetime.now()
+        return [[self._object_id, ShipmentEvent.CREATED, self._origin + ' -> ' + self._destination, time],
+                [self._object_id, ShipmentEvent.ASSIGNED, self._vehicle_id, time]]
+
+    # fills in the distance and ETA from the router, if there is one and it knows the route
+    def __route(self):
+        if Shipment._router is None or not self._origin or not self._destination:
+            return
+
+        self._distance = Shipment._router.get_distance(self._origin, self._destination)
+
+        if self._distance is None:
+            self._eta = None
+        else:
+            self._eta = Shipment._router.get_eta(self._distance)
+
+    # True if the shipment is saved and still counts towards its vehicle's load
+    def __is_active(self):
+        return self.is_saved() and self._status is not ShipmentStatus.DELIVERED
+
+    def __add_to_vehicle(self):
+        self._vehicle_index.add(self._vehicle_id, self)
+        self.__add_load(self._vehicle_id, float(self._weight))
+
+    def __remove_from_vehicle(self):
+        self._vehicle_index.remove(self._vehicle_id, self)
+
+        if self._vehicle_index.count(self._vehicle_id) == 0:
+            # take off whatever load is left (so the vehicle type's total goes down as well),
+            # then reset it instead of subtracting so float rounding errors don't accumulate
+            self.__add_load(self._vehicle_id, -self._vehicle_loads.get(self._vehicle_id, 0))
+            self._vehicle_loads.pop(self._vehicle_id, None)
+        else:
+            self.__add_load(self._vehicle_id, -float(self._weight))
+
+    def __add_load(self, vehicle_id, weight):
+        self._vehicle_loads[vehicle_id] = self._vehicle_loads.get(vehicle_id, 0) + weight
+
+        # the weight only counts towards a vehicle type while the vehicle exists, see Vehicle.get_type_totals()
+        vehicle = Vehicle._index.get(vehicle_id)
+        if vehicle is not None:
+            Vehicle._add_to_type_totals(vehicle.get_vehicle_type(), 0, 0, weight)
+
+    def __add_to_lane(self):
+        lane = self.get_lane()
+        self._lane_index.add(lane, self)
+
+        total = self._lane_totals.setdefault(lane, [0, 0])
+        total[0] += 1
+        total[1] += float(self._weight)
+
+    def __remove_from_lane(self):
+        lane = self.get_lane()
+        self._lane_index.remove(lane, self)
+
+        total = self._lane_totals[lane]
+        if total[0] == 1:
+            # drop the lane instead of subtracting so float rounding errors don't accumulate
+            del self._lane_totals[lane]
+        else:
+            total[0] -= 1
+            total[1] -= float(self._weight)
+
+    # O(1) capacity check using the vehicle's running load
+    def __has_capacity(self, vehicle_id, weight):
+        # a delivered shipment no longer counts against any vehicle's load,
+        # so correcting its weight or vehicle is always allowed
+        if self._status is ShipmentStatus.DELIVERED:
+            return True
+
+        vehicle = Vehicle.find_by_id(vehicle_id)
 
+        # an unknown vehicle is reported by __is_valid_vehicle_id instead
+        if vehicle is None:
+            return True
+
+        if self.__fits(vehicle, weight):
+            return True
+
+        # a load cached by _cache_batch_lookups() may be out of date, so it is read again
+        cache = Shipment._cached_loads
+        if getattr(cache, 'loads', None) is not None and vehicle_id not in cache.checked:
+            cache.checked.add(vehicle_id)
+            cache.loads.pop(vehicle_id, None)
+            return self.__fits(vehicle, weight)
+
+        return False
+
+    def __fits(self, vehicle, weight):
+        load = Shipment.get_vehicle_load(vehicle.get_id())
+
+        # don't count this shipment twice if it is already on the vehicle
+        if self.__is_active() and self._vehicle_id == vehicle.get_id():
+            load -= float(self._weight)
+
+        return load + float(weight) <= int(vehicle.get_capacity())
+
+    # the weight is entered as a string, so it is converted before checking
     def __is_valid_weight(self, weight):
-        return isinstance(weight, (int, float)) or weight > 0
+        try:
+            return float(weight) > 0
+        except (TypeError, ValueError):
+            return False
 
     def __is_valid_vehicle_id(self, vehicle_id):
         vehicle = Vehicle.find_by_id(vehicle_id)
@@ -795,53 +3355,786 @@ class Shipment(Model):
         else:
             return False
 
-class ShipmentsController(Controller):
-    def menu(self):
-        menu = Menu('Shipment Management',[[1, 'Create a new shipment'],
-                                           [2, 'Track a shipment'],
-                                           [3, 'View all shipments'],
-                                           [0, 'Quit shipment management',]])
+# A compact, column-oriented copy of many shipments.
+# Instead of one object per shipment, each attribute is kept in its own array:
+# weights and delivery dates as C doubles, and repeated strings (locations,
+# vehicle and customer ids) as integer codes into a shared string table.
+# Rows are read back as (unsaved) Shipment objects, so the usual getters still work.
+class ShipmentColumns:
+    _statuses_by_code = list(ShipmentStatus)
 
-        while True:
-            choice = menu.display()
+    def __init__(self):
+        self._ids = []
+        self._origins = array('I') # codes into _strings
+        self._destinations = array('I')
+        self._weights = array('d')
+        self._vehicle_ids = array('I')
+        self._customer_ids = array('I')
+        self._statuses = array('B') # position in the ShipmentStatus enum
+        self._delivery_dates = array('d') # POSIX timestamp, 0 if not delivered
+
+        self._strings = [] # code -> string
+        self._codes = {} # string -> code
 
-            print()
-            if choice == 1:
-                self.create_shipment()
-            elif choice == 2:
-                self.track_shipment()
-            elif choice == 3:
-                self.view_all_shipments()
-            elif choice == 0:
-                print('Quitting customer management...')
-                break
+    @classmethod
+    def from_shipments(cls, shipments):
+        columns = cls()
+        for shipment in shipments:
+            columns.append(shipment)
 
-    def create_shipment(self):
-        print('--| Create a Shipment |--')
-        print()
+        return columns
 
-        shipment = Shipment()
+    def append(self, shipment):
+        self._ids.append(shipment._object_id)
+        self._origins.append(self.__encode(shipment._origin))
+        self._destinations.append(self.__encode(shipment._destination))
+        self._weights.append(float(shipment._weight))
+        self._vehicle_ids.append(self.__encode(shipment._vehicle_id))
+        self._customer_ids.append(self.__encode(shipment._customer_id))
+        self._statuses.append(self._statuses_by_code.index(shipment._status))
 
-        next_id = 'S00' + str(Shipment.count() + 1)
-        print('Suggested shipment ID:', next_id)
-        self._get_valid_input('Enter shipment ID: ', shipment.set_id)
+        if shipment._delivery_date:
+            self._delivery_dates.append(shipment._delivery_date.timestamp())
+        else:
+            self._delivery_dates.append(0)
 
-        self._get_valid_input('Enter origin location: ', shipment.set_origin)
-        self._get_valid_input('Enter destination location: ', shipment.set_destination)
-        self._get_valid_input('Enter weight: ', shipment.set_weight)
+    def get_row(self, row):
+        shipment = Shipment(self._ids[row],
+                            self._strings[self._origins[row]],
+                            self._strings[self._destinations[row]],
+                            self._weights[row],
+                            self._strings[self._vehicle_ids[row]],
+                            self._strings[self._customer_ids[row]])
+        shipment._status = self._statuses_by_code[self._statuses[row]]
 
-        vehicles = Vehicle.get_all()
+        if self._delivery_dates[row]:
+            shipment._delivery_date = datetime.datetime.fromtimestamp(self._delivery_dates[row])
 
-        vehicle_data = []
-        for vehicle in vehicles:
-            vehicle_data.append([vehicle.get_id(), vehicle.get_vehicle_type(), vehicle.get_capacity()])
+        return shipment
 
-        if len(vehicle_data) > 0:
-            table = Table(['Vehicle ID', 'Type', 'Capacity'], vehicle_data)
-            table.display()
-        else:
-            print('No vehicles to display.')
-        self._get_valid_input('Enter vehicle ID: ', shipment.set_vehicle_id)
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        row = 0
+        while row < len(self._ids):
+            yield self.get_row(row)
+            row += 1
+
+    # private methods
+
+    # dictionary encoding: each distinct string is stored once
+    def __encode(self, value):
+        code = self._codes.get(value)
+
+        if code is None:
+            code = len(self._strings)
+            self._strings.append(value)
+            self._codes[value] = code
+
+        return code
+
+# Vectorised statistics for the heavy reports: weight distributions, transit time
+# percentiles per lane and volume per customer.
+# The shipments are snapshotted once into a ShipmentColumns, whose typed arrays NumPy
+# reads without copying (weights, status codes, dictionary codes for the locations,
+# vehicles and customers, delivery times), plus the creation times from the event log.
+# Each statistic is then a few array operations instead of a loop over Shipment objects.
+# The snapshot does not change as shipments are saved, take a new one to refresh it.
+# NumPy is optional and only needed here: pip install numpy
+# https://numpy.org/doc/stable/user/basics.indexing.html
+class ShipmentAnalytics:
+    # created_times holds the POSIX creation time of each row (nan if unknown)
+    def __init__(self, columns, created_times):
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('Shipment analytics need NumPy, install it with: pip install numpy') from None
+
+        self._numpy = numpy
+        self._strings = columns._strings
+        self._weights = self.__to_numpy(columns._weights)
+        self._statuses = self.__to_numpy(columns._statuses) # position in the ShipmentStatus enum
+        self._customer_ids = self.__to_numpy(columns._customer_ids)
+        self._delivery_dates = self.__to_numpy(columns._delivery_dates) # 0 if not delivered
+        self._created_times = self.__to_numpy(created_times)
+
+        # lanes are compared normalised (see Shipment.get_lane()), so each location code
+        # is mapped to the code of its normalised name
+        self._locations = [] # normalised location code -> name
+        location_codes = {}
+        normalised = []
+        for value in self._strings:
+            location = Shipment.normalise_location(value) if isinstance(value, str) else value
+            code = location_codes.get(location)
+
+            if code is None:
+                code = len(self._locations)
+                self._locations.append(location)
+                location_codes[location] = code
+
+            normalised.append(code)
+
+        normalised = numpy.array(normalised, dtype=numpy.int64)
+        origins = normalised[self.__to_numpy(columns._origins)]
+        destinations = normalised[self.__to_numpy(columns._destinations)]
+        self._lanes = origins * len(self._locations) + destinations # one number per lane
+
+    # snapshots the saved shipments (streamed, so a lazy storage backend is not loaded into memory)
+    @classmethod
+    def snapshot(cls):
+        columns = ShipmentColumns.from_shipments(Shipment.iter_all())
+
+        creation_times = Shipment.get_creation_times()
+        created_times = array('d')
+        for shipment_id in columns._ids:
+            created_times.append(creation_times.get(shipment_id, math.nan))
+
+        return cls(columns, created_times)
+
+    def __len__(self):
+        return len(self._weights)
+
+    # returns [lowest weight, highest weight, number of shipments] for each of bins equal width bins,
+    # optionally only over the shipments with the given ShipmentStatus
+    def get_weight_distribution(self, bins=10, status=None):
+        weights = self.__get_weights(status)
+        if len(weights) == 0:
+            return []
+
+        counts, edges = self._numpy.histogram(weights, bins)
+
+        distribution = []
+        for i in range(len(counts)):
+            distribution.append([float(edges[i]), float(edges[i + 1]), int(counts[i])])
+
+        return distribution
+
+    # returns the weight at each percentile, e.g. [median, 90th, 99th]
+    def get_weight_percentiles(self, percentiles=(50, 90, 99), status=None):
+        weights = self.__get_weights(status)
+        if len(weights) == 0:
+            return [None] * len(percentiles)
+
+        return [float(weight) for weight in self._numpy.percentile(weights, percentiles)]
+
+    # returns [origin, destination, delivered shipments, transit hours at each percentile...] per lane,
+    # busiest lane first, over the delivered shipments whose creation time is known
+    # percentiles interpolate linearly between the closest ranks, like numpy.percentile()
+    def get_transit_percentiles_by_lane(self, percentiles=(50, 90, 95)):
+        numpy = self._numpy
+
+        is_delivered = (self._delivery_dates > 0) & ~numpy.isnan(self._created_times)
+        if not is_delivered.any():
+            return []
+
+        # a backdated delivery scan can be earlier than the creation
+        hours = numpy.maximum(self._delivery_dates[is_delivered] - self._created_times[is_delivered], 0) / 3600
+        lanes = self._lanes[is_delivered]
+
+        # group the shipments by lane: each lane is then a run of equal lane numbers,
+        # starts[i] is where lane i starts
+        order = numpy.argsort(lanes, kind='stable')
+        hours = hours[order]
+        lanes = lanes[order]
+        starts = numpy.flatnonzero(numpy.r_[True, lanes[1:] != lanes[:-1]])
+        counts = numpy.diff(numpy.r_[starts, len(lanes)])
+
+        # then sort the transit times within each lane, in place, which is about 3x faster
+        # than sorting by lane and time together with numpy.lexsort()
+        for start, count in zip(starts, counts):
+            hours[start:start + count].sort()
+
+        columns = []
+        for percentile in percentiles:
+            rank = (counts - 1) * (percentile / 100)
+            lower = numpy.floor(rank).astype(numpy.int64)
+            upper = numpy.ceil(rank).astype(numpy.int64)
+            low_hours = hours[starts + lower]
+            columns.append(low_hours + (hours[starts + upper] - low_hours) * (rank - lower))
+
+        result = []
+        for i in numpy.argsort(-counts, kind='stable'):
+            origin, destination = divmod(int(lanes[starts[i]]), len(self._locations))
+            row = [self._locations[origin], self._locations[destination], int(counts[i])]
+
+            for column in columns:
+                row.append(float(column[i]))
+
+            result.append(row)
+
+        return result
+
+    # returns [customer id, number of shipments, total weight] per customer, largest total weight first
+    def get_volume_by_customer(self, limit=None):
+        numpy = self._numpy
+
+        if len(self._weights) == 0:
+            return []
+
+        counts = numpy.bincount(self._customer_ids, minlength=len(self._strings))
+        weights = numpy.bincount(self._customer_ids, weights=self._weights, minlength=len(self._strings))
+
+        customers = numpy.flatnonzero(counts)
+        customers = customers[numpy.argsort(-weights[customers], kind='stable')][:limit]
+
+        result = []
+        for code in customers:
+            result.append([self._strings[code], int(counts[code]), float(weights[code])])
+
+        return result
+
+    # private methods
+
+    def __get_weights(self, status):
+        if status is None:
+            return self._weights
+
+        return self._weights[self._statuses == list(ShipmentStatus).index(status)]
+
+    # shares the memory of a typed array instead of copying it
+    # https://numpy.org/doc/stable/reference/generated/numpy.frombuffer.html
+    def __to_numpy(self, values):
+        if len(values) == 0:
+            return self._numpy.zeros(0, dtype=values.typecode)
+
+        return self._numpy.frombuffer(values, dtype=values.typecode)
+
+# Assigns shipments to vehicles without going over any vehicle's capacity.
+# plan() uses first-fit decreasing: the heaviest shipments are placed first, each
+# in the first vehicle that still has room, with the vehicles ordered by remaining
+# capacity (largest first).
+# Shipments on the same lane (see Shipment.get_lane()) are consolidated: a shipment
+# goes on the vehicle last used for its lane, including vehicles already carrying
+# shipments on that lane, as long as it still has room.
+# The first vehicle with room is found in a tree of remaining capacities, where
+# each node holds the largest remaining capacity below it, so placing a shipment
+# takes O(log vehicles) instead of scanning the fleet.
+# https://en.wikipedia.org/wiki/First-fit-decreasing_bin_packing
+class LoadPlanner:
+    # vehicles defaults to the whole fleet, their current loads are taken into account
+    def __init__(self, vehicles=None):
+        if vehicles is None:
+            vehicles = Vehicle.get_all()
+
+        # [remaining capacity, vehicle id], largest remaining capacity first
+        self._vehicles = []
+        for vehicle in vehicles:
+            self._vehicles.append([float(vehicle.get_remaining_capacity()), vehicle.get_id()])
+        self._vehicles.sort(key=lambda item: item[0], reverse=True)
+
+        self._positions = {} # vehicle id -> position in self._vehicles
+        i = 0
+        while i < len(self._vehicles):
+            self._positions[self._vehicles[i][1]] = i
+            i += 1
+
+    # returns [assignments, unassigned]: assignments is a list of [shipment, vehicle id]
+    # and unassigned the shipments that don't fit in any vehicle.
+    # The shipments are not changed, e.g. pass unsaved Shipment objects and
+    # call set_vehicle_id() with the planned vehicle before saving them.
+    def plan(self, shipments):
+        tree, size = self.__build_tree()
+        lane_positions = {} # lane -> position of the vehicle last used for it
+        assignments = []
+        unassigned = []
+
+        for shipment in sorted(shipments, key=self.__sort_key):
+            weight = float(shipment.get_weight())
+            lane = shipment.get_lane()
+
+            if lane not in lane_positions:
+                lane_positions[lane] = self.__find_lane_vehicle(lane)
+
+            position = lane_positions[lane]
+            if position is not None and tree[size + position] >= weight:
+                node = size + position
+            elif tree[1] < weight:
+                # the root holds the largest remaining capacity of the fleet
+                unassigned.append(shipment)
+                continue
+            else:
+                # walk down to the first (leftmost) vehicle with enough room
+                node = 1
+                while node < size:
+                    node *= 2
+                    if tree[node] < weight:
+                        node += 1
+
+                lane_positions[lane] = node - size
+
+            assignments.append([shipment, self._vehicles[node - size][1]])
+
+            # update the remaining capacities on the way back up
+            tree[node] -= weight
+            node //= 2
+            while node >= 1:
+                tree[node] = max(tree[2 * node], tree[2 * node + 1])
+                node //= 2
+
+        return [assignments, unassigned]
+
+    # returns the id of the vehicle with the least room left that still fits the weight
+    # (best fit, which keeps the larger vehicles free), or None if none fits.
+    # With a lane, vehicles already carrying shipments on that lane are preferred.
+    def suggest_vehicle(self, weight, lane=None):
+        candidates = self.get_candidates(weight, lane, 1)
+
+        if not candidates:
+            return None
+
+        return candidates[0]
+
+    # returns the ids of up to limit vehicles that fit the weight, in the order
+    # suggest_vehicle() prefers them: the lane's vehicles first, then best fit
+    def get_candidates(self, weight, lane=None, limit=10):
+        weight = float(weight)
+        candidates = []
+
+        if lane is not None:
+            lane_vehicles = []
+            for vehicle_id in self.__get_lane_vehicle_ids(lane):
+                lane_vehicles.append(self._vehicles[self._positions[vehicle_id]])
+
+            candidates = self.__best_fits(lane_vehicles, weight, limit)
+
+        if len(candidates) < limit:
+            others = self.__best_fits(self._vehicles, weight, limit + len(candidates))
+            for vehicle_id in others:
+                if len(candidates) < limit and vehicle_id not in candidates:
+                    candidates.append(vehicle_id)
+
+        return candidates
+
+    # private methods
+
+    # ids of the limit vehicles with the least room left that still fit the weight
+    # https://docs.python.org/3/library/heapq.html#heapq.nsmallest
+    def __best_fits(self, vehicles, weight, limit):
+        fitting = [vehicle for vehicle in vehicles if vehicle[0] >= weight]
+
+        return [vehicle_id for remaining, vehicle_id in heapq.nsmallest(limit, fitting, key=lambda vehicle: vehicle[0])]
+
+    # ids of the planned vehicles already carrying in-transit shipments on the lane
+    def __get_lane_vehicle_ids(self, lane):
+        return [vehicle_id for vehicle_id in Shipment.get_lane_vehicle_loads(lane) if vehicle_id in self._positions]
+
+    # position of the vehicle on the lane with the most room left, or None
+    def __find_lane_vehicle(self, lane):
+        positions = [self._positions[vehicle_id] for vehicle_id in self.__get_lane_vehicle_ids(lane)]
+
+        if not positions:
+            return None
+
+        # sorted by remaining capacity, so the first position has the most room
+        return min(positions)
+
+    # a binary tree stored in an array: the leaves (from index size on) are the
+    # vehicles' remaining capacities and every other node is the max of its two children
+    def __build_tree(self):
+        size = 1
+        while size < len(self._vehicles):
+            size *= 2
+
+        # unused leaves get -1 so no shipment ever fits in them
+        tree = array('d', [-1.0]) * (2 * size)
+        i = 0
+        while i < len(self._vehicles):
+            tree[size + i] = self._vehicles[i][0]
+            i += 1
+
+        node = size - 1
+        while node >= 1:
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+            node -= 1
+
+        return [tree, size]
+
+    # heaviest first, then grouped by origin and destination
+    def __sort_key(self, shipment):
+        return (-float(shipment.get_weight()), shipment.get_origin() or '', shipment.get_destination() or '')
+
+# A road network of depots and locations for shortest-path routing.
+# Locations are joined by two-way roads with a length in km, and can have
+# coordinates (latitude, longitude) so searches can use A*.
+# Loaded from local CSV files:
+#   roads:     from,to,distance          e.g. Sydney,Canberra,286
+#   locations: name,latitude,longitude   e.g. Sydney,-33.87,151.21 (optional)
+# Location names are normalised like shipment lanes, see Shipment.normalise_location().
+#
+# Distances are cached: every pair that has been looked up is kept in an LRU cache,
+# and once an origin has been asked for hot_after times, the distances from it
+# to every location are computed in one go and cached as well.
+# https://en.wikipedia.org/wiki/A*_search_algorithm
+class RouteGraph:
+    _earth_radius = 6371.0 # km
+
+    def __init__(self, average_speed=60, cache_size=100000, hot_after=3, tree_cache_size=32):
+        self.average_speed = average_speed # km/h, used for ETAs
+
+        self._numbers = {} # location name -> number
+        self._names = [] # number -> location name
+        self._roads = [] # number -> list of [neighbour number, distance]
+        self._latitudes = array('d') # radians, nan if unknown
+        self._longitudes = array('d')
+        self._cosines = array('d') # cosine of the latitude, used by every estimate
+
+        self._cache_size = cache_size
+        self._pair_cache = {} # (origin, destination) numbers -> distance, least recently used first
+        self._hot_after = hot_after
+        self._origin_counts = {} # origin number -> lookups so far
+        self._tree_cache_size = tree_cache_size
+        self._tree_cache = {} # origin number -> distances to every location, least recently used first
+        self._lock = threading.Lock() # guards the caches
+
+    @classmethod
+    def load(cls, roads_path, locations_path=None, **options):
+        graph = cls(**options)
+
+        if locations_path:
+            with open(locations_path, newline='') as file:
+                for row in csv.DictReader(file):
+                    graph.add_location(row['name'], float(row['latitude']), float(row['longitude']))
+
+        with open(roads_path, newline='') as file:
+            for row in csv.DictReader(file):
+                graph.add_road(row['from'], row['to'], float(row['distance']))
+
+        return graph
+
+    def add_location(self, name, latitude=None, longitude=None):
+        number = self.__get_number(name)
+
+        if latitude is not None and longitude is not None:
+            self._latitudes[number] = math.radians(latitude)
+            self._longitudes[number] = math.radians(longitude)
+            self._cosines[number] = math.cos(self._latitudes[number])
+
+        return number
+
+    def add_road(self, origin, destination, distance):
+        if distance < 0:
+            raise ValueError('Road distance cannot be negative.')
+
+        origin = self.__get_number(origin)
+        destination = self.__get_number(destination)
+        self._roads[origin].append([destination, distance])
+        self._roads[destination].append([origin, distance])
+
+        # new roads can make cached routes shorter
+        with self._lock:
+            self._pair_cache = {}
+            self._tree_cache = {}
+
+    def has_location(self, name):
+        return Shipment.normalise_location(name) in self._numbers
+
+    def count_locations(self):
+        return len(self._names)
+
+    # returns the length of the shortest route in km, or None if there is no route
+    def get_distance(self, origin, destination):
+        origin = self._numbers.get(Shipment.normalise_location(origin))
+        destination = self._numbers.get(Shipment.normalise_location(destination))
+
+        if origin is None or destination is None:
+            return None
+
+        if origin == destination:
+            return 0.0
+
+        # roads go both ways, so (a, b) and (b, a) share a cache entry
+        key = (min(origin, destination), max(origin, destination))
+
+        with self._lock:
+            distance = self.__get_cached(key)
+            if distance is not False:
+                return distance
+
+            count = self._origin_counts.get(origin, 0) + 1
+            self._origin_counts[origin] = count
+
+        if count >= self._hot_after:
+            tree = self.__dijkstra(origin)
+            distance = tree[destination]
+
+            with self._lock:
+                self.__put(self._tree_cache, origin, tree, self._tree_cache_size)
+                self._origin_counts.pop(origin, None)
+        else:
+            distance = self.__a_star(origin, destination)[0]
+
+        if distance == math.inf:
+            distance = None
+
+        with self._lock:
+            self.__put(self._pair_cache, key, distance, self._cache_size)
+
+        return distance
+
+    # returns [distance, [location names along the route]], or None if there is no route
+    def get_route(self, origin, destination):
+        origin = self._numbers.get(Shipment.normalise_location(origin))
+        destination = self._numbers.get(Shipment.normalise_location(destination))
+
+        if origin is None or destination is None:
+            return None
+
+        distance, previous = self.__a_star(origin, destination)
+        if distance == math.inf:
+            return None
+
+        path = [self._names[destination]]
+        number = destination
+        while number != origin:
+            number = previous[number]
+            path.append(self._names[number])
+        path.reverse()
+
+        return [distance, path]
+
+    # estimated arrival after driving the distance at the average speed
+    def get_eta(self, distance, start=None):
+        if start is None:
+            start = datetime.datetime.now()
+
+        return start + datetime.timedelta(hours=distance / self.average_speed)
+
+    # private methods
+
+    def __get_number(self, name):
+        name = Shipment.normalise_location(name)
+        number = self._numbers.get(name)
+
+        if number is None:
+            number = len(self._names)
+            self._numbers[name] = number
+            self._names.append(name)
+            self._roads.append([])
+            self._latitudes.append(math.nan)
+            self._longitudes.append(math.nan)
+            self._cosines.append(math.nan)
+
+        return number
+
+    # returns the cached distance, or False if the pair isn't cached (None means no route)
+    def __get_cached(self, key):
+        if key in self._pair_cache:
+            # move to the end, the most recently used
+            distance = self._pair_cache.pop(key)
+            self._pair_cache[key] = distance
+            return distance
+
+        for origin, destination in [key, (key[1], key[0])]:
+            tree = self._tree_cache.get(origin)
+            if tree is not None:
+                distance = tree[destination]
+                if distance == math.inf:
+                    return None
+                return distance
+
+        return False
+
+    # dicts keep insertion order, so the first key is the least recently used
+    def __put(self, cache, key, value, size):
+        cache.pop(key, None)
+        cache[key] = value
+
+        if len(cache) > size:
+            del cache[next(iter(cache))]
+
+    # returns a function estimating the distance from a location to the goal: the
+    # great-circle distance, which no road between the two places can be shorter than
+    # https://en.wikipedia.org/wiki/Haversine_formula
+    def __get_estimate(self, goal):
+        latitudes = self._latitudes
+        longitudes = self._longitudes
+        cosines = self._cosines
+        goal_latitude = latitudes[goal]
+        goal_longitude = longitudes[goal]
+        goal_cosine = cosines[goal]
+        diameter = 2 * self._earth_radius
+        sin = math.sin
+
+        def estimate(number):
+            latitude = latitudes[number]
+
+            # nan compares unequal to itself: without coordinates the estimate is 0, as in Dijkstra
+            if latitude != latitude or goal_latitude != goal_latitude:
+                return 0.0
+
+            a = sin((goal_latitude - latitude) / 2) ** 2 + cosines[number] * goal_cosine * sin((goal_longitude - longitudes[number]) / 2) ** 2
+            return diameter * math.asin(math.sqrt(min(1.0, a)))
+
+        return estimate
+
+    # returns [distance, {location: previous location on the route}]
+    # queue entries that are out of date are skipped instead of removed from the heap
+    def __a_star(self, origin, goal):
+        estimate = self.__get_estimate(goal)
+        roads = self._roads
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+
+        distances = {origin: 0.0}
+        previous = {}
+        queue = [(estimate(origin), 0.0, origin)]
+
+        while queue:
+            total, distance, number = heappop(queue)
+
+            if number == goal:
+                return [distance, previous]
+
+            if distance > distances[number]:
+                continue
+
+            for neighbour, length in roads[number]:
+                new_distance = distance + length
+
+                if new_distance < distances.get(neighbour, math.inf):
+                    distances[neighbour] = new_distance
+                    previous[neighbour] = number
+                    heappush(queue, (new_distance + estimate(neighbour), new_distance, neighbour))
+
+        return [math.inf, previous]
+
+    # the distances from origin to every location (inf if unreachable)
+    # https://en.wikipedia.org/wiki/Dijkstra%27s_algorithm
+    def __dijkstra(self, origin):
+        distances = array('d', [math.inf]) * len(self._names)
+        distances[origin] = 0.0
+        queue = [(0.0, origin)]
+
+        while queue:
+            distance, number = heapq.heappop(queue)
+
+            if distance > distances[number]:
+                continue
+
+            for neighbour, length in self._roads[number]:
+                new_distance = distance + length
+
+                if new_distance < distances[neighbour]:
+                    distances[neighbour] = new_distance
+                    heapq.heappush(queue, (new_distance, neighbour))
+
+        return distances
+
+# Fleet and delivery statistics, read from running totals instead of scanning the shipments:
+# capacity and in-transit weight per vehicle type from Vehicle.get_type_totals(),
+# deliveries per day and the average transit time from the shipment event log.
+# Deliveries count delivery scans, so shipments removed since are still included.
+class Reports:
+    # returns the statistics as a dict, with the deliveries for each of the last days up to today
+    @staticmethod
+    def get_summary(days=7, today=None):
+        if today is None:
+            today = datetime.date.today()
+
+        vehicle_types = []
+        total_capacity = 0
+        total_weight = 0
+        for vehicle_type, totals in sorted(Vehicle.get_type_totals().items()):
+            vehicles, capacity, weight = totals
+
+            # leftovers of types no vehicle has any more
+            if vehicles == 0:
+                continue
+
+            vehicle_types.append([vehicle_type, vehicles, capacity, weight, Reports.__get_utilisation(weight, capacity)])
+            total_capacity += capacity
+            total_weight += weight
+
+        deliveries_per_day = []
+        for offset in range(days):
+            day = today - datetime.timedelta(days=offset)
+            start = datetime.datetime.combine(day, datetime.time.min)
+            end = datetime.datetime.combine(day, datetime.time.max)
+            deliveries_per_day.append([day, Shipment.count_delivered_between(start, end)])
+
+        return {'vehicle_types': vehicle_types,
+                'capacity': total_capacity,
+                'in_transit_weight': total_weight,
+                'utilisation': Reports.__get_utilisation(total_weight, total_capacity),
+                'deliveries_per_day': deliveries_per_day,
+                'average_transit_time': Shipment.get_average_transit_time()}
+
+    # private methods
+
+    # the share of the capacity in use, or None without any capacity
+    @staticmethod
+    def __get_utilisation(weight, capacity):
+        if capacity == 0:
+            return None
+
+        return weight / capacity
+
+class ShipmentsController(Controller):
+    def menu(self):
+        menu = Menu('Shipment Management',[[1, 'Create a new shipment'],
+                                           [2, 'Track a shipment'],
+                                           [3, 'View all shipments'],
+                                           [4, 'View top lanes'],
+                                           [0, 'Quit shipment management',]])
+
+        while True:
+            choice = menu.display()
+
+            print()
+            if choice == 1:
+                self.create_shipment()
+            elif choice == 2:
+                self.track_shipment()
+            elif choice == 3:
+                self.view_all_shipments()
+            elif choice == 4:
+                self.view_top_lanes()
+            elif choice == 0:
+                print('Quitting customer management...')
+                break
+
+    def create_shipment(self):
+        print('--| Create a Shipment |--')
+        print()
+
+        shipment = Shipment()
+
+        next_id = Shipment.next_id()
+        print('Suggested shipment ID:', next_id)
+        self._get_valid_input('Enter shipment ID: ', shipment.set_id)
+
+        self._get_valid_input('Enter origin location: ', shipment.set_origin)
+        self._get_valid_input('Enter destination location: ', shipment.set_destination)
+        self._get_valid_input('Enter weight: ', shipment.set_weight)
+
+        # only the vehicles the planner would pick are shown, not the whole fleet
+        candidates = LoadPlanner().get_candidates(shipment.get_weight(), shipment.get_lane())
+
+        vehicle_data = []
+        for vehicle_id in candidates:
+            vehicle = Vehicle.find_by_id(vehicle_id)
+            vehicle_data.append([vehicle.get_id(), vehicle.get_vehicle_type(), vehicle.get_capacity(),
+                                 vehicle.get_remaining_capacity()])
+
+        if len(vehicle_data) > 0:
+            print('Vehicles with enough capacity:')
+            table = Table(['Vehicle ID', 'Type', 'Capacity', 'Available'], vehicle_data)
+            table.display()
+
+        # no vehicle ID would be accepted, so go back to the menu instead of asking forever
+        if not candidates:
+            print()
+            print('No vehicle has enough capacity for this shipment.')
+            return
+
+        suggested_id = candidates[0]
+        print('Suggested vehicle ID:', suggested_id, '(press Enter to use it)')
+
+        def set_vehicle_id(value):
+            shipment.set_vehicle_id(value or suggested_id)
+
+        self._get_valid_input('Enter vehicle ID: ', set_vehicle_id)
 
         self._get_valid_input('Enter customer ID: ', shipment.set_customer_id)
 
@@ -863,6 +4156,18 @@ class ShipmentsController(Controller):
         print()
         if shipment:
             print('Status of the shipment', shipment_id, 'is:', shipment.get_status())
+
+            if shipment.get_distance() is not None:
+                print('Distance:', round(shipment.get_distance(), 1), 'km, estimated arrival:', shipment.get_eta())
+
+            history_data = []
+            for time, event, detail in shipment.get_history():
+                history_data.append([time.strftime('%c'), event.value, detail or ''])
+
+            if len(history_data) > 0:
+                print()
+                table = Table(['Time', 'Event', 'Details'], history_data)
+                table.display()
         else:
             print('Sorry, cannot find a shipment with ID:', shipment_id)
 
@@ -870,31 +4175,41 @@ class ShipmentsController(Controller):
         print('--| View all Shipments |--')
         print()
 
-        shipments = Shipment.get_all()
+        # rows are generated as the pages are displayed
+        shipment_data = ([shipment.get_id(),
+                          shipment.get_origin(),
+                          shipment.get_destination(),
+                          shipment.get_weight(),
+                          shipment.get_vehicle_id(),
+                          shipment.get_customer_id(),
+                          shipment.get_status(),
+                          shipment.get_delivery_date()] for shipment in Shipment.iter_all())
+
+        table = PagedTable(['Shipment ID', 'Origin', 'Destination', 'Weight', 'Vehicle', 'Customer', 'Status', 'Delivery Date'], shipment_data,
+                           empty_message='No shipments to display.')
+        table.browse()
+
+    # in-transit volume per origin -> destination lane, busiest first
+    def view_top_lanes(self):
+        print('--| View top Lanes |--')
+        print()
 
-        shipment_data = []
-        for shipment in shipments:
-            shipment_data.append([shipment.get_id(),
-                                  shipment.get_origin(),
-                                  shipment.get_destination(),
-                                  shipment.get_weight(),
-                                  shipment.get_vehicle_id(),
-                                  shipment.get_customer_id(),
-                                  shipment.get_status(),
-                                  shipment.get_delivery_date()])
-
-        table = Table(['Shipment ID', 'Origin', 'Destination', 'Weight', 'Vehicle', 'Customer', 'Status', 'Delivery Date'], shipment_data)
-        table.display()
+        lane_data = Shipment.get_top_lanes(10)
 
-        print()
-        prompt = ''
-        while not prompt == 'exit':
-            prompt = input("Enter 'exit' to go back: ")
+        if len(lane_data) > 0:
+            table = Table(['Origin', 'Destination', 'Shipments', 'Weight'], lane_data)
+            table.display()
+        else:
+            print('No shipments in transit.')
 
 class DeliveriesController(Controller):
     def menu(self):
         menu = Menu('Delivery Management',[[1, 'Mark shipment delivery'],
                                            [2, 'View delivery status for a shipment'],
+                                           [3, 'View shipments in transit'],
+                                           [4, 'Record a checkpoint'],
+                                           [5, 'View deliveries between two dates'],
+                                           [6, 'Confirm deliveries in bulk'],
                                            [0, 'Quit shipment management',]])
 
         while True:
@@ -905,6 +4220,14 @@ class DeliveriesController(Controller):
                 self.mark_shipment_delivered()
             elif choice == 2:
                 self.view_delivery_status()
+            elif choice == 3:
+                self.view_in_transit_shipments()
+            elif choice == 4:
+                self.record_checkpoint()
+            elif choice == 5:
+                self.view_deliveries_between()
+            elif choice == 6:
+                self.confirm_deliveries()
             elif choice == 0:
                 print('\nQuitting delivery management...')
                 break
@@ -943,18 +4266,1427 @@ class DeliveriesController(Controller):
         else:
             print('Sorry, cannot find a shipment with ID:', shipment_id)
 
+    def view_in_transit_shipments(self):
+        print('--| View Shipments in Transit |--')
+        print()
+
+        print('In transit:', Shipment.count_by_status(ShipmentStatus.IN_TRANSIT),
+              '| Delivered:', Shipment.count_by_status(ShipmentStatus.DELIVERED))
+        print()
+
+        # uses the status index so delivered shipments are never visited
+        shipments = Shipment.find_by_status(ShipmentStatus.IN_TRANSIT)
+
+        shipment_data = ([shipment.get_id(),
+                          shipment.get_origin(),
+                          shipment.get_destination(),
+                          shipment.get_weight(),
+                          shipment.get_vehicle_id(),
+                          shipment.get_customer_id()] for shipment in shipments)
+
+        table = PagedTable(['Shipment ID', 'Origin', 'Destination', 'Weight', 'Vehicle', 'Customer'], shipment_data,
+                           empty_message='No shipments in transit.')
+        table.browse()
+
+    # e.g. pasted from a barcode scanner, one shipment ID per line
+    def confirm_deliveries(self):
+        print('--| Confirm Deliveries in Bulk |--')
+        print()
+        print('Enter one shipment ID per line, optionally followed by a comma and the delivery time')
+        print('(e.g. S001,2024-05-01 09:30). Enter an empty line to finish.')
+        print()
+
+        confirmations = []
+        while True:
+            line = input().strip()
+            if not line:
+                break
+
+            shipment_id, _, time = line.partition(',')
+            confirmations.append([shipment_id.strip(), time.strip()])
+
+        results = Shipment.mark_delivered_many(confirmations)
+
+        counts = {}
+        problem_data = []
+        for shipment_id, result in results:
+            counts[result] = counts.get(result, 0) + 1
+
+            if result is not DeliveryResult.DELIVERED:
+                problem_data.append([shipment_id, result.value])
+
+        print()
+        print('Delivered:', counts.get(DeliveryResult.DELIVERED, 0),
+              '| Already delivered:', counts.get(DeliveryResult.ALREADY_DELIVERED, 0),
+              '| Unknown:', counts.get(DeliveryResult.UNKNOWN, 0),
+              '| Invalid time:', counts.get(DeliveryResult.INVALID_TIME, 0))
+
+        if len(problem_data) > 0:
+            print()
+            table = PagedTable(['Shipment ID', 'Result'], problem_data)
+            table.browse()
+
+    def record_checkpoint(self):
+        print('--| Record a Checkpoint |--')
+        print()
+
+        shipment_id = input('Enter shipment ID: ')
+        shipment = Shipment.find_by_id(shipment_id)
+
+        print()
+        if shipment:
+            try:
+                shipment.add_checkpoint(input('Enter checkpoint location: '))
+                print()
+                print('Checkpoint recorded for shipment', shipment_id + '.')
+            except ValueError as e:
+                print(e)
+        else:
+            print('Sorry, cannot find a shipment with ID:', shipment_id)
+
+    def view_deliveries_between(self):
+        print('--| View Deliveries between two Dates |--')
+        print()
+
+        try:
+            start = datetime.datetime.strptime(input('Enter start date (dd/mm/yyyy): '), '%d/%m/%Y')
+            end = datetime.datetime.strptime(input('Enter end date (dd/mm/yyyy): '), '%d/%m/%Y')
+        except ValueError:
+            print('\nInvalid date. Please use the format dd/mm/yyyy.')
+            return
+
+        # the end date is included
+        end = datetime.datetime.combine(end.date(), datetime.time.max)
+
+        shipment_data = ([shipment.get_id(),
+                          shipment.get_origin(),
+                          shipment.get_destination(),
+                          shipment.get_customer_id(),
+                          shipment.get_delivery_date()] for shipment in Shipment.find_delivered_between(start, end))
+
+        print()
+        table = PagedTable(['Shipment ID', 'Origin', 'Destination', 'Customer', 'Delivery Date'], shipment_data,
+                           empty_message='No shipments delivered between these dates.')
+        table.browse()
+
+class ReportsController(Controller):
+    def menu(self):
+        print('--| Reports |--')
+        print()
+
+        summary = Reports.get_summary()
+
+        vehicle_data = []
+        for vehicle_type, vehicles, capacity, weight, utilisation in summary['vehicle_types']:
+            vehicle_data.append([vehicle_type, vehicles, capacity, weight, self.__format_percent(utilisation)])
+
+        if len(vehicle_data) > 0:
+            table = Table(['Vehicle Type', 'Vehicles', 'Capacity', 'Weight In Transit', 'Utilisation'], vehicle_data)
+            table.display()
+        else:
+            print('No vehicles to display.')
+
+        print()
+        print('Fleet utilisation:', self.__format_percent(summary['utilisation']),
+              '(' + str(summary['in_transit_weight']) + ' of ' + str(summary['capacity']) + ')')
+
+        print()
+        table = Table(['Date', 'Deliveries'], [[day.isoformat(), count] for day, count in summary['deliveries_per_day']])
+        table.display()
+
+        print()
+        transit_time = summary['average_transit_time']
+        if transit_time is None:
+            print('Average transit time: N/A')
+        else:
+            # whole seconds are enough
+            print('Average transit time:', datetime.timedelta(seconds=round(transit_time.total_seconds())))
+
+    # private methods
+
+    def __format_percent(self, fraction):
+        if fraction is None:
+            return 'N/A'
+
+        return format(fraction * 100, '.1f') + '%'
+
+# Non-interactive import of vehicles, customers or shipments from a CSV or
+# JSON-lines file (chosen by the file extension).
+# The file is read one row at a time and every value goes through the same
+# setter (and validation) as when it is typed in, the rows are then saved in
+# chunks with save_many(), so memory use doesn't grow with the file size.
+# The columns are "id" followed by the model's _columns that have a setter,
+# e.g. id,vehicle_type,capacity for vehicles. Rows with an empty or missing
+# id get a new one from the model's IdSequence.
+# Rejected rows are written to error_path as JSON lines with the reason.
+# https://docs.python.org/3/library/csv.html
+# With workers > 1 the file is split into byte ranges (shard_size bytes, ending at a line break)
+# parsed by a process pool: each worker runs the setters of the model's _independent_columns,
+# which only check the values themselves (e.g. the customer's date of birth, address,
+# phone and email). The ids, the setters that look up other instances (e.g. a shipment's
+# vehicle), the uniqueness checks and saving stay in this process, in file order.
+# Each row must be on one line (no line breaks inside quoted CSV values).
+# https://docs.python.org/3/library/concurrent.futures.html#processpoolexecutor
+class Importer:
+    def __init__(self, model, chunk_size=10000, error_path=None, workers=1, shard_size=4194304):
+        self.model = model
+        self.chunk_size = chunk_size
+        self.error_path = error_path
+        self.workers = workers
+        self.shard_size = shard_size
+
+        self._fields = model.get_setters()
+        self._new_ids = iter(()) # ids reserved for rows without one
+        self._fieldnames = None # the header of a .csv file, when imported with workers
+
+    # imports a file and returns a summary dict (rows, imported, rejected, seconds, rows_per_second)
+    def import_file(self, path):
+        start = time.perf_counter()
+        summary = {'rows': 0, 'imported': 0, 'rejected': 0}
+
+        error_file = None
+        if self.error_path:
+            error_file = open(self.error_path, 'w')
+
+        try:
+            if self.workers > 1:
+                instances = self._build_parallel(path, summary, error_file)
+            else:
+                instances = self._build(self._read(path), summary, error_file)
+
+            while True:
+                # lookups made by the setters and save_many() are cached for the chunk,
+                # e.g. a shipment's vehicle load is read once instead of for every row
+                with self.model._cache_batch_lookups():
+                    # https://docs.python.org/3/library/itertools.html#itertools.islice
+                    chunk = list(itertools.islice(instances, self.chunk_size))
+                    if not chunk:
+                        break
+
+                    self.__save_chunk(chunk, summary, error_file)
+        finally:
+            if error_file:
+                error_file.close()
+
+        summary['seconds'] = time.perf_counter() - start
+        if summary['seconds'] > 0:
+            summary['rows_per_second'] = round(summary['rows'] / summary['seconds'])
+        else:
+            summary['rows_per_second'] = summary['rows']
+
+        return summary
+
+    # protected methods
+
+    # yields [line number, row dict] for each row in the file
+    def _read(self, path):
+        with open(path, newline='') as file:
+            if path.endswith('.csv'):
+                line = 2 # line 1 is the header
+                for row in csv.DictReader(file):
+                    yield [line, row]
+                    line += 1
+            else:
+                line = 1
+                for text in file:
+                    if text.strip():
+                        yield [line, json.loads(text)]
+                    line += 1
+
+    # yields [line number, row, instance] for each row that passes the setters
+    def _build(self, rows, summary, error_file):
+        for line, row in rows:
+            summary['rows'] += 1
+            instance = self.model()
+
+            try:
+                self.__set_fields(instance, row, self._fields)
+            except (ValueError, TypeError, AttributeError) as e:
+                self.__reject(line, row, e, summary, error_file)
+                continue
+
+            yield [line, row, instance]
+
+    # like _build(), with the parsing and the independent setters done by a process pool
+    # rows are passed around as their line of text, and only parsed again here if rejected
+    def _build_parallel(self, path, summary, error_file):
+        independent_columns = self.model._independent_columns
+
+        start = 0
+        first_line = 1
+        if path.endswith('.csv'):
+            with open(path, 'rb') as file:
+                self._fieldnames = next(csv.reader([file.readline().decode()]))
+                start = file.tell()
+            first_line = 2
+
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            # a few shards per worker are in flight, so the results of a large file don't pile up
+            pending = []
+            shards = self.__get_shards(path, start)
+
+            while True:
+                for shard_start, shard_end in itertools.islice(shards, self.workers * 2 - len(pending)):
+                    pending.append(executor.submit(Importer._parse_shard, self.model, path, shard_start, shard_end, self._fieldnames))
+
+                if not pending:
+                    break
+
+                line_count, results = pending.pop(0).result()
+
+                for line, text, values, error in results:
+                    summary['rows'] += 1
+                    line += first_line
+
+                    if error is not None:
+                        self.__reject(line, text, error, summary, error_file)
+                        continue
+
+                    instance = self.model()
+
+                    try:
+                        for field, value in zip(self._fields, values):
+                            column, setter = field
+
+                            if column == 'id':
+                                # the worker checked the format, save_many() checks that it is unique
+                                if value:
+                                    self.model._id_sequence.observe(value)
+                                else:
+                                    value = self.__next_id()
+
+                                instance._object_id = value
+                            elif column in independent_columns:
+                                # already checked by the worker's setter
+                                setattr(instance, '_' + column, value)
+                            else:
+                                getattr(instance, setter)(value)
+                    except (ValueError, TypeError, AttributeError) as e:
+                        self.__reject(line, text, e, summary, error_file)
+                        continue
+
+                    yield [line, text, instance]
+
+                first_line += line_count
+
+    # Runs in a worker process: parses the lines from byte start up to end, checks the id format
+    # and runs the setters of the model's _independent_columns on each row.
+    # Returns [number of lines, [line within the shard, text of the row, values, error] for each row],
+    # values has one value per setter (the value set for the independent columns,
+    # the text for the others), or is None if the row was rejected.
+    @staticmethod
+    def _parse_shard(model, path, start, end, fieldnames):
+        with open(path, 'rb') as file:
+            file.seek(start)
+            lines = file.read(end - start).decode().split('\n')
+
+        # the shard ends with a line break, after which split() leaves an empty string
+        if lines[-1] == '':
+            lines.pop()
+
+        fields = model.get_setters()
+        results = []
+        line = 0
+        while line < len(lines):
+            text = lines[line]
+
+            if text.strip():
+                instance = model()
+                values = []
+
+                try:
+                    row = Importer._parse_row(text, fieldnames)
+
+                    for column, setter in fields:
+                        value = row.get(column)
+
+                        if value is not None:
+                            value = str(value)
+
+                        if column == 'id':
+                            if value and not model._id_regex.search(value):
+                                raise ValueError('Invalid ID. Please follow the pattern: ' + model._id_pattern)
+                        elif column in model._independent_columns:
+                            getattr(instance, setter)(value)
+                            value = getattr(instance, '_' + column)
+
+                        values.append(value)
+                except (ValueError, TypeError, AttributeError) as e:
+                    results.append([line, text, None, str(e)])
+                    line += 1
+                    continue
+
+                results.append([line, text, values, None])
+
+            line += 1
+
+        return [len(lines), results]
+
+    # parses one line of a .csv file (given its header) or a JSON lines file
+    @staticmethod
+    def _parse_row(text, fieldnames):
+        if fieldnames is None:
+            return json.loads(text)
+
+        return dict(zip(fieldnames, next(csv.reader([text]))))
+
+    # private methods
+
+    # calls the setters with the row's values
+    def __set_fields(self, instance, row, fields):
+        for column, setter in fields:
+            value = row.get(column)
+
+            # setters expect text, just like input() returns
+            if value is not None:
+                value = str(value)
+
+            # rows without an id get a new one
+            if column == 'id' and not value:
+                value = self.__next_id()
+
+            getattr(instance, setter)(value)
+
+        # so later rows without an id don't get the one given in this row
+        self.model._id_sequence.observe(instance.get_id())
+
+    # yields [start, end] byte ranges of about shard_size bytes, each ending after a line break
+    def __get_shards(self, path, start):
+        size = os.path.getsize(path)
+
+        with open(path, 'rb') as file:
+            while start < size:
+                file.seek(min(start + self.shard_size, size))
+                file.readline()
+                end = file.tell()
+
+                yield [start, end]
+                start = end
+
+    # new ids are reserved a chunk at a time, so a large import
+    # only writes the id sequence to the storage backend once per chunk
+    def __next_id(self):
+        value = next(self._new_ids, None)
+
+        if value is None:
+            self._new_ids = iter(self.model.reserve_ids(self.chunk_size))
+            value = next(self._new_ids)
+
+        return value
+
+    # saves a chunk with save_many(), rows rejected by the batch validation are
+    # reported and the rest of the chunk is saved again
+    def __save_chunk(self, chunk, summary, error_file):
+        while chunk:
+            instances = []
+            for line, row, instance in chunk:
+                instances.append(instance)
+
+            try:
+                # the setters have checked every field, so only the uniqueness and references are checked again
+                self.model.save_many(instances, fields_checked=True)
+                summary['imported'] += len(instances)
+                break
+            except BulkSaveError as e:
+                rejected_rows = set()
+                for error in e.errors:
+                    line, row, instance = chunk[error[0] - 1]
+                    self.__reject(line, row, error[2], summary, error_file)
+                    rejected_rows.add(error[0] - 1)
+
+                remaining = []
+                i = 0
+                while i < len(chunk):
+                    if i not in rejected_rows:
+                        remaining.append(chunk[i])
+                    i += 1
+                chunk = remaining
+
+    def __reject(self, line, row, error, summary, error_file):
+        summary['rejected'] += 1
+
+        # the text of a row parsed by a worker
+        if isinstance(row, str):
+            row = self._parse_row(row, self._fieldnames)
+
+        if error_file:
+            error_file.write(json.dumps({'line': line, 'error': str(error).strip(), 'row': row}) + '\n')
+
+# Streams vehicles, customers or shipments to a file, one row at a time,
+# in the format given by the file extension:
+#   .csv   - header "id" + the model's _columns, readable by Importer
+#   .jsonl - one JSON object per line
+#   .col   - compact columnar binary format, see __write_columnar()
+# instances defaults to model.iter_all(), but any iterable (e.g. an indexed
+# query such as Shipment.find_by_status(...)) can be passed instead.
+class Exporter:
+    _magic = b'TLSCOL1\n'
+
+    def __init__(self, model, buffer_size=1048576, group_size=65536, dictionary_size=65536):
+        self.model = model
+        self.buffer_size = buffer_size # bytes buffered before each write to disk
+        self.group_size = group_size # rows per group in the columnar format
+        self.dictionary_size = dictionary_size # most entries in a column's dictionary in the columnar format
+        self.columns = ['id'] + model._columns
+
+    # writes the file and returns the number of rows exported
+    def export_file(self, path, instances=None):
+        if instances is None:
+            instances = self.model.iter_all()
+
+        records = (instance.to_record() for instance in instances)
+
+        if path.endswith('.csv'):
+            return self.__write_csv(path, records)
+        elif path.endswith('.jsonl'):
+            return self.__write_jsonl(path, records)
+        elif path.endswith('.col'):
+            return self.__write_columnar(path, records)
+        else:
+            raise ValueError('Unsupported export format. Please use .csv, .jsonl or .col')
+
+    # yields the records (lists of column values) stored in a .col file
+    @classmethod
+    def read_columnar(cls, path):
+        with open(path, 'rb') as file:
+            if file.read(len(cls._magic)) != cls._magic:
+                raise ValueError('Not a columnar export file: ' + path)
+
+            header = json.loads(file.readline())
+            dictionaries = [] # one per column, grows with every group until it is reset
+            for column in header['columns']:
+                dictionaries.append([])
+
+            while True:
+                size = file.read(4)
+                if not size:
+                    break
+
+                group = json.loads(file.read(int.from_bytes(size, 'little')))
+                columns = []
+                i = 0
+                for column in group['columns']:
+                    data = file.read(column['size'])
+                    columns.append(cls.__decode(column, data, dictionaries[i], header['byteorder'], group['rows']))
+                    i += 1
+
+                row = 0
+                while row < group['rows']:
+                    record = []
+                    for values in columns:
+                        record.append(values[row])
+                    yield record
+                    row += 1
+
+    # private methods
+
+    def __write_csv(self, path, records):
+        count = 0
+        with open(path, 'w', newline='', buffering=self.buffer_size) as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+
+            while True:
+                chunk = list(itertools.islice(records, self.group_size))
+                if not chunk:
+                    break
+
+                writer.writerows(chunk)
+                count += len(chunk)
+
+        return count
+
+    def __write_jsonl(self, path, records):
+        count = 0
+        with open(path, 'w', buffering=self.buffer_size) as file:
+            for record in records:
+                file.write(json.dumps(dict(zip(self.columns, record))) + '\n')
+                count += 1
+
+        return count
+
+    # File layout:
+    #   magic, then a JSON header line {"columns": [...], "byteorder": ...}
+    #   then one block per group of up to group_size rows:
+    #     4 byte little endian length + JSON group header {"rows": n, "columns": [...]}
+    #     followed by the encoded data of each column
+    # Each column of a group is encoded as one of:
+    #   float      - array of doubles, with "nulls" set None is stored as nan
+    #   dictionary - array of unsigned int codes, the dictionary is shared by the following
+    #                groups and each group only carries its new entries (e.g. statuses,
+    #                vehicle types and locations are stored once), with "reset" set the
+    #                group starts a new one, so it never has more than dictionary_size entries
+    #   plain      - array of utf-8 lengths (-1 for None) followed by the text
+    def __write_columnar(self, path, records):
+        count = 0
+        dictionaries = [] # per column: value -> code
+        for column in self.columns:
+            dictionaries.append({})
+
+        with open(path, 'wb', buffering=self.buffer_size) as file:
+            file.write(self._magic)
+            file.write((json.dumps({'columns': self.columns, 'byteorder': sys.byteorder}) + '\n').encode())
+
+            while True:
+                rows = list(itertools.islice(records, self.group_size))
+                if not rows:
+                    break
+
+                headers = []
+                payloads = []
+                i = 0
+                while i < len(self.columns):
+                    values = [row[i] for row in rows]
+                    header, payload = self.__encode(values, dictionaries[i])
+                    headers.append(header)
+                    payloads.append(payload)
+                    i += 1
+
+                group = json.dumps({'rows': len(rows), 'columns': headers}).encode()
+                file.write(len(group).to_bytes(4, 'little'))
+                file.write(group)
+                for payload in payloads:
+                    file.write(payload)
+
+                count += len(rows)
+
+        return count
+
+    def __encode(self, values, dictionary):
+        is_numeric = False
+        has_nulls = False
+        for value in values:
+            if value is None:
+                has_nulls = True
+            elif not isinstance(value, (int, float)) or isinstance(value, bool):
+                is_numeric = False
+                break
+            else:
+                is_numeric = True
+
+        if is_numeric:
+            # missing values (e.g. an unknown distance) are stored as nan
+            if has_nulls:
+                values = [math.nan if value is None else value for value in values]
+
+            payload = array('d', values).tobytes()
+            return {'encoding': 'float', 'size': len(payload), 'nulls': has_nulls}, payload
+
+        # decided for each group: the dictionary is used when the group's values repeat
+        distinct = set(values)
+        if len(distinct) <= len(values) // 2 and len(distinct) <= self.dictionary_size:
+            # start again rather than let the dictionary grow past dictionary_size
+            is_reset = len(dictionary) + len(distinct.difference(dictionary)) > self.dictionary_size
+            if is_reset:
+                dictionary.clear()
+
+            new_entries = []
+            codes = array('I')
+            for value in values:
+                code = dictionary.get(value)
+                if code is None:
+                    code = len(dictionary)
+                    dictionary[value] = code
+                    new_entries.append(value)
+                codes.append(code)
+
+            payload = codes.tobytes()
+            return {'encoding': 'dictionary', 'size': len(payload), 'new_entries': new_entries, 'reset': is_reset}, payload
+
+        lengths = array('i')
+        texts = []
+        for value in values:
+            if value is None:
+                lengths.append(-1)
+            else:
+                text = str(value).encode()
+                lengths.append(len(text))
+                texts.append(text)
+
+        payload = lengths.tobytes() + b''.join(texts)
+        return {'encoding': 'plain', 'size': len(payload)}, payload
+
+    @staticmethod
+    def __decode(column, data, dictionary, byteorder, rows):
+        if column['encoding'] == 'float':
+            values = array('d')
+            values.frombytes(data)
+            if byteorder != sys.byteorder:
+                values.byteswap()
+
+            # nan compares unequal to itself
+            if column.get('nulls'):
+                return [None if value != value else value for value in values]
+            return values
+
+        if column['encoding'] == 'dictionary':
+            if column.get('reset'):
+                del dictionary[:]
+            dictionary.extend(column['new_entries'])
+            codes = array('I')
+            codes.frombytes(data)
+            if byteorder != sys.byteorder:
+                codes.byteswap()
+            return [dictionary[code] for code in codes]
+
+        lengths = array('i')
+        lengths.frombytes(data[:rows * lengths.itemsize])
+        if byteorder != sys.byteorder:
+            lengths.byteswap()
+
+        values = []
+        offset = rows * lengths.itemsize
+        for length in lengths:
+            if length == -1:
+                values.append(None)
+            else:
+                values.append(data[offset:offset + length].decode())
+                offset += length
+
+        return values
+
+# Local HTTP/JSON API over the models, so other services can use the system concurrently.
+# Built on asyncio streams, connections are kept alive between requests.
+# The requests are handled in a thread pool, so a slow one (e.g. a large list or a report)
+# doesn't hold up the other connections; the models and storage backends are thread-safe.
+# https://docs.python.org/3/library/asyncio-stream.html
+# https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.run_in_executor
+#
+#   GET    /vehicles?offset=0&limit=50      list (also /customers, /shipments)
+#   GET    /shipments?status=In%20Transit&sort=-weight
+#                                           list the matches of column = value filters, sorted by a column
+#   POST   /vehicles                        create from a JSON object, e.g. {"id": "V001", "vehicle_type": "Car", "capacity": "10"}
+#                                           (without an "id" the next one from the model's IdSequence is used)
+#   GET    /vehicles/V001                   read
+#   PATCH  /vehicles/V001                   update the given fields
+#   DELETE /vehicles/V001                   remove
+#   GET    /customers/C001/shipments        a customer's shipments
+#   POST   /shipments/S001/deliver          mark a shipment as delivered
+#   GET    /shipments/S001/history          the shipment's events, oldest first
+#   POST   /shipments/deliveries            confirm many deliveries, e.g.
+#                                           {"confirmations": [{"id": "S001", "time": "2024-05-01T09:30"}, ...]}
+#   GET    /shipments/lanes?limit=10        busiest origin -> destination lanes by in-transit weight
+#   POST   /shipments/plan                  plan vehicles for new shipments with LoadPlanner, e.g.
+#                                           {"shipments": [{"origin": "Sydney", "destination": "Perth", "weight": 10}]}
+#   GET    /reports?days=7                  fleet utilisation, deliveries per day and average transit time
+#   GET    /metrics                         request count and latency histogram
+class ApiServer:
+    _models = {'vehicles': Vehicle, 'customers': Customer, 'shipments': Shipment}
+    _latency_buckets = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000] # upper bounds in ms
+    _max_limit = 1000
+    _max_body_size = 1048576 # bytes, a larger request body gets a 413 without being read
+
+    def __init__(self, host='127.0.0.1', port=8080, workers=8):
+        self.host = host
+        self.port = port
+        self.workers = workers # threads handling requests
+        self.server = None
+        self.executor = None
+        self.requests = 0
+        # one counter per bucket, plus one for slower requests
+        self.latency_counts = [0] * (len(self._latency_buckets) + 1)
+
+    # starts listening, call from a running event loop
+    async def start(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        self.server = await asyncio.start_server(self.__handle_connection, self.host, self.port)
+        # port 0 picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown()
+
+    # runs until interrupted (Ctrl+C)
+    def run(self):
+        async def serve():
+            await self.start()
+            print('Serving on http://' + self.host + ':' + str(self.port))
+            try:
+                async with self.server:
+                    await self.server.serve_forever()
+            finally:
+                self.executor.shutdown()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            print('Server stopped.')
+
+    def get_metrics(self):
+        histogram = {}
+        i = 0
+        while i < len(self._latency_buckets):
+            histogram['<=' + str(self._latency_buckets[i]) + 'ms'] = self.latency_counts[i]
+            i += 1
+        histogram['>' + str(self._latency_buckets[-1]) + 'ms'] = self.latency_counts[-1]
+
+        return {'requests': self.requests, 'latency': histogram}
+
+    # handles the request and returns [status code, JSON serialisable body]
+    def handle(self, method, path, query, body):
+        parts = [part for part in path.split('/') if part]
+
+        if parts == ['metrics'] and method == 'GET':
+            return [200, self.get_metrics()]
+
+        if parts == ['reports'] and method == 'GET':
+            return [200, self.__get_report(self.__get_int(query, 'days', 7))]
+
+        if not parts or parts[0] not in self._models:
+            return [404, {'error': 'Not found.'}]
+
+        model = self._models[parts[0]]
+
+        if parts == ['shipments', 'lanes'] and method == 'GET':
+            lanes = []
+            for origin, destination, count, weight in Shipment.get_top_lanes(self.__get_int(query, 'limit', 10)):
+                lanes.append({'origin': origin, 'destination': destination, 'shipments': count, 'weight': weight})
+            return [200, {'lanes': lanes}]
+
+        if parts == ['shipments', 'plan'] and method == 'POST':
+            return self.__plan(body)
+
+        if parts == ['shipments', 'deliveries'] and method == 'POST':
+            return self.__confirm_deliveries(body)
+
+        if len(parts) == 1:
+            if method == 'GET':
+                return [200, self.__list(model.query(), query)]
+            elif method == 'POST':
+                return self.__create(model, body)
+        else:
+            instance = model.find_by_id(parts[1])
+            if instance is None:
+                return [404, {'error': 'Cannot find ' + parts[0][:-1] + ' with ID: ' + parts[1]}]
+
+            if len(parts) == 2:
+                if method == 'GET':
+                    return [200, instance.to_dict()]
+                elif method == 'PATCH':
+                    return self.__update(instance, body)
+                elif method == 'DELETE':
+                    instance.remove()
+                    return [200, {'removed': instance.get_id()}]
+            elif parts[2:] == ['shipments'] and model is Customer and method == 'GET':
+                return [200, self.__list(Shipment.query().where(customer_id=instance.get_id()), query)]
+            elif parts[2:] == ['history'] and model is Shipment and method == 'GET':
+                events = []
+                for time, event, detail in instance.get_history():
+                    events.append({'time': time.isoformat(), 'event': event.value, 'detail': detail})
+                return [200, {'events': events}]
+            elif parts[2:] == ['deliver'] and model is Shipment and method == 'POST':
+                is_marked = instance.mark_delivered()
+                return [200, {'delivered': is_marked, 'shipment': instance.to_dict()}]
+            else:
+                return [404, {'error': 'Not found.'}]
+
+        return [405, {'error': 'Method not allowed.'}]
+
+    # private methods
+
+    async def __handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                start = time.perf_counter()
+                lines = head.decode('latin-1').split('\r\n')
+                request_line = lines[0].split()
+                if len(request_line) != 3:
+                    break
+                method, target, version = request_line
+
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                # without a valid length the end of the body is unknown, so the connection is closed
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self.__respond(writer, version, 400, {'error': 'Invalid Content-Length header.'}, False)
+                    self.__record_latency(time.perf_counter() - start)
+                    break
+                length = int(length)
+
+                if length > self._max_body_size:
+                    await self.__respond(writer, version, 413, {'error': 'Request body too large.'}, False)
+                    self.__record_latency(time.perf_counter() - start)
+                    break
+
+                body = b''
+                if length > 0:
+                    # the client closed the connection before sending the whole body
+                    try:
+                        body = await reader.readexactly(length)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        break
+
+                # HTTP/1.1 keeps the connection open unless the client asks to close it
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                url = urllib.parse.urlsplit(target)
+                query = urllib.parse.parse_qs(url.query)
+
+                try:
+                    loop = asyncio.get_running_loop()
+                    status, result = await loop.run_in_executor(self.executor, self.handle, method, url.path, query, body)
+                except ValueError as e:
+                    status, result = 400, {'error': str(e).strip()}
+                except Exception as e:
+                    # keep serving other requests
+                    status, result = 500, {'error': 'Internal server error: ' + str(e)}
+
+                await self.__respond(writer, version, status, result, keep_alive)
+                self.__record_latency(time.perf_counter() - start)
+
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def __respond(self, writer, version, status, result, keep_alive):
+        payload = json.dumps(result).encode()
+        response = [version + ' ' + str(status) + ' ' + http.HTTPStatus(status).phrase,
+                    'Content-Type: application/json',
+                    'Content-Length: ' + str(len(payload)),
+                    'Connection: ' + ('keep-alive' if keep_alive else 'close')]
+        writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+    def __record_latency(self, seconds):
+        self.requests += 1
+        # https://docs.python.org/3/library/bisect.html
+        self.latency_counts[bisect.bisect_left(self._latency_buckets, seconds * 1000)] += 1
+
+    def __get_report(self, days):
+        summary = Reports.get_summary(days)
+
+        vehicle_types = []
+        for vehicle_type, vehicles, capacity, weight, utilisation in summary['vehicle_types']:
+            vehicle_types.append({'vehicle_type': vehicle_type, 'vehicles': vehicles, 'capacity': capacity,
+                                  'in_transit_weight': weight, 'utilisation': utilisation})
+
+        deliveries = []
+        for day, count in summary['deliveries_per_day']:
+            deliveries.append({'date': day.isoformat(), 'deliveries': count})
+
+        transit_time = summary['average_transit_time']
+
+        return {'vehicle_types': vehicle_types,
+                'capacity': summary['capacity'],
+                'in_transit_weight': summary['in_transit_weight'],
+                'utilisation': summary['utilisation'],
+                'deliveries_per_day': deliveries,
+                'average_transit_hours': None if transit_time is None else transit_time.total_seconds() / 3600}
+
+    # every other query parameter is a column = value filter
+    def __list(self, model_query, query):
+        offset = self.__get_int(query, 'offset', 0)
+        limit = min(self.__get_int(query, 'limit', 50), self._max_limit)
+
+        for name in query:
+            if name == 'sort':
+                model_query.order_by(query[name][0])
+            elif name not in ['offset', 'limit']:
+                model_query.where(**{name: query[name][0]})
+
+        items = []
+        for instance in model_query.offset(offset).limit(limit):
+            items.append(instance.to_dict())
+
+        return {'items': items, 'offset': offset, 'limit': limit, 'total': model_query.count()}
+
+    def __create(self, model, body):
+        data = self.__parse(body)
+        if data.get('id') in [None, '']:
+            data['id'] = model.next_id()
+
+        instance = model()
+        self.__apply(instance, data, model.get_setters())
+        instance.save()
+
+        return [201, instance.to_dict()]
+
+    def __update(self, instance, body):
+        data = self.__parse(body)
+
+        setters = []
+        for column, setter in type(instance).get_setters():
+            if column != 'id' and column in data:
+                setters.append([column, setter])
+
+        self.__apply(instance, data, setters)
+        return [200, instance.to_dict()]
+
+    def __confirm_deliveries(self, body):
+        items = self.__parse(body).get('confirmations')
+        if not isinstance(items, list):
+            raise ValueError('Request body must have a "confirmations" list.')
+
+        confirmations = []
+        for item in items:
+            if not isinstance(item, dict) or 'id' not in item:
+                raise ValueError('Each confirmation must be a JSON object with an "id".')
+            confirmations.append([str(item['id']), item.get('time')])
+
+        results = []
+        for shipment_id, result in Shipment.mark_delivered_many(confirmations):
+            results.append({'id': shipment_id, 'result': result.value})
+
+        return [200, {'results': results}]
+
+    # the shipments are only planned, not saved
+    # returns each shipment object from the request with the planned "vehicle_id" added
+    def __plan(self, body):
+        items = self.__parse(body).get('shipments')
+        if not isinstance(items, list):
+            raise ValueError('Request body must have a "shipments" list.')
+
+        shipments = []
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError('Each shipment must be a JSON object.')
+
+            shipment = Shipment()
+            self.__apply(shipment, item, [['origin', 'set_origin'], ['destination', 'set_destination'], ['weight', 'set_weight']])
+            shipments.append(shipment)
+
+        assignments, unassigned = LoadPlanner().plan(shipments)
+
+        # the planner returns the shipments in planning order, map them back to the request
+        positions = {}
+        i = 0
+        while i < len(shipments):
+            positions[id(shipments[i])] = i
+            i += 1
+
+        planned = []
+        for shipment, vehicle_id in assignments:
+            item = dict(items[positions[id(shipment)]])
+            item['vehicle_id'] = vehicle_id
+            planned.append(item)
+
+        return [200, {'assignments': planned, 'unassigned': [items[positions[id(shipment)]] for shipment in unassigned]}]
+
+    # runs the setters with the values as text, the same as typed-in input
+    def __apply(self, instance, data, setters):
+        for column, setter in setters:
+            value = data.get(column)
+            if value is None:
+                raise ValueError('Missing field: ' + column)
+
+            getattr(instance, setter)(str(value))
+
+    def __parse(self, body):
+        try:
+            data = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            raise ValueError('Request body must be valid JSON.')
+
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object.')
+
+        return data
+
+    def __get_int(self, query, name, default):
+        values = query.get(name)
+        if not values:
+            return default
+
+        try:
+            return max(int(values[0]), 0)
+        except ValueError:
+            raise ValueError(name + ' must be a number.')
+
+# Benchmarks to measure the effect of performance changes.
+# The command line runs them without a storage backend, so nothing they create is saved.
+class Benchmark:
+    # compares the memory used per shipment by Shipment objects and by ShipmentColumns
+    # https://docs.python.org/3/library/tracemalloc.html
+    @staticmethod
+    def memory(count=100000):
+        origins = ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide']
+
+        def make_shipments():
+            i = 0
+            while i < count:
+                shipment = Shipment('S' + str(i).zfill(7))
+                shipment.set_origin(origins[i % len(origins)])
+                shipment.set_destination(origins[(i + 1) % len(origins)])
+                shipment._weight = float(i % 50 + 1)
+                shipment._vehicle_id = 'V' + str(i % 1000).zfill(3)
+                shipment._customer_id = 'C' + str(i % 5000).zfill(3)
+                yield shipment
+                i += 1
+
+        tracemalloc.start()
+        shipments = list(make_shipments())
+        objects_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del shipments
+
+        tracemalloc.start()
+        columns = ShipmentColumns.from_shipments(make_shipments())
+        columns_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print('Shipments:', len(columns))
+        print('Shipment objects:', round(objects_size / count, 1), 'bytes per shipment')
+        print('ShipmentColumns: ', round(columns_size / count, 1), 'bytes per shipment')
+        print('Reduction:', round(objects_size / columns_size, 1), 'x')
+
+    # measures how many customers per second pass all validations, as in a bulk import
+    @staticmethod
+    def validation(count=100000):
+        customers = []
+        i = 0
+        while i < count:
+            customers.append(Customer('C' + str(i).zfill(6), 'Customer ' + str(i), '06/09/1995',
+                                      str(i % 300 + 1) + ' Main St, Sydney, NSW 2000, Australia',
+                                      '04' + str(i).zfill(8), 'customer' + str(i) + '@example.com.au'))
+            i += 1
+
+        start = time.perf_counter()
+        for customer in customers:
+            customer.validate()
+        seconds = time.perf_counter() - start
+
+        print('Customers validated:', count)
+        print('Validations per second:', round(count / seconds))
+
+        # a long malformed address, which the old address regex took far too long to reject
+        address = '1' + ' a' * 5000 + '1, Sydney, NSW 2000, Australia'
+        start = time.perf_counter()
+        try:
+            Customer().set_address(address)
+        except ValueError:
+            pass
+        print('Rejecting a', len(address), 'character malformed address took', round((time.perf_counter() - start) * 1000, 3), 'ms')
+
+    # saves from many threads at once with a very short thread switch interval
+    # and checks the registry stays consistent: every id saved exactly once
+    # and no vehicle loaded past its capacity
+    # https://docs.python.org/3/library/sys.html#sys.setswitchinterval
+    @staticmethod
+    def concurrency(threads=8, count=2000):
+        # ids far above the ones in normal use
+        vehicle = Vehicle('V900000000', 'Truck', str(count // 4))
+        customer = Customer('C900000000', 'Benchmark Customer', '06/09/1995',
+                            '1 Main St, Sydney, NSW 2000, Australia', '0400000000', 'bench@example.com.au')
+        vehicle.save()
+        customer.save()
+
+        saved = [] # ids each thread managed to save
+        rejected = [0]
+        counter_lock = threading.Lock()
+
+        # every thread tries to save the same ids, only one save of each may succeed
+        def save_shipments():
+            i = 0
+            while i < count:
+                shipment = Shipment('S9' + str(i).zfill(8), 'Sydney', 'Melbourne', '1', 'V900000000', 'C900000000')
+                try:
+                    shipment.save()
+                    with counter_lock:
+                        saved.append(shipment.get_id())
+                except ValueError:
+                    with counter_lock:
+                        rejected[0] += 1
+                i += 1
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(0.000001)
+        start = time.perf_counter()
+        try:
+            workers = [threading.Thread(target=save_shipments) for i in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(interval)
+        seconds = time.perf_counter() - start
+
+        stored = list(Shipment.find_by_vehicle_id('V900000000'))
+        load = vehicle.get_load()
+
+        print('Threads:', threads)
+        print('Save attempts:', threads * count, 'in', round(seconds, 2), 's')
+        print('Saved:', len(saved), 'rejected:', rejected[0])
+        print('Duplicate ids saved:', len(saved) - len(set(saved)))
+        print('Vehicle load:', load, 'of capacity', vehicle.get_capacity())
+        consistent = (len(saved) == len(set(saved)) == len(stored) == int(load)
+                      and load <= int(vehicle.get_capacity()))
+        print('Consistent:', consistent)
+
+        for shipment in stored:
+            shipment.remove()
+        customer.remove()
+        vehicle.remove()
+
+    # imports the same customers file with 1, 2, 4, ... worker processes, up to one per CPU
+    # the rows have no ids, so each run adds new customers, they are removed afterwards
+    @staticmethod
+    def importing(count=200000):
+        workers = [1]
+        while workers[-1] * 2 <= os.cpu_count():
+            workers.append(workers[-1] * 2)
+        if workers[-1] != os.cpu_count():
+            workers.append(os.cpu_count())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'customers.jsonl')
+            with open(path, 'w') as file:
+                i = 0
+                while i < count:
+                    file.write(json.dumps({'name': 'Customer ' + str(i), 'dob': '06/09/1995',
+                                           'address': str(i % 200 + 1) + ' Princes Hwy, Dandenong, VIC 3175, Australia',
+                                           'phone': '04' + str(i % 100000000).zfill(8), 'email': 'customer' + str(i) + '@example.com'}) + '\n')
+                    i += 1
+
+            print('Customers:', count, 'CPUs:', os.cpu_count())
+
+            first_rate = None
+            for worker_count in workers:
+                existing = set(customer.get_id() for customer in Customer.iter_all())
+
+                summary = Importer(Customer, workers=worker_count).import_file(path)
+                if first_rate is None:
+                    first_rate = summary['rows_per_second']
+
+                print('Workers:', worker_count, '|', summary['imported'], 'imported,', summary['rows_per_second'], 'rows/sec,',
+                      round(summary['rows_per_second'] / first_rate, 2), 'x')
+
+                for customer in Customer.get_all():
+                    if customer.get_id() not in existing:
+                        customer.remove()
+
+    # plans random shipments onto a random fleet with LoadPlanner
+    @staticmethod
+    def planning(shipments=100000, vehicles=10000):
+        fleet = []
+        i = 0
+        while i < vehicles:
+            # unsaved vehicles with no load, so get_remaining_capacity() is the capacity
+            fleet.append(Vehicle('V' + str(i).zfill(6), 'Truck', str(100 + i % 10 * 100)))
+            i += 1
+
+        origins = ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide']
+        pending = []
+        i = 0
+        while i < shipments:
+            shipment = Shipment('S' + str(i).zfill(7), origins[i % 5], origins[i * 7 % 5])
+            shipment._weight = float(i * 7919 % 100 + 1)
+            pending.append(shipment)
+            i += 1
+
+        start = time.perf_counter()
+        planner = LoadPlanner(fleet)
+        assignments, unassigned = planner.plan(pending)
+        seconds = time.perf_counter() - start
+
+        loads = {}
+        for shipment, vehicle_id in assignments:
+            loads[vehicle_id] = loads.get(vehicle_id, 0) + shipment.get_weight()
+
+        overloaded = 0
+        for vehicle in fleet:
+            if loads.get(vehicle.get_id(), 0) > int(vehicle.get_capacity()):
+                overloaded += 1
+
+        print('Shipments:', shipments, 'vehicles:', vehicles)
+        print('Planned in', round(seconds, 2), 's')
+        print('Assigned:', len(assignments), 'unassigned:', len(unassigned))
+        print('Vehicles used:', len(loads), 'overloaded:', overloaded)
+
+    # shortest routes on a synthetic road grid: rows x rows locations about 1 km apart,
+    # each joined to its right and lower neighbours by a road a little longer than the straight line
+    @staticmethod
+    def routing(nodes=50000, queries=100):
+        rows = int(math.sqrt(nodes))
+
+        def make_graph(with_coordinates):
+            graph = RouteGraph()
+
+            i = 0
+            while i < rows * rows:
+                if with_coordinates:
+                    graph.add_location('L' + str(i), -34.0 + i // rows * 0.009, 150.0 + i % rows * 0.011)
+                else:
+                    graph.add_location('L' + str(i))
+                i += 1
+
+            i = 0
+            while i < rows * rows:
+                if i % rows < rows - 1:
+                    graph.add_road('L' + str(i), 'L' + str(i + 1), 1.0 + i * 7919 % 100 / 200)
+                if i // rows < rows - 1:
+                    graph.add_road('L' + str(i), 'L' + str(i + rows), 1.0 + i * 104729 % 100 / 200)
+                i += 1
+
+            return graph
+
+        start = time.perf_counter()
+        graph = make_graph(True)
+        print('Locations:', graph.count_locations(), 'built in', round(time.perf_counter() - start, 2), 's')
+
+        # spread out pairs, each origin used once so nothing is cached
+        pairs = []
+        i = 0
+        while i < queries:
+            pairs.append(['L' + str(i * 7919 % (rows * rows)), 'L' + str(i * 104729 % (rows * rows))])
+            i += 1
+
+        start = time.perf_counter()
+        for origin, destination in pairs:
+            graph.get_distance(origin, destination)
+        seconds = time.perf_counter() - start
+        print('A* (uncached):', round(seconds / queries * 1000, 2), 'ms per route')
+
+        # without coordinates the same search is plain Dijkstra
+        plain_graph = make_graph(False)
+        start = time.perf_counter()
+        for origin, destination in pairs[:20]:
+            plain_graph.get_distance(origin, destination)
+        seconds = time.perf_counter() - start
+        print('Dijkstra (uncached):', round(seconds / 20 * 1000, 2), 'ms per route')
+
+        # a few busy lanes, as when many shipments are created on the same lanes
+        start = time.perf_counter()
+        i = 0
+        while i < 100000:
+            origin, destination = pairs[i % 10]
+            graph.get_distance(origin, destination)
+            i += 1
+        seconds = time.perf_counter() - start
+        print('Hot lanes (cached):', round(100000 / seconds), 'routes per second')
+
+    # the analytics reports (weight distribution, transit time percentiles per lane, volume per customer)
+    # computed by ShipmentAnalytics, against the same reports from a loop over Shipment objects
+    @staticmethod
+    def analytics(counts=(1000000, 10000000)):
+        origins = ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide']
+        percentiles = [50, 90, 95]
+        first_day = datetime.datetime(2024, 1, 1)
+        # shared, so the objects don't all need their own datetime
+        delivery_dates = [first_day + datetime.timedelta(minutes=i * 37) for i in range(10000)]
+
+        # interpolates linearly between the closest ranks, like numpy.percentile()
+        def get_percentile(values, percentile):
+            rank = (len(values) - 1) * (percentile / 100)
+            lower = math.floor(rank)
+            upper = math.ceil(rank)
+            return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+        def loop_reports(shipments, created_times):
+            weights = [shipment.get_weight() for shipment in shipments]
+            low = min(weights)
+            width = (max(weights) - low) / 10
+            distribution = [0] * 10
+            for weight in weights:
+                distribution[min(int((weight - low) / width), 9)] += 1
+
+            lane_hours = {}
+            volumes = {}
+            row = 0
+            for shipment in shipments:
+                if shipment._delivery_date is not None and not math.isnan(created_times[row]):
+                    hours = max(shipment._delivery_date.timestamp() - created_times[row], 0) / 3600
+                    lane_hours.setdefault(shipment.get_lane(), []).append(hours)
+
+                volume = volumes.setdefault(shipment.get_customer_id(), [0, 0])
+                volume[0] += 1
+                volume[1] += shipment.get_weight()
+                row += 1
+
+            lanes = []
+            for lane, hours in lane_hours.items():
+                hours.sort()
+                lanes.append(list(lane) + [len(hours)] + [get_percentile(hours, percentile) for percentile in percentiles])
+            lanes.sort(key=lambda lane: -lane[2])
+
+            customers = sorted([[customer_id] + volume for customer_id, volume in volumes.items()], key=lambda row: -row[2])
+            return [distribution, lanes, customers[:10]]
+
+        def numpy_reports(analytics):
+            distribution = [count for low, high, count in analytics.get_weight_distribution(10)]
+            return [distribution, analytics.get_transit_percentiles_by_lane(percentiles), analytics.get_volume_by_customer(10)]
+
+        for count in counts:
+            shipments = []
+            created_times = array('d')
+            i = 0
+            while i < count:
+                shipment = Shipment('S' + str(i).zfill(8), origins[i % 5], origins[i * 7 // 5 % 5], float(i * 7919 % 1000 + 1),
+                                    'V' + str(i % 1000).zfill(3), 'C' + str(i * 104729 % 5000).zfill(4))
+
+                # about 4 in 5 delivered, 1 to 200 hours after creation
+                if i % 5:
+                    shipment._status = ShipmentStatus.DELIVERED
+                    shipment._delivery_date = delivery_dates[i % len(delivery_dates)]
+                    created_times.append(shipment._delivery_date.timestamp() - (i * 31 % 200 + 1) * 3600)
+                else:
+                    created_times.append(math.nan)
+
+                shipments.append(shipment)
+                i += 1
+
+            print('Shipments:', count)
+
+            start = time.perf_counter()
+            expected = loop_reports(shipments, created_times)
+            print('Object loop:', round(time.perf_counter() - start, 2), 's')
+
+            start = time.perf_counter()
+            analytics = ShipmentAnalytics(ShipmentColumns.from_shipments(shipments), created_times)
+            print('Snapshot:   ', round(time.perf_counter() - start, 2), 's')
+            del shipments
+
+            start = time.perf_counter()
+            result = numpy_reports(analytics)
+            print('NumPy:      ', round(time.perf_counter() - start, 2), 's')
+
+            # lanes with the same number of deliveries can come in any order
+            result[1].sort(key=lambda lane: lane[:2])
+            expected[1].sort(key=lambda lane: lane[:2])
+
+            # the sums are added up in a different order, so compare rounded
+            is_same = result[0] == expected[0] and len(result[1]) == len(expected[1])
+            for rows in [[result[1], expected[1]], [result[2], expected[2]]]:
+                for row, expected_row in zip(rows[0], rows[1]):
+                    for value, expected_value in zip(row, expected_row):
+                        if isinstance(value, float):
+                            is_same = is_same and math.isclose(value, expected_value, rel_tol=1e-9)
+                        else:
+                            is_same = is_same and value == expected_value
+            print('Same results:', is_same)
+            print()
+
 class Main:
-    def __init__(self):
+    def __init__(self, storage=None):
+        if storage is not None:
+            Model.use_storage(storage)
+
         self.vehicles_controller = VehiclesController()
         self.customers_controller = CustomersController()
         self.shipments_controller = ShipmentsController()
         self.deliveries_controller = DeliveriesController()
+        self.reports_controller = ReportsController()
 
     def menu(self):
         menu = Menu('Transportation Logistics System', [[1, 'Fleet Management'],
                                                         [2, 'Customer Management'],
                                                         [3, 'Shipment Management'],
                                                         [4, 'Delivery Management'],
+                                                        [5, 'Reports'],
                                                         [0, 'Quit']])
 
         while True:
@@ -970,9 +5702,430 @@ class Main:
                 self.shipments_controller.menu()
             elif choice == 4:
                 self.deliveries_controller.menu()
+            elif choice == 5:
+                self.reports_controller.menu()
             elif choice == 0:
                 print('Exiting the system. Goodbye!')
                 break
 
-main = Main()
-main.menu()
+# Headless command interface, so the system can be scripted without the menus.
+# https://docs.python.org/3/library/argparse.html
+# e.g.
+#   python new_solution.py vehicle add V001 Truck 1000
+#   python new_solution.py shipment create S001 Sydney Perth 120 V001 C001
+#   python new_solution.py batch commands.txt   (one command per line, '-' reads stdin)
+# Running it without a command opens the interactive menu.
+class CommandLine:
+    _models = {'vehicle': Vehicle, 'customer': Customer, 'shipment': Shipment}
+
+    def __init__(self):
+        self.parser = self.__build_parser()
+
+    # runs the command line arguments and returns the exit status
+    def run(self, argv):
+        args = self.parser.parse_args(argv)
+
+        # benchmarks save and remove their own test data, so they never touch the saved data
+        if args.memory or args.command == 'bench':
+            storage = None
+        elif args.journal:
+            storage = JournalStorage(args.journal, [Vehicle, Customer, Shipment])
+        else:
+            storage = SQLiteStorage(args.db)
+
+        if storage is not None:
+            Model.use_storage(storage)
+
+        if args.roads:
+            Shipment.use_router(RouteGraph.load(args.roads, args.locations))
+
+        try:
+            if args.command is None:
+                Main().menu()
+                return 0
+
+            return self.execute(args)
+        finally:
+            if storage is not None:
+                storage.close()
+
+    # runs one parsed command, printing the result, and returns the exit status
+    def execute(self, args):
+        try:
+            args.handler(args)
+            return 0
+        # ImportError when an optional dependency (NumPy for analytics) is missing
+        except (ValueError, ImportError) as e:
+            print('Error:', str(e).strip())
+            return 1
+
+    # commands
+
+    def vehicle_add(self, args):
+        vehicle = Vehicle()
+        vehicle.set_id(args.id)
+        vehicle.set_vehicle_type(args.type)
+        vehicle.set_capacity(args.capacity)
+        vehicle.save()
+        print('Vehicle', vehicle.get_id(), 'added successfully.')
+
+    def vehicle_update(self, args):
+        vehicle = self.__find(Vehicle, args.id, 'vehicle')
+
+        if args.type is not None:
+            vehicle.set_vehicle_type(args.type)
+        if args.capacity is not None:
+            vehicle.set_capacity(args.capacity)
+
+        print('Vehicle', args.id, 'updated successfully.')
+
+    def vehicle_list(self, args):
+        self.__print_rows([vehicle.get_id(), vehicle.get_vehicle_type(), vehicle.get_capacity()]
+                          for vehicle in Vehicle.iter_all())
+
+    def customer_add(self, args):
+        customer = Customer()
+        customer.set_id(args.id)
+        customer.set_name(args.name)
+        customer.set_dob(args.dob)
+        customer.set_address(args.address)
+        customer.set_phone(args.phone)
+        customer.set_email(args.email)
+        customer.save()
+        print('Customer', customer.get_id(), 'added successfully.')
+
+    def customer_update(self, args):
+        customer = self.__find(Customer, args.id, 'customer')
+
+        if args.name is not None:
+            customer.set_name(args.name)
+        if args.dob is not None:
+            customer.set_dob(args.dob)
+        if args.address is not None:
+            customer.set_address(args.address)
+        if args.phone is not None:
+            customer.set_phone(args.phone)
+        if args.email is not None:
+            customer.set_email(args.email)
+
+        print('Customer', args.id, 'updated successfully.')
+
+    def customer_list(self, args):
+        self.__print_rows([customer.get_id(), customer.get_name(), customer.get_dob(), customer.get_address(), customer.get_phone(), customer.get_email()]
+                          for customer in Customer.iter_all())
+
+    def customer_shipments(self, args):
+        customer = self.__find(Customer, args.id, 'customer')
+        self.__print_shipments(customer.get_shipments())
+
+    def shipment_create(self, args):
+        shipment = Shipment()
+        shipment.set_id(args.id)
+        shipment.set_origin(args.origin)
+        shipment.set_destination(args.destination)
+        shipment.set_weight(args.weight)
+        shipment.set_vehicle_id(args.vehicle_id)
+        shipment.set_customer_id(args.customer_id)
+        shipment.save()
+        print('Shipment', shipment.get_id(), 'added successfully.')
+
+    def shipment_track(self, args):
+        shipment = self.__find(Shipment, args.id, 'shipment')
+        print(shipment.get_id(), shipment.get_status(), shipment.get_delivery_date(), shipment.get_distance(), shipment.get_eta(), sep='\t')
+
+    def shipment_list(self, args):
+        query = Shipment.query()
+        if args.status is not None:
+            query.where(status=args.status)
+        if args.vehicle is not None:
+            query.where(vehicle_id=args.vehicle)
+        if args.customer is not None:
+            query.where(customer_id=args.customer)
+        if args.sort is not None:
+            query.order_by(args.sort)
+        if args.limit is not None:
+            query.limit(args.limit)
+
+        if args.explain:
+            print(query.explain())
+        else:
+            self.__print_shipments(query)
+
+    def shipment_history(self, args):
+        shipment = self.__find(Shipment, args.id, 'shipment')
+        self.__print_rows([time.isoformat(), event.value, detail or ''] for time, event, detail in shipment.get_history())
+
+    def shipment_checkpoint(self, args):
+        self.__find(Shipment, args.id, 'shipment').add_checkpoint(args.location)
+        print('Checkpoint recorded for shipment', args.id + '.')
+
+    # dates are YYYY-MM-DD or full ISO times, a plain end date includes the whole day
+    def shipment_delivered(self, args):
+        start = datetime.datetime.fromisoformat(args.start)
+        end = datetime.datetime.fromisoformat(args.end)
+        if len(args.end) == 10:
+            end = datetime.datetime.combine(end.date(), datetime.time.max)
+
+        self.__print_shipments(Shipment.find_delivered_between(start, end))
+
+    def shipment_lanes(self, args):
+        self.__print_rows(iter(Shipment.get_top_lanes(args.limit)))
+
+    def remove(self, args):
+        self.__find(args.model, args.id, args.model.__name__.lower()).remove()
+        print(args.model.__name__, args.id, 'removed successfully.')
+
+    def deliver(self, args):
+        shipment = self.__find(Shipment, args.id, 'shipment')
+
+        if shipment.mark_delivered():
+            print('Shipment', args.id, 'has been marked as delivered.')
+        else:
+            print('Shipment', args.id, 'is already delivered.')
+
+    # needs NumPy, see ShipmentAnalytics
+    def analytics(self, args):
+        analytics = ShipmentAnalytics.snapshot()
+
+        print('weight distribution')
+        self.__print_rows(iter(analytics.get_weight_distribution(args.bins)))
+        print('transit hours by lane (p50, p90, p95)')
+        self.__print_rows(iter(analytics.get_transit_percentiles_by_lane()))
+        print('volume by customer')
+        self.__print_rows(iter(analytics.get_volume_by_customer(args.limit)))
+
+    def report(self, args):
+        summary = Reports.get_summary(args.days)
+
+        self.__print_rows([vehicle_type, vehicles, capacity, weight, utilisation]
+                          for vehicle_type, vehicles, capacity, weight, utilisation in summary['vehicle_types'])
+        print('utilisation\t' + str(summary['utilisation']))
+        self.__print_rows([day.isoformat(), count] for day, count in summary['deliveries_per_day'])
+        print('average transit time\t' + str(summary['average_transit_time']))
+
+    # each line is a shipment id, optionally followed by a comma and the delivery time
+    # e.g. S001,2024-05-01T09:30, prints the result for each id
+    def deliveries(self, args):
+        if args.path == '-':
+            lines = sys.stdin
+        else:
+            lines = open(args.path)
+
+        try:
+            confirmations = ([line.partition(',')[0].strip(), line.partition(',')[2].strip()] for line in lines if line.strip())
+            results = Shipment.mark_delivered_many(confirmations)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+        self.__print_rows([shipment_id, result.value] for shipment_id, result in results)
+
+    def import_file(self, args):
+        workers = args.workers or os.cpu_count()
+        summary = Importer(self._models[args.model], args.chunk_size, args.errors, workers).import_file(args.path)
+        print('Imported', summary['imported'], 'of', summary['rows'], 'rows,', summary['rejected'], 'rejected,',
+              summary['rows_per_second'], 'rows/sec.')
+
+    def export_file(self, args):
+        count = Exporter(self._models[args.model]).export_file(args.path)
+        print('Exported', count, 'rows to', args.path)
+
+    def serve(self, args):
+        ApiServer(args.host, args.port).run()
+
+    def bench(self, args):
+        getattr(Benchmark, args.name)()
+
+    # runs one command per line from a file or stdin, blank lines and # comments are skipped
+    # all commands share one storage transaction, so each line doesn't pay for a commit
+    def batch(self, args):
+        if args.path == '-':
+            lines = sys.stdin
+        else:
+            lines = open(args.path)
+
+        if Model._storage is not None:
+            transaction = Model._storage.transaction()
+        else:
+            transaction = contextlib.nullcontext()
+
+        failures = 0
+        try:
+            with transaction:
+                for line in lines:
+                    argv = shlex.split(line, comments=True)
+                    if not argv:
+                        continue
+
+                    try:
+                        command = self.parser.parse_args(argv)
+                    except SystemExit:
+                        # argparse already printed the usage error
+                        failures += 1
+                        continue
+
+                    if command.command is None or command.handler == self.batch:
+                        print('Error: batch lines must contain a command.')
+                        failures += 1
+                    elif self.execute(command) != 0:
+                        failures += 1
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+        if failures:
+            raise ValueError(str(failures) + ' command(s) failed.')
+
+    # private methods
+
+    def __find(self, model, object_id, name):
+        instance = model.find_by_id(object_id)
+
+        if instance is None:
+            raise ValueError('Sorry, cannot find a ' + name + ' with ID: ' + object_id)
+
+        return instance
+
+    def __print_shipments(self, shipments):
+        self.__print_rows([shipment.get_id(), shipment.get_origin(), shipment.get_destination(), shipment.get_weight(),
+                           shipment.get_vehicle_id(), shipment.get_customer_id(), shipment.get_status(), shipment.get_delivery_date()]
+                          for shipment in shipments)
+
+    # prints tab separated rows, a chunk at a time
+    def __print_rows(self, rows):
+        while True:
+            chunk = list(itertools.islice(rows, 1000))
+            if not chunk:
+                break
+
+            lines = []
+            for row in chunk:
+                lines.append('\t'.join([str(value) for value in row]))
+            print('\n'.join(lines))
+
+    def __build_parser(self):
+        parser = argparse.ArgumentParser(description='Transportation Logistics System')
+        parser.add_argument('--db', default='logistics.db', help='SQLite database file (default: logistics.db)')
+        parser.add_argument('--journal', help='use a journal directory instead of the database')
+        parser.add_argument('--memory', action='store_true', help="don't save anything")
+        parser.add_argument('--roads', help='CSV file of roads (from,to,distance) for shipment distances and ETAs')
+        parser.add_argument('--locations', help='CSV file of location coordinates (name,latitude,longitude) for --roads')
+        commands = parser.add_subparsers(dest='command')
+
+        vehicle = commands.add_parser('vehicle', help='fleet management').add_subparsers(dest='action', required=True)
+        command = vehicle.add_parser('add')
+        command.add_argument('id')
+        command.add_argument('type')
+        command.add_argument('capacity')
+        command.set_defaults(handler=self.vehicle_add)
+        command = vehicle.add_parser('update')
+        command.add_argument('id')
+        command.add_argument('--type')
+        command.add_argument('--capacity')
+        command.set_defaults(handler=self.vehicle_update)
+        command = vehicle.add_parser('remove')
+        command.add_argument('id')
+        command.set_defaults(handler=self.remove, model=Vehicle)
+        vehicle.add_parser('list').set_defaults(handler=self.vehicle_list)
+
+        customer = commands.add_parser('customer', help='customer management').add_subparsers(dest='action', required=True)
+        command = customer.add_parser('add')
+        for argument in ['id', 'name', 'dob', 'address', 'phone', 'email']:
+            command.add_argument(argument)
+        command.set_defaults(handler=self.customer_add)
+        command = customer.add_parser('update')
+        command.add_argument('id')
+        for argument in ['--name', '--dob', '--address', '--phone', '--email']:
+            command.add_argument(argument)
+        command.set_defaults(handler=self.customer_update)
+        command = customer.add_parser('remove')
+        command.add_argument('id')
+        command.set_defaults(handler=self.remove, model=Customer)
+        customer.add_parser('list').set_defaults(handler=self.customer_list)
+        command = customer.add_parser('shipments')
+        command.add_argument('id')
+        command.set_defaults(handler=self.customer_shipments)
+
+        shipment = commands.add_parser('shipment', help='shipment management').add_subparsers(dest='action', required=True)
+        command = shipment.add_parser('create')
+        for argument in ['id', 'origin', 'destination', 'weight', 'vehicle_id', 'customer_id']:
+            command.add_argument(argument)
+        command.set_defaults(handler=self.shipment_create)
+        command = shipment.add_parser('track')
+        command.add_argument('id')
+        command.set_defaults(handler=self.shipment_track)
+        command = shipment.add_parser('remove')
+        command.add_argument('id')
+        command.set_defaults(handler=self.remove, model=Shipment)
+        command = shipment.add_parser('list')
+        command.add_argument('--status', choices=[status.value for status in ShipmentStatus])
+        command.add_argument('--vehicle')
+        command.add_argument('--customer')
+        command.add_argument('--sort', help='column to sort by, e.g. --sort=-weight for heaviest first')
+        command.add_argument('--limit', type=int)
+        command.add_argument('--explain', action='store_true', help='show how the query would run instead')
+        command.set_defaults(handler=self.shipment_list)
+        command = shipment.add_parser('history')
+        command.add_argument('id')
+        command.set_defaults(handler=self.shipment_history)
+        command = shipment.add_parser('checkpoint')
+        command.add_argument('id')
+        command.add_argument('location')
+        command.set_defaults(handler=self.shipment_checkpoint)
+        command = shipment.add_parser('delivered')
+        command.add_argument('start')
+        command.add_argument('end')
+        command.set_defaults(handler=self.shipment_delivered)
+        command = shipment.add_parser('lanes')
+        command.add_argument('--limit', type=int, default=10)
+        command.set_defaults(handler=self.shipment_lanes)
+
+        command = commands.add_parser('deliver', help='mark a shipment as delivered')
+        command.add_argument('id')
+        command.set_defaults(handler=self.deliver)
+
+        command = commands.add_parser('analytics', help='weight distribution, transit time percentiles per lane and volume per customer (needs NumPy)')
+        command.add_argument('--bins', type=int, default=10)
+        command.add_argument('--limit', type=int, default=10, help='number of customers')
+        command.set_defaults(handler=self.analytics)
+
+        command = commands.add_parser('report', help='fleet utilisation, deliveries per day and average transit time')
+        command.add_argument('--days', type=int, default=7)
+        command.set_defaults(handler=self.report)
+
+        command = commands.add_parser('deliveries', help="mark shipments as delivered from a file of id[,time] lines ('-' for stdin)")
+        command.add_argument('path', nargs='?', default='-')
+        command.set_defaults(handler=self.deliveries)
+
+        command = commands.add_parser('import', help='import a CSV or JSON lines file')
+        command.add_argument('model', choices=self._models, type=str.lower)
+        command.add_argument('path')
+        command.add_argument('--errors', help='file to write the rejected rows to')
+        command.add_argument('--chunk-size', type=int, default=10000)
+        command.add_argument('--workers', type=int, default=1, help='processes that parse and check the rows (0 for one per CPU)')
+        command.set_defaults(handler=self.import_file)
+
+        command = commands.add_parser('export', help='export to a .csv, .jsonl or .col file')
+        command.add_argument('model', choices=self._models, type=str.lower)
+        command.add_argument('path')
+        command.set_defaults(handler=self.export_file)
+
+        command = commands.add_parser('batch', help="run commands from a file, one per line ('-' for stdin)")
+        command.add_argument('path', nargs='?', default='-')
+        command.set_defaults(handler=self.batch)
+
+        command = commands.add_parser('serve', help='run the HTTP/JSON API')
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=8080)
+        command.set_defaults(handler=self.serve)
+
+        command = commands.add_parser('bench', help='run a benchmark (in memory, nothing is saved)')
+        command.add_argument('name', choices=['memory', 'validation', 'concurrency', 'planning', 'routing', 'analytics', 'importing'])
+        command.set_defaults(handler=self.bench)
+
+        return parser
+
+# https://docs.python.org/3/library/__main__.html
+if __name__ == '__main__':
+    sys.exit(CommandLine().run(sys.argv[1:]))
+
@@ -0,0 +1,41 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# new_solution.py is in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# returns a freshly imported copy of new_solution
+# the models keep their instances, indexes and storage backend in class variables,
+# so every test starts from an empty system (and a second copy acts like a new process)
+def load_app():
+    sys.modules.pop('new_solution', None)
+    return importlib.import_module('new_solution')
+
+@pytest.fixture
+def app():
+    return load_app()
+
+# a saved Truck V001 with capacity 100 and a saved customer C001
+@pytest.fixture
+def fleet(app):
+    vehicle = app.Vehicle('V001', 'Truck', '100')
+    vehicle.save()
+
+    customer = app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                            '0400000000', 'ann@example.com')
+    customer.save()
+
+    return [vehicle, customer]
+
+# returns a function that saves a shipment, e.g. make_shipment('S001', 20)
+@pytest.fixture
+def make_shipment(app, fleet):
+    def make_shipment(shipment_id, weight, vehicle_id='V001', origin='Sydney', destination='Melbourne', customer_id='C001'):
+        shipment = app.Shipment(shipment_id, origin, destination, str(weight), vehicle_id, customer_id)
+        shipment.save()
+        return shipment
+
+    return make_shipment
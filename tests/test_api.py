@@ -0,0 +1,180 @@
+import json
+import asyncio
+import threading
+
+import pytest
+
+# user-014: the HTTP/JSON API
+def call(app, method, path, body=None, query=None):
+    server = app.ApiServer()
+    if body is not None:
+        body = json.dumps(body).encode()
+
+    return server.handle(method, path, query or {}, body)
+
+def test_create_read_update_delete(app, fleet):
+    status, vehicle = call(app, 'POST', '/vehicles', {'id': 'V002', 'vehicle_type': 'Van', 'capacity': 50})
+    assert [status, vehicle['id']] == [201, 'V002']
+
+    assert call(app, 'GET', '/vehicles/V002')[1]['capacity'] == '50'
+    assert call(app, 'PATCH', '/vehicles/V002', {'capacity': 60})[1]['capacity'] == '60'
+    assert call(app, 'DELETE', '/vehicles/V002') == [200, {'removed': 'V002'}]
+    assert call(app, 'GET', '/vehicles/V002')[0] == 404
+
+# handle() raises ValueError for invalid input, the connection turns it into a 400 response
+def test_invalid_values_are_rejected(app, fleet):
+    with pytest.raises(ValueError, match='capacity'):
+        call(app, 'POST', '/shipments', {'id': 'S001', 'origin': 'Sydney', 'destination': 'Perth',
+                                         'weight': 500, 'vehicle_id': 'V001', 'customer_id': 'C001'})
+
+    with pytest.raises(ValueError, match='valid JSON'):
+        app.ApiServer().handle('POST', '/vehicles', {}, b'{')
+
+    assert app.Shipment.count() == 0
+
+def test_list_filters_sorts_and_pages(app, make_shipment):
+    for i, weight in enumerate([10, 30, 20]):
+        make_shipment('S00' + str(i + 1), weight)
+
+    status, body = call(app, 'GET', '/shipments', query={'sort': ['-weight'], 'limit': ['2'], 'vehicle_id': ['V001']})
+
+    assert status == 200
+    assert [item['id'] for item in body['items']] == ['S002', 'S003']
+    assert body['total'] == 3
+
+def test_deliveries_and_history(app, make_shipment):
+    make_shipment('S001', 10)
+
+    status, body = call(app, 'POST', '/shipments/deliveries', {'confirmations': [{'id': 'S001', 'time': '2024-05-01T09:30'},
+                                                                                 {'id': 'S999'}]})
+
+    assert body == {'results': [{'id': 'S001', 'result': 'Delivered'}, {'id': 'S999', 'result': 'Unknown shipment'}]}
+    assert [event['event'] for event in call(app, 'GET', '/shipments/S001/history')[1]['events']] == ['Delivered', 'Created', 'Assigned']
+
+# sends raw HTTP requests over one connection and returns the responses as [status code, JSON body]
+def exchange(app, requests):
+    async def main():
+        server = app.ApiServer(port=0)
+        await server.start()
+
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        responses = []
+        try:
+            for request in requests:
+                writer.write(request)
+                await writer.drain()
+
+                head = await reader.readuntil(b'\r\n\r\n')
+                lines = head.decode('latin-1').split('\r\n')
+                length = 0
+                for line in lines[1:]:
+                    if line.lower().startswith('content-length:'):
+                        length = int(line.split(':', 1)[1])
+
+                responses.append([int(lines[0].split()[1]), json.loads(await reader.readexactly(length))])
+        finally:
+            writer.close()
+            await server.stop()
+
+        return responses
+
+    return asyncio.run(main())
+
+def test_requests_over_a_kept_alive_connection(app, fleet):
+    body = json.dumps({'id': 'V002', 'vehicle_type': 'Car', 'capacity': '10'}).encode()
+    responses = exchange(app, [b'GET /vehicles/V001 HTTP/1.1\r\nHost: x\r\n\r\n',
+                               b'POST /vehicles HTTP/1.1\r\nContent-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body,
+                               b'GET /metrics HTTP/1.1\r\n\r\n'])
+
+    assert responses[0] == [200, {'id': 'V001', 'vehicle_type': 'Truck', 'capacity': '100'}]
+    assert responses[1][0] == 201
+    assert responses[2][1]['requests'] == 2
+
+def test_malformed_content_length_gets_a_400(app, fleet):
+    for length in [b'ten', b'-1', b'']:
+        responses = exchange(app, [b'POST /vehicles HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n{}'])
+
+        assert responses == [[400, {'error': 'Invalid Content-Length header.'}]]
+
+def test_large_bodies_get_a_413(app, fleet):
+    length = str(app.ApiServer._max_body_size + 1).encode()
+    responses = exchange(app, [b'POST /vehicles HTTP/1.1\r\nContent-Length: ' + length + b'\r\n\r\n{}'])
+
+    assert responses == [[413, {'error': 'Request body too large.'}]]
+
+# a client that goes away in the middle of the body only closes its own connection
+def test_incomplete_body_closes_the_connection(app, fleet):
+    async def send(server, request):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(request)
+        writer.write_eof()
+        response = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        return response
+
+    # errors in a connection handler are only passed to the event loop's exception handler
+    errors = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context['message']))
+        server = app.ApiServer(port=0)
+        await server.start()
+        try:
+            return [await send(server, b'POST /vehicles HTTP/1.1\r\nContent-Length: 100\r\n\r\n{"id"'),
+                    await send(server, b'GET /vehicles/V001 HTTP/1.1\r\nConnection: close\r\n\r\n')]
+        finally:
+            await server.stop()
+
+    incomplete, following = asyncio.run(main())
+
+    assert errors == []
+    assert incomplete == b''
+    assert following.startswith(b'HTTP/1.1 200 OK')
+    assert app.Vehicle.count() == 1
+
+def test_create_without_an_id_uses_the_next_one(app, fleet):
+    status, vehicle = call(app, 'POST', '/vehicles', {'vehicle_type': 'Van', 'capacity': 50})
+
+    assert [status, vehicle['id']] == [201, 'V002']
+    assert call(app, 'POST', '/vehicles', {'id': '', 'vehicle_type': 'Car', 'capacity': 5})[1]['id'] == 'V003'
+
+# a request that blocks must not hold up the other connections
+def test_slow_requests_dont_block_other_connections(app, fleet):
+    release = threading.Event()
+
+    class SlowServer(app.ApiServer):
+        def handle(self, method, path, query, body):
+            if path == '/slow':
+                release.wait(5)
+                return [200, {'slow': True}]
+
+            return super().handle(method, path, query, body)
+
+    async def get(server, path):
+        reader, writer = await asyncio.open_connection(server.host, server.port)
+        writer.write(b'GET ' + path + b' HTTP/1.1\r\nConnection: close\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        return response
+
+    async def main():
+        server = SlowServer(port=0)
+        await server.start()
+        try:
+            slow = asyncio.ensure_future(get(server, b'/slow'))
+            await asyncio.sleep(0.05)
+
+            fast = await asyncio.wait_for(get(server, b'/vehicles/V001'), 2)
+            is_slow_pending = not slow.done()
+
+            release.set()
+            await slow
+            return [fast, is_slow_pending]
+        finally:
+            release.set()
+            await server.stop()
+
+    fast, is_slow_pending = asyncio.run(main())
+
+    assert fast.startswith(b'HTTP/1.1 200 OK')
+    assert is_slow_pending
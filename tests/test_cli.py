@@ -0,0 +1,62 @@
+from conftest import load_app
+
+# user-013: headless commands, each run as its own process on the same database
+def run(capsys, tmp_path, *argv):
+    app = load_app()
+    status = app.CommandLine().run(['--db', str(tmp_path / 'logistics.db')] + list(argv))
+    return [status, capsys.readouterr().out]
+
+def add_fleet(capsys, tmp_path):
+    assert run(capsys, tmp_path, 'vehicle', 'add', 'V001', 'Truck', '100')[0] == 0
+    assert run(capsys, tmp_path, 'customer', 'add', 'C001', 'Ann Lee', '06/09/1995',
+               '1 Main St, Sydney, NSW 2000, Australia', '0400000000', 'ann@example.com')[0] == 0
+
+def test_commands(capsys, tmp_path):
+    add_fleet(capsys, tmp_path)
+
+    assert run(capsys, tmp_path, 'shipment', 'create', 'S001', 'Sydney', 'Perth', '20', 'V001', 'C001') == [0, 'Shipment S001 added successfully.\n']
+    assert run(capsys, tmp_path, 'deliver', 'S001') == [0, 'Shipment S001 has been marked as delivered.\n']
+    assert run(capsys, tmp_path, 'shipment', 'list', '--status', 'Delivered')[1].startswith('S001\tSydney\tPerth\t20.0\tV001\tC001\tDelivered')
+    assert run(capsys, tmp_path, 'vehicle', 'list') == [0, 'V001\tTruck\t100\n']
+
+def test_errors_set_the_exit_status(capsys, tmp_path):
+    add_fleet(capsys, tmp_path)
+
+    assert run(capsys, tmp_path, 'vehicle', 'add', 'V001', 'Van', '10') == [1, 'Error: Duplicate ID. Please enter a unique ID.\n']
+    assert run(capsys, tmp_path, 'shipment', 'create', 'S001', 'Sydney', 'Perth', '200', 'V001', 'C001') == \
+        [1, 'Error: Vehicle V001 does not have enough capacity for this shipment.\n']
+    assert run(capsys, tmp_path, 'deliver', 'S999') == [1, 'Error: Sorry, cannot find a shipment with ID: S999\n']
+
+def test_batch_runs_every_line(capsys, tmp_path):
+    path = tmp_path / 'commands.txt'
+    path.write_text('# fleet\n'
+                    'vehicle add V001 Truck 100\n'
+                    '\n'
+                    'vehicle add V002 Bus 10\n'
+                    'vehicle add V003 Van 10\n')
+
+    status, output = run(capsys, tmp_path, 'batch', str(path))
+
+    assert status == 1
+    assert output.splitlines()[-1] == 'Error: 1 command(s) failed.'
+    assert run(capsys, tmp_path, 'vehicle', 'list')[1] == 'V001\tTruck\t100\nV003\tVan\t10\n'
+
+# user-021: delivery confirmations from a file
+def test_deliveries_file(capsys, tmp_path):
+    add_fleet(capsys, tmp_path)
+    run(capsys, tmp_path, 'shipment', 'create', 'S001', 'Sydney', 'Perth', '20', 'V001', 'C001')
+    path = tmp_path / 'deliveries.txt'
+    path.write_text('S001,2024-05-01T09:30\nS999\nS001\n')
+
+    assert run(capsys, tmp_path, 'deliveries', str(path)) == [0, 'S001\tDelivered\nS999\tUnknown shipment\nS001\tAlready delivered\n']
+    assert run(capsys, tmp_path, 'shipment', 'delivered', '2024-05-01', '2024-05-01')[1].startswith('S001\t')
+
+# user-015: benchmarks run in memory, whatever storage is given
+def test_bench_never_uses_the_database(capsys, tmp_path):
+    app = load_app()
+    storages = []
+    app.Benchmark.concurrency = staticmethod(lambda: storages.append(app.Model._storage))
+
+    assert app.CommandLine().run(['--db', str(tmp_path / 'logistics.db'), 'bench', 'concurrency']) == 0
+    assert storages == [None]
+    assert not (tmp_path / 'logistics.db').exists()
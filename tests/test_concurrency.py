@@ -0,0 +1,156 @@
+import sys
+import random
+import threading
+
+import pytest
+
+from conftest import load_app
+
+# runs the functions in threads at the same time, with a very short thread switch interval
+# so the threads are interrupted as often as possible
+# https://docs.python.org/3/library/sys.html#sys.setswitchinterval
+def run_threads(functions):
+    errors = []
+
+    def run(function):
+        try:
+            function()
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.000001)
+    try:
+        threads = [threading.Thread(target=run, args=[function]) for function in functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+
+# user-015: the indexes and running totals match a recount after concurrent writers
+def assert_consistent(app):
+    shipments = app.Shipment.get_all()
+    in_transit = [shipment for shipment in shipments if shipment.get_status() == 'In Transit']
+
+    assert app.Shipment.count() == len(shipments) == len(set(shipment.get_id() for shipment in shipments))
+    assert app.Shipment.count_by_status(app.ShipmentStatus.IN_TRANSIT) == len(in_transit)
+    assert app.Shipment.count_by_status(app.ShipmentStatus.DELIVERED) == len(shipments) - len(in_transit)
+
+    type_totals = {}
+    for vehicle in app.Vehicle.get_all():
+        on_vehicle = [shipment for shipment in in_transit if shipment.get_vehicle_id() == vehicle.get_id()]
+        load = sum(float(shipment.get_weight()) for shipment in on_vehicle)
+
+        assert set(vehicle.get_shipments()) == set(on_vehicle)
+        assert vehicle.get_load() == pytest.approx(load)
+        assert load <= int(vehicle.get_capacity())
+
+        totals = type_totals.setdefault(vehicle.get_vehicle_type(), [0, 0, 0])
+        totals[0] += 1
+        totals[1] += int(vehicle.get_capacity())
+        totals[2] += load
+
+    for vehicle_type, totals in app.Vehicle.get_type_totals().items():
+        assert totals == pytest.approx(type_totals.get(vehicle_type, [0, 0, 0]))
+
+    lanes = {}
+    for shipment in in_transit:
+        total = lanes.setdefault(shipment.get_lane(), [0, 0])
+        total[0] += 1
+        total[1] += float(shipment.get_weight())
+
+    assert app.Shipment.get_lane_totals() == pytest.approx(lanes)
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite'])
+def test_concurrent_writers(tmp_path, storage):
+    app = load_app()
+    if storage == 'sqlite':
+        app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+
+    for vehicle_id, vehicle_type in [['V001', 'Truck'], ['V002', 'Van'], ['V003', 'Truck']]:
+        app.Vehicle(vehicle_id, vehicle_type, '150').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+
+    saved = []
+    saved_lock = threading.Lock()
+
+    # every thread saves new shipments with ids from next_id() and also tries to save the same
+    # shared ids, then changes, reassigns and delivers shipments saved by any thread
+    def writer(seed):
+        generator = random.Random(seed)
+        i = 0
+        while i < 150:
+            shipment_id = app.Shipment.next_id() if i % 3 else 'S9' + str(i).zfill(5)
+            shipment = app.Shipment(shipment_id, generator.choice(['Sydney', 'Perth']), 'Darwin',
+                                    str(generator.randint(1, 5)), 'V00' + str(generator.randint(1, 3)), 'C001')
+            try:
+                shipment.save()
+                with saved_lock:
+                    saved.append(shipment_id)
+            except ValueError:
+                pass
+
+            with saved_lock:
+                other = app.Shipment.find_by_id(generator.choice(saved)) if saved else None
+
+            if other is not None:
+                try:
+                    action = generator.randint(0, 2)
+                    if action == 0:
+                        other.set_weight(str(generator.randint(1, 5)))
+                    elif action == 1:
+                        other.set_vehicle_id('V00' + str(generator.randint(1, 3)))
+                    else:
+                        app.Shipment.mark_delivered_many([[other.get_id(), None]])
+                except ValueError:
+                    # a full vehicle
+                    pass
+
+            i += 1
+
+    try:
+        run_threads([lambda seed=seed: writer(seed) for seed in range(6)])
+
+        # no save was lost and no id was saved twice
+        assert len(saved) == len(set(saved)) == app.Shipment.count()
+        assert_consistent(app)
+    finally:
+        if app.Model._storage is not None:
+            app.Model._storage.close()
+
+# vehicles change type and come and go while shipments are moved between them
+def test_vehicle_changes_with_concurrent_shipments(app, make_shipment):
+    app.Vehicle('V002', 'Van', '1000').save()
+    for i in range(20):
+        make_shipment('S' + str(i + 1).zfill(3), 1, vehicle_id='V00' + str(i % 2 + 1))
+
+    def move_shipments():
+        for i in range(3000):
+            shipment = app.Shipment.find_by_id('S' + str(i % 20 + 1).zfill(3))
+            shipment.set_vehicle_id('V002' if shipment.get_vehicle_id() == 'V001' else 'V001')
+
+    def change_vehicles():
+        for i in range(3000):
+            app.Vehicle.find_by_id('V002').set_vehicle_type('Car' if i % 2 else 'Van')
+            app.Vehicle('V003', 'Truck', '10').save()
+            app.Vehicle.find_by_id('V003').remove()
+
+    run_threads([move_shipments, change_vehicles])
+
+    assert_consistent(app)
+
+def test_concurrent_next_id_never_repeats(app):
+    ids = []
+
+    def allocate():
+        for i in range(500):
+            ids.append(app.Vehicle.next_id())
+
+    run_threads([allocate] * 8)
+
+    assert len(ids) == len(set(ids)) == 4000
@@ -0,0 +1,182 @@
+import random
+import datetime
+
+import pytest
+
+from conftest import load_app
+
+# user-020: the event log and its time-window queries
+def test_history_of_a_shipment(app, make_shipment):
+    shipment = make_shipment('S001', 10)
+    shipment.add_checkpoint('  canberra ')
+    shipment.mark_delivered()
+
+    events = [[event, detail] for time, event, detail in shipment.get_history()]
+
+    assert events == [[app.ShipmentEvent.CREATED, 'Sydney -> Melbourne'],
+                      [app.ShipmentEvent.ASSIGNED, 'V001'],
+                      [app.ShipmentEvent.CHECKPOINT, 'Canberra'],
+                      [app.ShipmentEvent.DELIVERED, None]]
+
+    with pytest.raises(ValueError, match='already delivered'):
+        shipment.add_checkpoint('Melbourne')
+
+def test_time_window_queries(app):
+    log = app.EventLog()
+    start = datetime.datetime(2024, 5, 1)
+
+    i = 0
+    while i < 10:
+        log.append('S00' + str(i), app.ShipmentEvent.DELIVERED, None, start + datetime.timedelta(hours=i))
+        i += 1
+    log.append('S001', app.ShipmentEvent.CHECKPOINT, 'Canberra', start + datetime.timedelta(hours=3))
+
+    window = [start + datetime.timedelta(hours=2), start + datetime.timedelta(hours=4)]
+
+    assert log.count(app.ShipmentEvent.DELIVERED, *window) == 3
+    assert log.count(None, *window) == 4
+    assert [shipment_id for time, shipment_id, event, detail in log.find(app.ShipmentEvent.DELIVERED, *window)] == ['S002', 'S003', 'S004']
+    assert log.count(app.ShipmentEvent.DELIVERED) == 10
+
+def test_late_events_are_placed_in_time_order(app):
+    log = app.EventLog()
+    start = datetime.datetime(2024, 5, 1)
+
+    for hours in [5, 1, 9, 3, 7, 0]:
+        log.append('S' + str(hours).zfill(3), app.ShipmentEvent.DELIVERED, None, start + datetime.timedelta(hours=hours))
+
+    times = [time for time, shipment_id, event, detail in log.find()]
+
+    assert times == sorted(times)
+    assert log.count(None, start + datetime.timedelta(hours=2), start + datetime.timedelta(hours=6)) == 2
+
+# late events are merged in batches, in time order and then in the order they were added
+def test_batches_of_late_events_match_a_sort(app):
+    log = app.EventLog()
+    start = datetime.datetime(2024, 5, 1)
+    generator = random.Random(1)
+    added = []
+
+    i = 0
+    while i < 2000:
+        time = start + datetime.timedelta(minutes=generator.choice([i, generator.randint(0, i), 30]))
+        event = generator.choice([app.ShipmentEvent.CHECKPOINT, app.ShipmentEvent.DELIVERED])
+        log.append('S' + str(i).zfill(4), event, None, time)
+        added.append([time, 'S' + str(i).zfill(4), event, None])
+
+        # queries in between merge what has arrived so far
+        if i % 500 == 0:
+            assert log.count(None, start, time) == len([item for item in added if item[0] <= time])
+        i += 1
+
+    expected = sorted(added, key=lambda item: item[0])
+    assert log.find() == expected
+    assert log.find(app.ShipmentEvent.DELIVERED) == [item for item in expected if item[2] is app.ShipmentEvent.DELIVERED]
+
+    window = [start + datetime.timedelta(minutes=20), start + datetime.timedelta(minutes=40)]
+    assert log.find(None, *window) == [item for item in expected if window[0] <= item[0] <= window[1]]
+
+def test_average_transit_time(app, make_shipment):
+    created = datetime.datetime.now()
+    make_shipment('S001', 10)
+    make_shipment('S002', 10)
+
+    results = app.Shipment.mark_delivered_many([['S001', created + datetime.timedelta(hours=2)],
+                                                ['S002', created + datetime.timedelta(hours=4)]])
+
+    assert [result for shipment_id, result in results] == [app.DeliveryResult.DELIVERED] * 2
+    assert abs(app.Shipment.get_average_transit_time().total_seconds() - 3 * 3600) < 60
+
+@pytest.mark.parametrize('kind', ['sqlite', 'journal'])
+def test_events_survive_a_restart(tmp_path, kind):
+    def open_storage(app):
+        if kind == 'journal':
+            return app.JournalStorage(str(tmp_path), [app.Vehicle, app.Customer, app.Shipment])
+        return app.SQLiteStorage(str(tmp_path / 'logistics.db'))
+
+    delivered = datetime.datetime(2024, 5, 1, 9, 30)
+
+    app = load_app()
+    app.Model.use_storage(open_storage(app))
+    app.Vehicle('V001', 'Truck', '100').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+    app.Shipment('S001', 'Sydney', 'Perth', '20', 'V001', 'C001').save()
+    app.Shipment.mark_delivered_many([['S001', delivered]])
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(open_storage(app))
+    try:
+        shipment = app.Shipment.find_by_id('S001')
+        day = [datetime.datetime(2024, 5, 1), datetime.datetime(2024, 5, 1, 23, 59)]
+
+        # the delivery was backdated, so it comes before the creation
+        assert [event for time, event, detail in shipment.get_history()] == [app.ShipmentEvent.DELIVERED,
+                                                                             app.ShipmentEvent.CREATED,
+                                                                             app.ShipmentEvent.ASSIGNED]
+        assert app.Shipment.count_delivered_between(*day) == 1
+        assert app.Shipment.find_delivered_between(*day) == [shipment]
+    finally:
+        app.Model._storage.close()
+
+# with SQLiteStorage the log is never read into memory, the database answers the same queries
+def test_lazy_storage_answers_the_queries(tmp_path):
+    def run(app):
+        app.Vehicle('V001', 'Truck', '100').save()
+        app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                     '0400000000', 'ann@example.com').save()
+
+        start = datetime.datetime(2024, 5, 1)
+        i = 1
+        while i <= 6:
+            shipment = app.Shipment('S00' + str(i), 'Sydney', 'Perth', '10', 'V001', 'C001')
+            shipment.save()
+            shipment.add_checkpoint('Adelaide')
+            i += 1
+        app.Shipment.mark_delivered_many([['S003', start + datetime.timedelta(hours=5)],
+                                          ['S001', start + datetime.timedelta(hours=2)],
+                                          ['S002', None]])
+
+        events = app.Shipment._events
+        day = [start, start + datetime.timedelta(days=1)]
+        # compared by value, the two runs use different copies of the module
+        return [[event.value for time, event, detail in app.Shipment.find_by_id('S001').get_history()],
+                [[shipment_id, event.value, detail] for time, shipment_id, event, detail in events.find()],
+                [shipment.get_id() for shipment in app.Shipment.find_delivered_between(*day)],
+                events.count(None, *day), events.count(app.ShipmentEvent.CHECKPOINT), len(events),
+                sorted(events.get_first_times(app.ShipmentEvent.CREATED)),
+                round(app.Shipment.get_average_transit_time().total_seconds())]
+
+    expected = run(load_app())
+
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    try:
+        assert run(app) == expected
+        assert len(app.Shipment._events._times) == 0
+        assert expected[2] == ['S001', 'S003']
+    finally:
+        app.Model._storage.close()
+
+# user-021: bulk delivery confirmations
+def test_mark_delivered_many_results(app, make_shipment):
+    make_shipment('S001', 40)
+    make_shipment('S002', 30)
+    make_shipment('S003', 20)
+
+    results = app.Shipment.mark_delivered_many([['S001', None],
+                                                ['S001', None],
+                                                ['S999', None],
+                                                ['S002', 'yesterday'],
+                                                ['S003', '2024-05-01T09:30']], chunk_size=2)
+
+    assert results == [['S001', app.DeliveryResult.DELIVERED],
+                       ['S001', app.DeliveryResult.ALREADY_DELIVERED],
+                       ['S999', app.DeliveryResult.UNKNOWN],
+                       ['S002', app.DeliveryResult.INVALID_TIME],
+                       ['S003', app.DeliveryResult.DELIVERED]]
+
+    assert app.Shipment.get_vehicle_load('V001') == 30
+    assert app.Shipment.count_by_status(app.ShipmentStatus.DELIVERED) == 2
+    assert app.Shipment.find_by_id('S003').get_history()[0][:2] == [datetime.datetime(2024, 5, 1, 9, 30), app.ShipmentEvent.DELIVERED]
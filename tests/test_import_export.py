@@ -0,0 +1,163 @@
+import csv
+import json
+
+import pytest
+
+from conftest import load_app
+
+CUSTOMER = {'name': 'Ann Lee', 'dob': '06/09/1995', 'address': '1 Main St, Sydney, NSW 2000, Australia',
+            'phone': '0400000000', 'email': 'ann@example.com'}
+
+# C001 and C002 are valid, then a bad date of birth, a duplicate id, a bad id and a row without an id
+def customer_rows():
+    return [dict(CUSTOMER, id='C001'),
+            dict(CUSTOMER, id='C002'),
+            dict(CUSTOMER, id='C003', dob='35/01/1990'),
+            dict(CUSTOMER, id='C001'),
+            dict(CUSTOMER, id='X1'),
+            dict(CUSTOMER, id='')]
+
+def write_rows(path, rows):
+    with open(path, 'w', newline='') as file:
+        if str(path).endswith('.csv'):
+            writer = csv.DictWriter(file, ['id'] + list(CUSTOMER))
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                file.write(json.dumps(row) + '\n')
+
+def read_errors(path):
+    with open(path) as file:
+        return [[error['line'], error['error']] for error in map(json.loads, file)]
+
+# user-011: streaming import through the setters
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl'])
+def test_import_rejects_invalid_rows(app, tmp_path, extension):
+    path = tmp_path / ('customers' + extension)
+    write_rows(path, customer_rows())
+    first_line = 2 if extension == '.csv' else 1
+
+    summary = app.Importer(app.Customer, chunk_size=2, error_path=str(tmp_path / 'errors.jsonl')).import_file(str(path))
+
+    assert [summary['rows'], summary['imported'], summary['rejected']] == [6, 3, 3]
+    assert [customer.get_id() for customer in app.Customer.get_all()] == ['C001', 'C002', 'C003']
+    assert read_errors(tmp_path / 'errors.jsonl') == [[first_line + 2, 'Invalid date of birth. Please enter DD/MM/YYYY'],
+                                                      [first_line + 3, 'Duplicate ID. Please enter a unique ID.'],
+                                                      [first_line + 4, 'Invalid ID. Please follow the pattern: Cxxx']]
+
+def test_import_checks_references_and_capacity(app, fleet, tmp_path):
+    path = tmp_path / 'shipments.jsonl'
+    with open(path, 'w') as file:
+        for i in range(12):
+            customer_id = 'C999' if i % 4 == 3 else 'C001'
+            file.write(json.dumps({'origin': 'Sydney', 'destination': 'Perth', 'weight': 10,
+                                   'vehicle_id': 'V001', 'customer_id': customer_id}) + '\n')
+
+    summary = app.Importer(app.Shipment, chunk_size=5).import_file(str(path))
+
+    assert [summary['imported'], summary['rejected']] == [9, 3]
+    assert app.Shipment.get_vehicle_load('V001') == 90
+
+# user-005: on SQLite the vehicle loads are read once per chunk, not for every row
+def test_import_reads_vehicle_loads_once_per_chunk(tmp_path, monkeypatch):
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    try:
+        app.Vehicle('V001', 'Truck', '100').save()
+        app.Vehicle('V002', 'Truck', '100').save()
+        app.Customer('C001', **CUSTOMER).save()
+
+        path = tmp_path / 'shipments.jsonl'
+        with open(path, 'w') as file:
+            for i in range(30):
+                file.write(json.dumps({'origin': 'Sydney', 'destination': 'Perth', 'weight': 10,
+                                       'vehicle_id': 'V00' + str(i % 2 + 1), 'customer_id': 'C001'}) + '\n')
+
+        queries = []
+        for name in ['sum_by', 'aggregate_by']:
+            method = getattr(app.Model._storage, name)
+            monkeypatch.setattr(app.Model._storage, name, lambda *args, method=method: queries.append(args) or method(*args))
+
+        summary = app.Importer(app.Shipment, chunk_size=8).import_file(str(path))
+
+        assert [summary['imported'], summary['rejected']] == [20, 10]
+        assert app.Shipment.get_vehicle_load('V001') == app.Shipment.get_vehicle_load('V002') == 100
+        assert len(queries) < 20
+    finally:
+        app.Model._storage.close()
+
+# user-025: the parallel import gives the same results as the serial one
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl'])
+def test_parallel_import_matches_serial(tmp_path, extension):
+    path = tmp_path / ('customers' + extension)
+    rows = []
+    for i in range(300):
+        rows.extend(customer_rows())
+        rows[-6]['id'] = 'C' + str(i * 2 + 1).zfill(4)
+        rows[-5]['id'] = 'C' + str(i * 2 + 2).zfill(4)
+    write_rows(path, rows)
+
+    results = []
+    for workers in [1, 3]:
+        app = load_app()
+        errors = tmp_path / ('errors' + str(workers) + '.jsonl')
+        # small shards, so rows end up on both sides of many shard boundaries
+        summary = app.Importer(app.Customer, chunk_size=100, error_path=str(errors), workers=workers,
+                               shard_size=997).import_file(str(path))
+        # a row with several problems can be reported with a different one of them (and so
+        # at a different point of the import), so only the rejected lines are compared
+        lines = sorted(line for line, error in read_errors(errors))
+        results.append([summary['rows'], summary['imported'], summary['rejected'], lines,
+                        [customer.get_id() for customer in app.Customer.get_all()]])
+
+    assert results[0] == results[1]
+    assert results[0][0] == 1800
+
+# user-012: exports can be read back
+@pytest.mark.parametrize('extension', ['.csv', '.jsonl', '.col'])
+def test_export_round_trip(app, make_shipment, tmp_path, extension):
+    make_shipment('S001', 10)
+    make_shipment('S002', 12.5, origin='Perth').mark_delivered()
+    path = str(tmp_path / ('shipments' + extension))
+
+    assert app.Exporter(app.Shipment, group_size=1).export_file(path) == 2
+
+    records = [shipment.to_record() for shipment in app.Shipment.get_all()]
+    if extension == '.col':
+        assert list(app.Exporter.read_columnar(path)) == records
+    elif extension == '.jsonl':
+        with open(path) as file:
+            assert [json.loads(line)['id'] for line in file] == ['S001', 'S002']
+    else:
+        with open(path, newline='') as file:
+            assert [row['weight'] for row in csv.DictReader(file)] == ['10.0', '12.5']
+
+# the encoding of each column is chosen again for every group, and its dictionary stays small
+def test_columnar_dictionaries_are_per_group_and_bounded(app, make_shipment, tmp_path):
+    origins = ['Perth'] * 4 + ['Adelaide', 'Brisbane', 'Cairns', 'Darwin'] + ['Hobart', 'Hobart', 'Mackay', 'Mackay']
+    for i, origin in enumerate(origins):
+        make_shipment('S' + str(i + 1).zfill(3), 1, origin=origin)
+    path = str(tmp_path / 'shipments.col')
+
+    app.Exporter(app.Shipment, group_size=4, dictionary_size=2).export_file(path)
+
+    with open(path, 'rb') as file:
+        file.readline()
+        file.readline()
+        origin_columns = []
+        while True:
+            size = file.read(4)
+            if not size:
+                break
+            group = json.loads(file.read(int.from_bytes(size, 'little')))
+            file.read(sum(column['size'] for column in group['columns']))
+            origin_columns.append(group['columns'][1])
+
+    assert [column['encoding'] for column in origin_columns] == ['dictionary', 'plain', 'dictionary']
+    assert [origin_columns[2]['new_entries'], origin_columns[2]['reset']] == [['Hobart', 'Mackay'], True]
+    assert [record[1] for record in app.Exporter.read_columnar(path)] == origins
+
+def test_export_rejects_unknown_formats(app, tmp_path):
+    with pytest.raises(ValueError, match='Unsupported export format'):
+        app.Exporter(app.Vehicle).export_file(str(tmp_path / 'vehicles.xml'))
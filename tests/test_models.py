@@ -0,0 +1,146 @@
+import pytest
+
+# user-001: lookups and uniqueness checks go through the id index
+def test_find_by_id_uses_the_index(app, fleet):
+    vehicle = fleet[0]
+
+    assert app.Vehicle.find_by_id('V001') is vehicle
+    assert app.Vehicle.find_by_id('V999') is None
+    assert app.Vehicle._index == {'V001': vehicle}
+
+def test_duplicate_id_is_rejected(app, fleet):
+    with pytest.raises(ValueError, match='Duplicate ID'):
+        app.Vehicle('V001', 'Van', '10').save()
+
+    assert app.Vehicle.count() == 1
+
+def test_set_id_rekeys_a_saved_instance(app, fleet):
+    vehicle = fleet[0]
+    vehicle.set_id('V002')
+
+    assert app.Vehicle.find_by_id('V001') is None
+    assert app.Vehicle.find_by_id('V002') is vehicle
+
+def test_remove_drops_the_instance_from_the_index(app, fleet):
+    fleet[0].remove()
+
+    assert app.Vehicle.find_by_id('V001') is None
+    assert app.Vehicle.get_all() == []
+
+# user-002: shipments by customer
+def test_customer_shipments_follow_the_customer_id(app, make_shipment):
+    first = make_shipment('S001', 10)
+    second = make_shipment('S002', 10)
+    other = app.Customer('C002', 'Bob Lee', '06/09/1995', '2 Main St, Sydney, NSW 2000, Australia',
+                         '0400000001', 'bob@example.com')
+    other.save()
+
+    second.set_customer_id('C002')
+
+    assert app.Shipment.find_by_customer_id('C001') == [first]
+    assert app.Shipment.find_by_customer_id('C002') == [second]
+    assert other.get_shipments() == [second]
+
+# user-003: in-transit shipments by vehicle and running loads
+def test_vehicle_load_follows_its_shipments(app, make_shipment):
+    vehicle = app.Vehicle.find_by_id('V001')
+    first = make_shipment('S001', 20)
+    second = make_shipment('S002', 30)
+
+    assert vehicle.get_load() == 50
+    assert vehicle.get_remaining_capacity() == 50
+    assert vehicle.get_shipments() == [first, second]
+
+    second.set_weight('40')
+    assert vehicle.get_load() == 60
+
+    first.mark_delivered()
+    assert vehicle.get_load() == 40
+    assert vehicle.get_shipments() == [second]
+
+    second.remove()
+    assert vehicle.get_load() == 0
+
+def test_shipment_over_capacity_is_rejected(app, make_shipment):
+    make_shipment('S001', 80)
+
+    with pytest.raises(ValueError, match='capacity'):
+        make_shipment('S002', 30)
+
+    with pytest.raises(ValueError, match='capacity'):
+        app.Shipment.find_by_id('S001').set_weight('101')
+
+    assert app.Shipment.get_vehicle_load('V001') == 80
+
+def test_reassigning_moves_the_load(app, make_shipment):
+    app.Vehicle('V002', 'Van', '50').save()
+    shipment = make_shipment('S001', 20)
+
+    shipment.set_vehicle_id('V002')
+
+    assert app.Shipment.get_vehicle_load('V001') == 0
+    assert app.Shipment.get_vehicle_load('V002') == 20
+    assert app.Shipment.find_by_vehicle_id('V002') == [shipment]
+
+def test_delivered_shipment_can_be_corrected_on_a_full_vehicle(app, make_shipment):
+    app.Vehicle('V002', 'Van', '50').save()
+    delivered = make_shipment('S001', 30)
+    delivered.mark_delivered()
+    make_shipment('S002', 100)
+    make_shipment('S003', 50, vehicle_id='V002')
+
+    delivered.set_weight('35')
+    delivered.set_vehicle_id('V002')
+
+    assert [delivered.get_weight(), delivered.get_vehicle_id()] == [35, 'V002']
+    assert [app.Shipment.get_vehicle_load('V001'), app.Shipment.get_vehicle_load('V002')] == [100, 50]
+
+# user-004: status index with O(1) counts
+def test_status_counts(app, make_shipment):
+    make_shipment('S001', 10)
+    delivered = make_shipment('S002', 10)
+
+    assert delivered.mark_delivered() is True
+    assert delivered.mark_delivered() is False
+
+    assert app.Shipment.count_by_status(app.ShipmentStatus.IN_TRANSIT) == 1
+    assert app.Shipment.count_by_status(app.ShipmentStatus.DELIVERED) == 1
+    assert app.Shipment.find_by_status(app.ShipmentStatus.DELIVERED) == [delivered]
+
+# user-005: all-or-nothing batch saves
+def test_save_many_saves_nothing_if_a_row_is_invalid(app, fleet):
+    shipments = [app.Shipment('S001', 'Sydney', 'Perth', '10', 'V001', 'C001'),
+                 app.Shipment('S001', 'Sydney', 'Perth', '10', 'V001', 'C001'),
+                 app.Shipment('S002', 'Sydney', 'Perth', '10', 'V999', 'C001')]
+
+    with pytest.raises(app.BulkSaveError) as error:
+        app.Shipment.save_many(shipments)
+
+    assert [row for row, object_id, message in error.value.errors] == [2, 3]
+    assert app.Shipment.count() == 0
+
+def test_save_many_counts_the_batch_against_the_capacity(app, fleet):
+    shipments = [app.Shipment('S00' + str(i), 'Sydney', 'Perth', '40', 'V001', 'C001') for i in range(1, 4)]
+
+    with pytest.raises(app.BulkSaveError) as error:
+        app.Shipment.save_many(shipments)
+
+    assert error.value.errors[0][0] == 3
+
+    app.Shipment.save_many(shipments[:2])
+    assert app.Shipment.get_vehicle_load('V001') == 80
+
+# user-006: slots and the columnar store
+def test_models_have_no_instance_dict(app, fleet):
+    assert not hasattr(fleet[0], '__dict__')
+    assert not hasattr(app.Shipment(), '__dict__')
+
+def test_shipment_columns_round_trip(app, make_shipment):
+    make_shipment('S001', 10)
+    make_shipment('S002', 12.5, origin='Perth').mark_delivered()
+
+    columns = app.ShipmentColumns.from_shipments(app.Shipment.get_all())
+    rows = list(columns)
+
+    assert len(columns) == 2
+    assert [row.to_record() for row in rows] == [shipment.to_record() for shipment in app.Shipment.get_all()]
@@ -0,0 +1,154 @@
+import math
+
+import pytest
+
+from conftest import load_app
+
+# user-017: capacity-aware load planning
+def test_plan_fits_every_vehicle(app, make_shipment):
+    app.Vehicle('V002', 'Van', '50').save()
+    make_shipment('S001', 60)
+
+    shipments = [app.Shipment(None, 'Sydney', 'Perth', str(weight)) for weight in [30, 45, 20, 10, 80]]
+    assignments, unassigned = app.LoadPlanner().plan(shipments)
+
+    loads = {'V001': 60.0, 'V002': 0.0}
+    for shipment, vehicle_id in assignments:
+        loads[vehicle_id] += float(shipment.get_weight())
+
+    assert loads['V001'] <= 100 and loads['V002'] <= 50
+    # heaviest first: 45 goes in V002 and 30 in V001, which leaves no room for 20
+    assert [shipment.get_weight() for shipment in unassigned] == ['80', '20']
+    assert len(assignments) == 3
+
+def test_suggest_vehicle_prefers_the_best_fit_and_the_lane(app, make_shipment):
+    app.Vehicle('V002', 'Van', '30').save()
+    app.Vehicle('V003', 'Truck', '500').save()
+
+    assert app.LoadPlanner().suggest_vehicle('25') == 'V002'
+    assert app.LoadPlanner().suggest_vehicle('600') is None
+
+    make_shipment('S001', 10, vehicle_id='V003', origin='Perth', destination='Darwin')
+    assert app.LoadPlanner().suggest_vehicle('25', ('Perth', 'Darwin')) == 'V003'
+
+def test_candidates_are_in_suggestion_order(app, make_shipment):
+    app.Vehicle('V002', 'Van', '30').save()
+    app.Vehicle('V003', 'Truck', '500').save()
+    app.Vehicle('V004', 'Car', '20').save()
+    make_shipment('S001', 10, vehicle_id='V003', origin='Perth', destination='Darwin')
+
+    assert app.LoadPlanner().get_candidates('25') == ['V002', 'V001', 'V003']
+    assert app.LoadPlanner().get_candidates('25', ('Perth', 'Darwin'), 2) == ['V003', 'V002']
+    assert app.LoadPlanner().get_candidates('600') == []
+
+def test_capacity_cannot_go_below_the_load(app, make_shipment):
+    make_shipment('S001', 60)
+    vehicle = app.Vehicle.find_by_id('V001')
+
+    with pytest.raises(ValueError, match='V001 is carrying 60.0'):
+        vehicle.set_capacity('50')
+
+    assert vehicle.get_capacity() == '100'
+    assert app.Vehicle.get_type_totals()['Truck'] == [1, 100, 60.0]
+
+    vehicle.set_capacity('60')
+    assert app.Vehicle.get_type_totals()['Truck'] == [1, 60, 60.0]
+
+# creating a shipment lists the planner's candidates, not the whole fleet
+def test_create_shipment_shows_only_candidates(app, fleet, monkeypatch, capsys):
+    i = 2
+    while i <= 40:
+        app.Vehicle('V' + str(i).zfill(3), 'Van', str(i)).save()
+        i += 1
+
+    answers = iter(['S001', 'Sydney', 'Perth', '25', '', 'C001'])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    app.ShipmentsController().create_shipment()
+
+    output = capsys.readouterr().out
+    assert output.count('| V0') == 10
+    assert '| V025 ' in output and '| V024 ' not in output
+    assert app.Shipment.find_by_id('S001').get_vehicle_id() == 'V025'
+
+def test_create_shipment_returns_to_the_menu_if_no_vehicle_fits(app, fleet, monkeypatch, capsys):
+    answers = iter(['S001', 'Sydney', 'Perth', '500'])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    app.ShipmentsController().create_shipment()
+
+    assert capsys.readouterr().out.endswith('No vehicle has enough capacity for this shipment.\n')
+    assert app.Shipment.count() == 0
+
+# user-018: lanes and their running totals
+def test_lane_totals(app, make_shipment):
+    first = make_shipment('S001', 10, origin=' sydney', destination='PERTH ')
+    make_shipment('S002', 20, origin='Sydney', destination='Perth')
+    make_shipment('S003', 5, origin='Perth', destination='Darwin')
+
+    assert first.get_lane() == ('Sydney', 'Perth')
+    assert app.Shipment.get_lane_totals() == {('Sydney', 'Perth'): [2, 30.0], ('Perth', 'Darwin'): [1, 5.0]}
+
+    first.set_weight('15')
+    first.mark_delivered()
+
+    assert app.Shipment.get_lane_totals() == {('Sydney', 'Perth'): [1, 20.0], ('Perth', 'Darwin'): [1, 5.0]}
+    assert app.Shipment.get_top_lanes(1) == [['Sydney', 'Perth', 1, 20.0]]
+    assert len(app.Shipment.find_by_lane(('Sydney', 'Perth'))) == 1
+
+# with SQLite the lane's vehicles come from one indexed query, no shipment is loaded
+def test_lane_vehicles_with_sqlite(tmp_path):
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    app.Vehicle('V001', 'Truck', '1000').save()
+    app.Vehicle('V002', 'Truck', '1000').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+    app.Shipment.save_many([app.Shipment('S' + str(i).zfill(3), ' sydney' if i % 2 else 'Perth', 'darwin ', '2',
+                                         'V00' + str(i % 2 + 1), 'C001') for i in range(1, 101)])
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    try:
+        assert app.Shipment.get_lane_vehicle_loads(('Sydney', 'Darwin')) == {'V002': [50, 100.0]}
+        assert app.LoadPlanner().get_candidates('5', ('Sydney', 'Darwin')) == ['V002', 'V001']
+        assert app.Shipment._index == {}
+        assert len(app.Shipment.find_by_lane(('Perth', 'Darwin'))) == 50
+    finally:
+        app.Model._storage.close()
+
+# user-019: shortest paths and ETAs
+@pytest.fixture
+def graph(app):
+    graph = app.RouteGraph(average_speed=50, hot_after=2)
+    graph.add_location('Sydney', -33.87, 151.21)
+    graph.add_location('Canberra', -35.28, 149.13)
+    graph.add_location('Melbourne', -37.81, 144.96)
+    graph.add_road('Sydney', 'Canberra', 286)
+    graph.add_road('Canberra', 'Melbourne', 660)
+    graph.add_road('Sydney', 'Melbourne', 1000)
+    graph.add_location('Hobart')
+    return graph
+
+def test_shortest_route(graph):
+    assert graph.get_route('sydney', 'Melbourne') == [946, ['Sydney', 'Canberra', 'Melbourne']]
+    assert graph.get_route('Sydney', 'Hobart') is None
+
+    # the same answers from the cache and once Sydney is a hot origin
+    for i in range(3):
+        assert graph.get_distance('Sydney', 'Melbourne') == 946
+        assert graph.get_distance('Melbourne', 'Sydney') == 946
+        assert graph.get_distance('Sydney', 'Hobart') is None
+
+def test_new_roads_clear_the_cache(graph):
+    assert graph.get_distance('Sydney', 'Melbourne') == 946
+
+    graph.add_road('Sydney', 'Melbourne', 870)
+    assert graph.get_distance('Sydney', 'Melbourne') == 870
+
+def test_saved_shipments_get_a_distance_and_eta(app, fleet, graph):
+    app.Shipment.use_router(graph)
+    shipment = app.Shipment('S001', 'Sydney', 'Melbourne', '10', 'V001', 'C001')
+    shipment.save()
+
+    assert shipment.get_distance() == 946
+    assert math.isclose((shipment._eta - shipment.get_history()[0][0]).total_seconds(), 946 / 50 * 3600, abs_tol=60)
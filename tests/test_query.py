@@ -0,0 +1,82 @@
+import pytest
+
+from conftest import load_app
+
+def save_shipments(app):
+    app.Vehicle('V001', 'Truck', '1000').save()
+    app.Vehicle('V002', 'Van', '1000').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+
+    weights = [30, 10, 50, 20, 40, 60]
+    i = 0
+    while i < len(weights):
+        shipment = app.Shipment('S00' + str(i + 1), 'Sydney', 'Perth', str(weights[i]), 'V00' + str(i % 2 + 1), 'C001')
+        shipment.save()
+        i += 1
+
+    app.Shipment.find_by_id('S006').mark_delivered()
+
+def ids(shipments):
+    return [shipment.get_id() for shipment in shipments]
+
+# user-022: filtering, sorting and paging, the same in memory and with SQLite
+@pytest.fixture(params=['memory', 'sqlite'])
+def shipments_app(request, tmp_path):
+    app = load_app()
+    if request.param == 'sqlite':
+        app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+        save_shipments(app)
+        app.Model._storage.close()
+
+        # a new process, so the queries go to the database
+        app = load_app()
+        app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    else:
+        save_shipments(app)
+
+    yield app
+
+    if app.Model._storage is not None:
+        app.Model._storage.close()
+
+def test_where_and_order_by(shipments_app):
+    app = shipments_app
+    query = app.Shipment.query().where(status=app.ShipmentStatus.IN_TRANSIT, vehicle_id='V001').order_by('-weight')
+
+    assert ids(query) == ['S003', 'S005', 'S001']
+    assert query.count() == 3
+
+def test_numeric_columns_compare_as_numbers(shipments_app):
+    app = shipments_app
+
+    assert ids(app.Shipment.query().where(weight=20)) == ['S004']
+    assert ids(app.Shipment.query().where(weight='20.0')) == ['S004']
+
+def test_offset_and_limit(shipments_app):
+    app = shipments_app
+
+    assert ids(app.Shipment.query().order_by('weight').offset(1).limit(2)) == ['S004', 'S001']
+    assert ids(app.Shipment.query().offset(4).limit(10)) == ['S005', 'S006']
+    assert app.Shipment.query().order_by('weight').limit(2).count() == 6
+
+def test_filter_and_first(shipments_app):
+    app = shipments_app
+    query = app.Shipment.query().filter(lambda shipment: float(shipment.get_weight()) > 35).order_by('weight')
+
+    assert ids(query) == ['S005', 'S003', 'S006']
+    assert query.first().get_id() == 'S005'
+    assert app.Shipment.query().where(id='S999').first() is None
+
+def test_unknown_column_is_rejected(app):
+    with pytest.raises(ValueError, match='Unknown column'):
+        app.Shipment.query().where(colour='red')
+
+    with pytest.raises(ValueError, match='Unknown column'):
+        app.Shipment.query().order_by('-colour')
+
+def test_explain_uses_the_smallest_index(app):
+    save_shipments(app)
+    query = app.Shipment.query().where(status=app.ShipmentStatus.IN_TRANSIT, vehicle_id='V002').order_by('-weight').limit(1)
+
+    assert query.explain() == 'index on vehicle_id (2 of 6 shipments) -> filter status, vehicle_id -> top 1 by -weight (heap)'
@@ -0,0 +1,153 @@
+import datetime
+
+import pytest
+
+from conftest import load_app
+
+# user-023: the running totals match a recount of the vehicles and shipments
+def recount(app):
+    totals = {}
+    for vehicle in app.Vehicle.get_all():
+        total = totals.setdefault(vehicle.get_vehicle_type(), [0, 0, 0])
+        total[0] += 1
+        total[1] += int(vehicle.get_capacity())
+        total[2] += vehicle.get_load()
+
+    return totals
+
+# types no vehicle has any more are kept as zeros, see Reports.get_summary()
+def type_totals(app):
+    return {vehicle_type: totals for vehicle_type, totals in app.Vehicle.get_type_totals().items() if totals[0]}
+
+def test_type_totals_follow_every_change(app, make_shipment):
+    app.Vehicle('V002', 'Van', '50').save()
+    first = make_shipment('S001', 20)
+    second = make_shipment('S002', 30)
+    assert type_totals(app) == recount(app)
+
+    second.set_vehicle_id('V002')
+    first.set_weight('25')
+    app.Vehicle.find_by_id('V001').set_capacity('120')
+    app.Vehicle.find_by_id('V002').set_vehicle_type('Truck')
+    assert type_totals(app) == recount(app)
+
+    app.Vehicle('V003', 'Car', '10').save()
+    app.Vehicle.find_by_id('V003').remove()
+    assert type_totals(app) == recount(app)
+
+# on SQLite the totals are kept in tables as rows are written, instead of grouping every time
+def test_running_totals_with_sqlite(tmp_path):
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    app.Vehicle('V001', 'Truck', '100').save()
+    app.Vehicle('V002', 'Van', '50').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+    app.Shipment('S001', 'Sydney', 'Perth', '20', 'V001', 'C001').save()
+    app.Shipment('S002', ' sydney', 'PERTH ', '30', 'V002', 'C001').save()
+
+    # the first call adds up the rows written so far
+    assert app.Vehicle.get_type_totals() == {'Truck': [1, 100, 20.0], 'Van': [1, 50, 30.0]}
+    assert app.Shipment.get_lane_totals() == {('Sydney', 'Perth'): [2, 50.0]}
+    assert app.Shipment.get_average_transit_time() is None
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    try:
+        app.Shipment.find_by_id('S002').set_vehicle_id('V001')
+        app.Vehicle.find_by_id('V002').set_vehicle_type('Truck')
+        app.Shipment.find_by_id('S001').set_weight('25')
+        app.Shipment.mark_delivered_many([['S001', datetime.datetime.now() + datetime.timedelta(hours=2)]])
+        app.Vehicle('V003', 'Car', '10').save()
+        app.Vehicle.find_by_id('V003').remove()
+
+        statements = []
+        app.Model._storage._connection.set_trace_callback(statements.append)
+        totals = [app.Vehicle.get_type_totals(), app.Shipment.get_lane_totals(), app.Shipment.get_average_transit_time()]
+        app.Model._storage._connection.set_trace_callback(None)
+
+        assert totals[0] == recount(app) == {'Truck': [2, 150, 30.0]}
+        assert totals[1] == {('Sydney', 'Perth'): [1, 30.0]}
+        assert round(totals[2].total_seconds() / 3600) == 2
+        assert not [sql for sql in statements if 'GROUP BY' in sql or 'BEGIN' in sql]
+    finally:
+        app.Model._storage.close()
+
+# the vehicle's last in-transit shipment takes its weight off the vehicle type as well
+@pytest.mark.parametrize('finish', ['deliver', 'deliver_many', 'remove'])
+def test_last_shipment_of_a_vehicle_leaves_no_weight(app, make_shipment, finish):
+    shipment = make_shipment('S001', 20)
+    assert app.Reports.get_summary()['vehicle_types'] == [['Truck', 1, 100, 20.0, 0.2]]
+
+    if finish == 'deliver':
+        shipment.mark_delivered()
+    elif finish == 'deliver_many':
+        app.Shipment.mark_delivered_many([['S001', None]])
+    else:
+        shipment.remove()
+
+    summary = app.Reports.get_summary()
+    assert summary['vehicle_types'] == [['Truck', 1, 100, 0, 0]]
+    assert [summary['in_transit_weight'], summary['utilisation']] == [0, 0]
+    assert app.ApiServer().handle('GET', '/reports', {}, None)[1]['in_transit_weight'] == 0
+
+def test_summary(app, make_shipment):
+    app.Vehicle('V002', 'Van', '100').save()
+    make_shipment('S001', 20)
+    make_shipment('S002', 30, vehicle_id='V002')
+    make_shipment('S003', 10)
+    app.Shipment.mark_delivered_many([['S003', datetime.datetime(2024, 5, 1, 9, 30)]])
+
+    summary = app.Reports.get_summary(days=2, today=datetime.date(2024, 5, 2))
+
+    assert summary['vehicle_types'] == [['Truck', 1, 100, 20.0, 0.2], ['Van', 1, 100, 30.0, 0.3]]
+    assert [summary['capacity'], summary['in_transit_weight'], summary['utilisation']] == [200, 50.0, 0.25]
+    assert summary['deliveries_per_day'] == [[datetime.date(2024, 5, 2), 0], [datetime.date(2024, 5, 1), 1]]
+
+def test_summary_with_sqlite(tmp_path):
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    app.Vehicle('V001', 'Truck', '100').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+    app.Shipment('S001', 'Sydney', 'Perth', '20', 'V001', 'C001').save()
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(app.SQLiteStorage(str(tmp_path / 'logistics.db')))
+    try:
+        assert app.Reports.get_summary()['vehicle_types'] == [['Truck', 1, 100, 20.0, 0.2]]
+    finally:
+        app.Model._storage.close()
+
+# user-024: the vectorised statistics match plain Python
+def test_analytics(app, make_shipment):
+    pytest.importorskip('numpy')
+    app.Customer('C002', 'Bob Lee', '06/09/1995', '2 Main St, Sydney, NSW 2000, Australia',
+                 '0400000001', 'bob@example.com').save()
+    app.Vehicle('V002', 'Truck', '1000').save()
+
+    weights = [5, 10, 15, 20, 25, 30, 35, 40]
+    i = 0
+    while i < len(weights):
+        make_shipment('S00' + str(i + 1), weights[i], vehicle_id='V002', customer_id='C00' + str(i % 2 + 1),
+                      origin='Sydney' if i < 4 else 'Perth')
+        i += 1
+
+    created = datetime.datetime.now()
+    app.Shipment.mark_delivered_many([['S001', created + datetime.timedelta(hours=1)],
+                                      ['S002', created + datetime.timedelta(hours=3)],
+                                      ['S005', created + datetime.timedelta(hours=2)]])
+
+    analytics = app.ShipmentAnalytics.snapshot()
+
+    assert len(analytics) == 8
+    assert analytics.get_volume_by_customer() == [['C002', 4, 100.0], ['C001', 4, 80.0]]
+    assert analytics.get_weight_percentiles([50]) == [22.5]
+    assert analytics.get_weight_percentiles([50], app.ShipmentStatus.DELIVERED) == [10.0]
+    assert [row[2] for row in analytics.get_weight_distribution(bins=2)] == [4, 4]
+
+    lanes = analytics.get_transit_percentiles_by_lane([50])
+    assert [row[:3] for row in lanes] == [['Sydney', 'Melbourne', 2], ['Perth', 'Melbourne', 1]]
+    assert lanes[0][3] == pytest.approx(2, abs=0.02)
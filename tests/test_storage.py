@@ -0,0 +1,106 @@
+import pytest
+
+from conftest import load_app
+
+def save_fleet(app):
+    app.Vehicle('V001', 'Truck', '100').save()
+    app.Customer('C001', 'Ann Lee', '06/09/1995', '1 Main St, Sydney, NSW 2000, Australia',
+                 '0400000000', 'ann@example.com').save()
+    app.Shipment('S001', 'Sydney', 'Perth', '20', 'V001', 'C001').save()
+    app.Shipment('S002', 'Sydney', 'Perth', '30', 'V001', 'C001').save()
+
+# returns a JournalStorage or SQLiteStorage in the directory
+def open_storage(app, kind, directory):
+    if kind == 'journal':
+        return app.JournalStorage(str(directory / 'journal'), [app.Vehicle, app.Customer, app.Shipment])
+
+    return app.SQLiteStorage(str(directory / 'logistics.db'))
+
+# user-007, user-008: changes are written through and read back by the next process
+@pytest.mark.parametrize('kind', ['sqlite', 'journal'])
+def test_changes_survive_a_restart(tmp_path, kind):
+    app = load_app()
+    app.Model.use_storage(open_storage(app, kind, tmp_path))
+    save_fleet(app)
+    app.Shipment.find_by_id('S001').mark_delivered()
+    app.Shipment.find_by_id('S002').set_weight('25')
+    app.Vehicle.find_by_id('V001').set_id('V007')
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(open_storage(app, kind, tmp_path))
+    try:
+        assert app.Vehicle.find_by_id('V001') is None
+        assert app.Vehicle.find_by_id('V007').get_capacity() == '100'
+        assert app.Shipment.find_by_id('S001').get_status() == 'Delivered'
+        assert app.Shipment.find_by_id('S002').get_weight() == 25
+        assert app.Shipment.count_by_status(app.ShipmentStatus.IN_TRANSIT) == 1
+    finally:
+        app.Model._storage.close()
+
+def test_journal_snapshot_and_replay(tmp_path):
+    app = load_app()
+    storage = app.JournalStorage(str(tmp_path), [app.Vehicle, app.Customer, app.Shipment])
+    app.Model.use_storage(storage)
+    save_fleet(app)
+    storage.snapshot()
+    app.Shipment.find_by_id('S002').remove()
+    storage.close()
+
+    app = load_app()
+    app.Model.use_storage(app.JournalStorage(str(tmp_path), [app.Vehicle, app.Customer, app.Shipment]))
+    try:
+        assert [shipment.get_id() for shipment in app.Shipment.get_all()] == ['S001']
+        assert app.Shipment.get_vehicle_load('V001') == 20
+    finally:
+        app.Model._storage.close()
+
+def test_sqlite_loads_instances_on_demand(tmp_path):
+    app = load_app()
+    app.Model.use_storage(open_storage(app, 'sqlite', tmp_path))
+    save_fleet(app)
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(open_storage(app, 'sqlite', tmp_path))
+    try:
+        assert app.Shipment.count() == 2
+        assert app.Shipment._index == {}
+
+        shipment = app.Shipment.find_by_id('S001')
+        assert app.Shipment.find_by_id('S001') is shipment
+        assert app.Shipment.get_vehicle_load('V001') == 50
+    finally:
+        app.Model._storage.close()
+
+# user-016: ids are never handed out twice
+def test_next_id_increases(app, fleet):
+    assert app.Vehicle.next_id() == 'V002'
+    assert app.Vehicle.next_id() == 'V003'
+    assert app.Vehicle.reserve_ids(2) == ['V004', 'V005']
+
+def test_next_id_skips_ids_entered_by_hand(app, fleet):
+    app.Vehicle('V010', 'Van', '10').save()
+
+    assert app.Vehicle.next_id() == 'V011'
+
+@pytest.mark.parametrize('kind', ['sqlite', 'journal'])
+def test_removed_newest_id_is_not_reused_after_a_restart(tmp_path, kind):
+    app = load_app()
+    app.Model.use_storage(open_storage(app, kind, tmp_path))
+    app.Vehicle('V001', 'Truck', '100').save()
+    app.Vehicle('V002', 'Truck', '100').save()
+    app.Model._storage.close()
+
+    # a new process removes the newest vehicle before asking for any id
+    app = load_app()
+    app.Model.use_storage(open_storage(app, kind, tmp_path))
+    app.Vehicle.find_by_id('V002').remove()
+    app.Model._storage.close()
+
+    app = load_app()
+    app.Model.use_storage(open_storage(app, kind, tmp_path))
+    try:
+        assert app.Vehicle.next_id() == 'V003'
+    finally:
+        app.Model._storage.close()
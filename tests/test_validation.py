@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+# user-010: the precompiled validations accept and reject the same values as before
+@pytest.mark.parametrize('setter, value', [
+    ['set_dob', '31/12/1999'],
+    ['set_phone', '0412 345 678'],
+    ['set_email', 'first.last@example.com.au'],
+    ['set_address', '12/3 George St, Sydney, NSW 2000, Australia'],
+    ['set_address', '7 Beach Rd, Bondi NSW 2026, Australia'],
+])
+def test_valid_customer_fields(app, setter, value):
+    getattr(app.Customer(), setter)(value)
+
+@pytest.mark.parametrize('setter, value', [
+    ['set_dob', '31/13/1999'],
+    ['set_dob', '1999-12-31'],
+    ['set_phone', '0212 345 678'],
+    ['set_email', 'ann@'],
+    ['set_address', '12 George St, Sydney, NSW 2000'],
+    ['set_address', '12 George St, Sydney, XYZ 2000, Australia'],
+    ['set_name', ''],
+])
+def test_invalid_customer_fields(app, setter, value):
+    with pytest.raises(ValueError):
+        getattr(app.Customer(), setter)(value)
+
+def test_malformed_address_is_rejected_quickly(app):
+    address = '1' + ' a' * 5000 + '1, Sydney, NSW 2000, Australia'
+
+    start = time.perf_counter()
+    with pytest.raises(ValueError):
+        app.Customer().set_address(address)
+
+    assert time.perf_counter() - start < 0.5
+
+@pytest.mark.parametrize('setter, value', [
+    ['set_id', 'V01'],
+    ['set_id', 'C001'],
+    ['set_vehicle_type', 'Bus'],
+    ['set_capacity', '0'],
+    ['set_capacity', '-5'],
+    ['set_capacity', 'ten'],
+])
+def test_invalid_vehicle_fields(app, setter, value):
+    with pytest.raises(ValueError):
+        getattr(app.Vehicle(), setter)(value)
+
+# user-009: paged tables only read the rows of the pages shown
+def test_paged_table_reads_rows_on_demand(app, capsys):
+    read = []
+
+    def rows():
+        for i in range(45):
+            read.append(i)
+            yield ['V' + str(i).zfill(3), 'Truck']
+
+    table = app.PagedTable(['Vehicle ID', 'Type'], rows(), page_size=20)
+
+    assert table.display_page(0) is True
+    assert len(read) == 20
+    assert table.display_page(2) is True
+    assert table.display_page(3) is False
+    assert len(read) == 45
+
+    output = capsys.readouterr().out
+    assert '| V040       | Truck |' in output